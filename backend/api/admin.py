@@ -0,0 +1,46 @@
+import logging
+import secrets
+from typing import Optional
+from fastapi import APIRouter, BackgroundTasks, Header, HTTPException
+
+from ..core import config
+from ..core.graph import graph_manager
+from ..core.executor import search_executor
+from ..db.session import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/admin")
+
+def _check_token(token: Optional[str]):
+    if not config.ADMIN_TOKEN or not secrets.compare_digest(token or "", config.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token missing or invalid.")
+
+def _reload_graph():
+    """Reloads the graph and, if searches run on worker processes, restarts them on the new snapshot."""
+    db = SessionLocal()
+    try:
+        if not graph_manager.reload(db):
+            return
+    except Exception:
+        logger.exception("Graph reload failed, still serving the previous graph.")
+        return
+    finally:
+        db.close()
+
+    if config.ROUTING_PROCESSES > 0:
+        search_executor.use_processes(config.ROUTING_PROCESSES, graph_manager.snapshot_path,
+                                      graph_manager.get_import_id())
+
+@router.post("/reload-graph", status_code=202)
+def reload_graph(background_tasks: BackgroundTasks, x_admin_token: Optional[str] = Header(None)):
+    """
+    Rebuilds the in-memory graph after a data import and swaps it in without a
+    restart. Returns immediately; requests are served from the current graph
+    until the new one is ready. Only reloads the API process that receives it.
+    """
+    _check_token(x_admin_token)
+    if graph_manager.is_reloading():
+        raise HTTPException(status_code=409, detail="A graph reload is already running.")
+    background_tasks.add_task(_reload_graph)
+    return {"status": "reloading"}
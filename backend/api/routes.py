@@ -1,187 +1,371 @@
-import requests
+import logging
+import numpy as np
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-import json
 
 from ..db.session import get_db
 from ..schemas.route import RouteRequest, RouteResponse
+from ..schemas.matrix import MatrixRequest, MatrixResponse
+from ..schemas.isochrone import IsochroneRequest, IsochroneResponse, Isochrone
+from ..schemas.match import MatchRequest, MatchResponse
 from ..schemas.search import SearchResultItem, SearchResponse
+from ..core import config
+from ..core.cache import LRUCache
+from ..core.geometry import encode_polyline, simplify_lonlat, zoom_tolerance
+from ..core.metrics import Gauge, RequestMetrics
 from ..core.graph import graph_manager
-from ..core.pathfinder import find_nearest_link_and_snapped_point, find_shortest_path, get_full_path_geometry_and_length
+from ..core.geocoder import geocoder, GeocoderUnavailable
+from ..core.executor import search_executor, SearchQueueFull
+from ..core.links import to_5186, to_wgs84
+from ..core.matching import match_traces, get_matched_routes, transition_cache
+from ..core.pathfinder import (
+    find_nearest_link_and_snapped_point, snap_points, snapped_node_costs, route_search, alternatives_search,
+    matrix_search, isochrone_search, link_candidates, get_same_link_route, get_full_path_geometry_and_length,
+    get_isochrone_geometries, path_cache,
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Full /route results before geometry formatting, keyed by snapped links and positions along them,
+# emptied on graph reload.
+route_cache = LRUCache(config.ROUTE_CACHE_SIZE, config.ROUTE_CACHE_TTL)
+graph_manager.add_reload_listener(route_cache.clear)
+
+# Path cache figures cover searches run in this process, not in routing worker processes.
+_caches = {"route": route_cache, "path": path_cache, "match": transition_cache}
+Gauge("pathfinder_cache_entries", "Entries held by each cache.",
+      lambda: {name: len(cache) for name, cache in _caches.items()}, "cache")
+Gauge("pathfinder_cache_hits_total", "Cache lookups that found an entry.",
+      lambda: {name: cache.hits for name, cache in _caches.items()}, "cache", kind="counter")
+Gauge("pathfinder_cache_misses_total", "Cache lookups that found nothing.",
+      lambda: {name: cache.misses for name, cache in _caches.items()}, "cache", kind="counter")
+
+def _route_cache_key(start_info: dict, end_info: dict, profile: str, alternatives: int) -> tuple:
+    """Request options, snapped links and positions along them rounded to ROUTE_CACHE_QUANTUM_M meters."""
+    quantum = config.ROUTE_CACHE_QUANTUM_M
+    return (
+        profile, alternatives, start_info['link_id'], round(start_info['fraction'] * start_info['link_length'] / quantum),
+        end_info['link_id'], round(end_info['fraction'] * end_info['link_length'] / quantum),
+    )
+
+def _check_profile(profile: str) -> str:
+    profiles = graph_manager.get_profiles()
+    if profile not in profiles:
+        raise HTTPException(status_code=400, detail=f"Unknown profile '{profile}', expected one of: {', '.join(profiles)}.")
+    return profile
 
 @router.post("/route", response_model=RouteResponse)
-def get_route(request: RouteRequest, db: Session = Depends(get_db)):
+async def get_route(request: RouteRequest, db: Session = Depends(get_db)):
     """
     Calculates the shortest route between two points using Snap-to-Road logic.
+    Database work runs in the request threadpool and the graph search in the
+    dedicated search executor, so the event loop is never blocked.
+    Stage timings and search counters are exported on /metrics.
     """
-    graph = graph_manager.get_graph()
-    if graph is None:
-        raise HTTPException(status_code=503, detail="Graph not loaded yet.")
+    with RequestMetrics("route") as metrics:
+        route = await _find_route(request, db, metrics)
+        with metrics.stage("encode"):
+            return _route_response(route, request)
 
-    # 1. Find nearest links and snapped points for start and end
-    print(f"Debug (routes): Request start_point: lat={request.start_point.lat}, lon={request.start_point.lon}")
-    print(f"Debug (routes): Request end_point: lat={request.end_point.lat}, lon={request.end_point.lon}")
-    start_info = find_nearest_link_and_snapped_point(db, request.start_point)
-    end_info = find_nearest_link_and_snapped_point(db, request.end_point)
+def _format_geometry(geometry: dict, request: RouteRequest) -> dict:
+    """The path_geometry or path_polyline field for a route geometry, simplified as requested."""
+    tolerance = request.simplify_tolerance_m
+    if request.zoom is not None:
+        tolerance = zoom_tolerance(request.zoom, geometry["coordinates"][0][1])
+    if not tolerance and request.geometry_format == "geojson":
+        return {"path_geometry": geometry}
 
-    print(f"Debug (routes): Start Info: {start_info}")
-    print(f"Debug (routes): End Info: {end_info}")
+    coords = simplify_lonlat(np.asarray(geometry["coordinates"], dtype=np.float64), tolerance)
+    if request.geometry_format == "geojson":
+        return {"path_geometry": {"type": "LineString", "coordinates": coords.tolist()}}
+    return {"path_polyline": encode_polyline(coords, 6 if request.geometry_format == "polyline6" else 5)}
+
+def _route_response(route: dict, request: RouteRequest) -> JSONResponse:
+    """
+    Serializes a route in the requested geometry format. The JSON is built
+    directly rather than through RouteResponse: validating every coordinate
+    of a long route costs more than the search itself.
+    """
+    body = {key: value for key, value in route.items() if key not in ("path_geometry", "alternatives")}
+    body.update(_format_geometry(route["path_geometry"], request))
+    body["alternatives"] = [
+        {**{key: value for key, value in alternative.items() if key != "path_geometry"},
+         **_format_geometry(alternative["path_geometry"], request)}
+        for alternative in route["alternatives"]
+    ]
+    return JSONResponse(body)
+
+async def _find_route(request: RouteRequest, db: Session, metrics: RequestMetrics) -> dict:
+    # Routes computed on a graph that gets reloaded before they are done are not cached.
+    generation = route_cache.generation
+    if not graph_manager.is_loaded():
+        raise HTTPException(status_code=503, detail="Graph not loaded yet.")
+    # Snapping and geometry use the same graph throughout the request, even if a reload swaps it.
+    state = graph_manager.get_state()
+    profile = _check_profile(request.profile)
+
+    # 1. Find nearest links and snapped points for start and end, in a single round trip
+    logger.debug("Route from %s to %s", request.start_point, request.end_point)
+    with metrics.stage("snap"):
+        start_info, end_info = await run_in_threadpool(
+            snap_points, db, [request.start_point, request.end_point], state.link_index
+        )
+    logger.debug("Snapped start: %s, end: %s", start_info, end_info)
 
     if not start_info or not end_info:
         raise HTTPException(status_code=404, detail="Could not snap points to the road network.")
 
+    cache_key = _route_cache_key(start_info, end_info, profile, request.alternatives)
+    cached = route_cache.get(cache_key)
+    if cached is not None:
+        metrics.values["route_cached"] = True
+        return cached
+
     # --- Handle special cases ---
     # Case 1: Start and end points are on the same link
+    links = state.links
     if start_info['link_id'] == end_info['link_id']:
-        sql = text("""
-            SELECT ST_AsGeoJSON(ST_Transform(ST_LineSubstring(geom, :start_frac, :end_frac), 4326)),
-                   "LENGTH" * abs(:start_frac - :end_frac)
-            FROM links WHERE "LINK_ID" = :link_id;
-        """)
-        start_frac, end_frac = sorted([start_info['fraction'], end_info['fraction']])
-        geom, length = db.execute(sql, {
-            'start_frac': start_frac, 
-            'end_frac': end_frac, 
-            'link_id': start_info['link_id']
-        }).first()
-
-        geom_dict = json.loads(geom)
-        # If ST_LineSubstring returns a POINT (e.g., start_frac == end_frac), convert to LineString format
-        if geom_dict["type"] == "Point":
-            geom_dict["type"] = "LineString"
-            geom_dict["coordinates"] = [geom_dict["coordinates"]]
-
-        return RouteResponse(total_distance_meters=length, path_geometry=geom_dict)
+        with metrics.stage("geometry"):
+            geom_dict, length = await run_in_threadpool(get_same_link_route, db, start_info, end_info, links)
+        metrics.record_route(length, 0)
+        cost = length * state.csr.cost_per_meter(start_info['f_node'], start_info['t_node'], profile)
+        route = {"total_distance_meters": length, "path_geometry": geom_dict, "profile": profile,
+                 "total_cost": cost, "alternatives": []}
+        route_cache.put(cache_key, route, generation)
+        return route
 
     # --- Standard pathfinding logic ---
-    # Consider both nodes of the start and end links to find the truly shortest path.
-    start_nodes = [start_info['f_node'], start_info['t_node']]
-    end_nodes = [end_info['f_node'], end_info['t_node']]
-    
-    best_path = {
-        "nodes": None,
-        "length": float('inf'),
-        "total_distance": float('inf'),
-        "start_node": None,
-        "end_node": None
-    }
+    # Seed both nodes of the start link with the cost of reaching them from the snapped
+    # start point and give both nodes of the end link the cost of finishing the trip,
+    # so that a single search finds the truly shortest of all 4 combinations.
+    start_costs = snapped_node_costs(start_info)
+    end_costs = snapped_node_costs(end_info)
+
+    # Runs on the contraction hierarchy when one was built for the loaded graph and the
+    # profile is distance; other profiles search the CSR arrays with their own weights.
+    # Alternatives come from a forward and a backward search tree shared by all of them.
+    # The search stage includes waiting for a free search worker; the compute time alone
+    # comes back in the search stats.
+    try:
+        with metrics.stage("search"):
+            if request.alternatives:
+                routes, search_stats = await search_executor.run(
+                    alternatives_search, start_costs, end_costs, request.alternatives, profile, start_info, end_info
+                )
+            else:
+                main_path_nodes, total_distance, total_cost, search_stats = await search_executor.run(
+                    route_search, start_costs, end_costs, profile, start_info, end_info
+                )
+                routes = [(main_path_nodes, total_distance, total_cost)] if main_path_nodes is not None else []
+    except SearchQueueFull:
+        raise HTTPException(status_code=503, detail="Too many route searches in progress, try again shortly.")
+    metrics.record_search(search_stats)
 
-    # Iterate through all 4 possible combinations of start/end nodes
-    for s_node in start_nodes:
-        for e_node in end_nodes:
-            main_path_nodes, main_path_length = find_shortest_path(graph, s_node, e_node)
-            
-            if main_path_nodes is None:
-                continue
-
-            # Calculate costs for the partial segments based on which node is chosen
-            cost_start = start_info['link_length'] * start_info['fraction'] if s_node == start_info['f_node'] else start_info['link_length'] * (1 - start_info['fraction'])
-            cost_end = end_info['link_length'] * (1 - end_info['fraction']) if e_node == end_info['t_node'] else end_info['link_length'] * end_info['fraction']
-            
-            total_distance = cost_start + main_path_length + cost_end
-
-            print(f"Debug: Trying path S:{s_node} -> E:{e_node}, MainLength:{main_path_length:.2f}, TotalDist:{total_distance:.2f}")
-
-            if total_distance < best_path["total_distance"]:
-                best_path = {
-                    "nodes": main_path_nodes,
-                    "length": main_path_length,
-                    "total_distance": total_distance,
-                    "start_node": s_node,
-                    "end_node": e_node
-                }
-
-    if best_path["nodes"] is None:
+    if not routes:
         raise HTTPException(status_code=404, detail="No path found between the road segments.")
+    main_path_nodes, total_distance, total_cost = routes[0]
 
-    print(f"Debug: Best path found S:{best_path['start_node']} -> E:{best_path['end_node']}, TotalDist:{best_path['total_distance']:.2f}")
+    logger.debug("Best path found S:%s -> E:%s, TotalDist:%.2f", main_path_nodes[0], main_path_nodes[-1], total_distance)
 
-    # Now, use the best path found to construct the full geometry
-    full_path_geom = get_full_path_geometry_and_length(db, start_info, end_info, best_path["nodes"])
+    # Now, use the paths found to construct the full geometries
+    with metrics.stage("geometry"):
+        geometries = await run_in_threadpool(
+            _route_geometries, db, start_info, end_info, [path_nodes for path_nodes, _, _ in routes], links
+        )
 
+    full_path_geom = geometries[0]
     if not full_path_geom:
         raise HTTPException(status_code=500, detail="Could not construct the full path geometry.")
+    metrics.record_route(total_distance, len(main_path_nodes))
+
+    route = {
+        "total_distance_meters": total_distance, "path_geometry": full_path_geom, "profile": profile,
+        "total_cost": total_cost,
+        "alternatives": [
+            {"total_distance_meters": distance, "total_cost": cost, "path_geometry": geometry}
+            for (_, distance, cost), geometry in zip(routes[1:], geometries[1:]) if geometry
+        ],
+    }
+    route_cache.put(cache_key, route, generation)
+    return route
+
+
+def _route_geometries(db: Session, start_info: dict, end_info: dict, paths: list, links) -> list:
+    """Full geometry of each node path between the same snapped points."""
+    return [get_full_path_geometry_and_length(db, start_info, end_info, path_nodes, links) for path_nodes in paths]
+
+
+@router.get("/profiles")
+async def list_profiles():
+    """Cost profiles /route accepts in its profile field."""
+    if not graph_manager.is_loaded():
+        raise HTTPException(status_code=503, detail="Graph not loaded yet.")
+    return {"profiles": graph_manager.get_profiles()}
+
+
+@router.post("/matrix", response_model=MatrixResponse)
+async def get_matrix(request: MatrixRequest, db: Session = Depends(get_db)):
+    """
+    Calculates the route distance from every origin to every destination.
+    Only distances are returned, no geometry.
+    """
+    with RequestMetrics("matrix") as metrics:
+        return await _find_matrix(request, db, metrics)
+
+async def _find_matrix(request: MatrixRequest, db: Session, metrics: RequestMetrics) -> MatrixResponse:
+    if not graph_manager.is_loaded():
+        raise HTTPException(status_code=503, detail="Graph not loaded yet.")
+    state = graph_manager.get_state()
+
+    # Snap all points in one batch, then split them back into origins and destinations.
+    with metrics.stage("snap"):
+        snapped = await run_in_threadpool(
+            snap_points, db, request.origins + request.destinations, state.link_index
+        )
+    origins = snapped[:len(request.origins)]
+    destinations = snapped[len(request.origins):]
+
+    # The hierarchy answers many-to-many with buckets; otherwise one search per origin.
+    try:
+        with metrics.stage("search"):
+            distances = await search_executor.run(matrix_search, origins, destinations)
+    except SearchQueueFull:
+        raise HTTPException(status_code=503, detail="Too many route searches in progress, try again shortly.")
 
-    return RouteResponse(total_distance_meters=best_path["total_distance"], path_geometry=full_path_geom)
+    logger.debug("Matrix %dx%d computed.", len(origins), len(destinations))
+    return MatrixResponse(distances_meters=distances)
+
+
+@router.post("/isochrone", response_model=IsochroneResponse)
+async def get_isochrone(request: IsochroneRequest, db: Session = Depends(get_db)):
+    """
+    Calculates what is reachable from a point within each threshold, as road
+    parts or a polygon per threshold. One search covers all thresholds.
+    """
+    with RequestMetrics("isochrone") as metrics:
+        return await _find_isochrone(request, db, metrics)
+
+async def _find_isochrone(request: IsochroneRequest, db: Session, metrics: RequestMetrics) -> IsochroneResponse:
+    if not graph_manager.is_loaded():
+        raise HTTPException(status_code=503, detail="Graph not loaded yet.")
+    state = graph_manager.get_state()
+    profile = _check_profile(request.profile)
+    if min(request.thresholds) <= 0:
+        raise HTTPException(status_code=400, detail="Thresholds must be positive.")
+
+    with metrics.stage("snap"):
+        start_info = await run_in_threadpool(
+            find_nearest_link_and_snapped_point, db, request.point, state.link_index
+        )
+    if not start_info:
+        raise HTTPException(status_code=404, detail="Could not snap the point to the road network.")
+
+    try:
+        with metrics.stage("search"):
+            bands, search_stats = await search_executor.run(
+                isochrone_search, snapped_node_costs(start_info), request.thresholds, profile, start_info
+            )
+    except SearchQueueFull:
+        raise HTTPException(status_code=503, detail="Too many route searches in progress, try again shortly.")
+    metrics.record_search(search_stats)
+
+    with metrics.stage("geometry"):
+        geometries = await run_in_threadpool(
+            get_isochrone_geometries, db, bands, request.shape, state.links
+        )
+
+    return IsochroneResponse(profile=profile, isochrones=[
+        Isochrone(threshold=threshold, geometry=geometry) for threshold, geometry in zip(request.thresholds, geometries)
+    ])
+
+
+@router.post("/match", response_model=MatchResponse)
+async def match_traces_endpoint(request: MatchRequest, db: Session = Depends(get_db)):
+    """
+    Matches GPS traces to the road network with a hidden Markov model, using
+    route distances between candidate links. Candidates for every fix of the
+    batch come from one lookup, and all traces are matched in one search task.
+    """
+    with RequestMetrics("match") as metrics:
+        return await _match(request, db, metrics)
+
+async def _match(request: MatchRequest, db: Session, metrics: RequestMetrics) -> JSONResponse:
+    if not graph_manager.is_loaded():
+        raise HTTPException(status_code=503, detail="Graph not loaded yet.")
+    state = graph_manager.get_state()
+
+    fixes = [point for trace in request.traces for point in trace]
+    xy = to_5186([point.lon for point in fixes], [point.lat for point in fixes])
+    with metrics.stage("snap"):
+        candidates = await run_in_threadpool(
+            link_candidates, db, xy, config.MATCH_SEARCH_RADIUS_M, config.MATCH_MAX_CANDIDATES,
+            state.link_index
+        )
+
+    traces = []
+    start = 0
+    for trace in request.traces:
+        traces.append((xy[start:start + len(trace)], candidates[start:start + len(trace)]))
+        start += len(trace)
+    try:
+        with metrics.stage("search"):
+            results, search_stats = await search_executor.run(match_traces, traces)
+    except SearchQueueFull:
+        raise HTTPException(status_code=503, detail="Too many route searches in progress, try again shortly.")
+    metrics.record_search(search_stats)
+
+    with metrics.stage("geometry"):
+        routes = await run_in_threadpool(get_matched_routes, db, results, state.links)
+
+    # Built directly rather than through MatchResponse, like /route, to skip validating every coordinate.
+    with metrics.stage("encode"):
+        matched = [point for result in results for point in result["points"] if point is not None]
+        lonlat = iter(to_wgs84(np.array([[point["x"], point["y"]] for point in matched]).reshape(-1, 2)).tolist())
+        matches = []
+        for result, (link_ids, geometry) in zip(results, routes):
+            points = []
+            for point in result["points"]:
+                if point is None:
+                    points.append(None)
+                else:
+                    lon, lat = next(lonlat)
+                    points.append({"link_id": point["link_id"], "lat": lat, "lon": lon})
+            matches.append({
+                "matched_points": points,
+                "link_ids": link_ids,
+                "distance_meters": result["distance"],
+                "geometry": geometry,
+            })
+        return JSONResponse({"matches": matches})
 
 
 @router.get("/search", response_model=SearchResponse)
-def search_places(q: str = Query(None, min_length=2)):
+async def search_places(q: str = Query(None, min_length=2)):
     """
-    Searches for places using the Nominatim API.
+    Searches for places, in the local place index or through Nominatim
+    depending on GEOCODER_MODE.
     """
     if not q:
         return {"results": []}
 
-    NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
-    params = {
-        'q': q,
-        'format': 'json',
-        'addressdetails': 1,
-        'limit': 10,
-        'countrycodes': 'kr',
-    }
-    headers = {
-        'User-Agent': 'KDH-Map-Project/1.0 (https://github.com/Daviswhistle/PathFinderOnMap)',
-        'Accept-Language': 'ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7',
-    }
-
     try:
-        response = requests.get(NOMINATIM_URL, params=params, headers=headers)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        results = response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Nominatim API request failed: {e}")
+        results = await geocoder.search(q, limit=10)
+    except GeocoderUnavailable:
         raise HTTPException(status_code=503, detail="Could not connect to the search service.")
 
-    search_results = []
-    for item in results:
-        address_parts = item.get('address', {})
-        address = ", ".join(filter(None, [
-            address_parts.get('road'),
-            address_parts.get('city'),
-            address_parts.get('county'),
-            address_parts.get('state'),
-            address_parts.get('country')
-        ]))
-
-        search_results.append(
-            SearchResultItem(
-                name=item.get('display_name'),
-                category=item.get('type'),
-                address=address,
-                location={"lat": float(item.get('lat')), "lon": float(item.get('lon'))}
-            )
-        )
-    
-    return {"results": search_results}
+    return {"results": [SearchResultItem(**item) for item in results]}
 
 
 @router.get("/reverse")
-def reverse_geocode(lat: float = Query(...), lon: float = Query(...)):
+async def reverse_geocode(lat: float = Query(...), lon: float = Query(...)):
     """
     Performs reverse geocoding to get an address from coordinates.
     """
-    NOMINATIM_URL = "https://nominatim.openstreetmap.org/reverse"
-    params = {
-        'lat': lat,
-        'lon': lon,
-        'format': 'json',
-        'addressdetails': 1,
-    }
-    headers = {
-        'User-Agent': 'KDH-Map-Project/1.0 (https://github.com/your-repo)',
-        'Accept-Language': 'ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7',
-    }
-
     try:
-        response = requests.get(NOMINATIM_URL, params=params, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        return {"name": data.get("display_name", "Unknown location")}
-    except requests.exceptions.RequestException as e:
-        print(f"Reverse geocoding request failed: {e}")
-        raise HTTPException(status_code=503, detail="Could not connect to the location service.")
\ No newline at end of file
+        name = await geocoder.reverse(lat, lon)
+    except GeocoderUnavailable:
+        raise HTTPException(status_code=503, detail="Could not connect to the location service.")
+    return {"name": name or "Unknown location"}
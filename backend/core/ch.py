@@ -0,0 +1,353 @@
+import hashlib
+import heapq
+import logging
+
+import numpy as np
+
+from .csr import CSRGraph
+from .snapshot import load_snapshot, save_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the on-disk layout below changes so stale files are rebuilt.
+CH_FORMAT_VERSION = 2
+
+def graph_fingerprint(graph: CSRGraph) -> str:
+    """Hash of the graph topology and weights, used to tell whether a hierarchy is stale."""
+    digest = hashlib.sha256()
+    for array in (graph.node_ids, graph.offsets, graph.targets, graph.weights):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+def _pack(node_count: int, adjacency: list[dict]):
+    """Turns per-node {neighbor: (weight, middle)} dicts into CSR arrays."""
+    offsets = np.zeros(node_count + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(edges) for edges in adjacency])
+    targets = np.empty(offsets[-1], dtype=np.int32)
+    weights = np.empty(offsets[-1], dtype=np.float64)
+    middles = np.empty(offsets[-1], dtype=np.int32)
+    for u, edges in enumerate(adjacency):
+        start = offsets[u]
+        for i, (v, (w, middle)) in enumerate(edges.items()):
+            targets[start + i] = v
+            weights[start + i] = w
+            middles[start + i] = middle
+    return offsets, targets, weights, middles
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over a CSRGraph, using the same dense node indices.
+
+    The "up" arrays hold, for each node, the edges leading to higher-ranked nodes.
+    The "down" arrays hold, for each node, the edges arriving from higher-ranked
+    nodes, reversed so the backward search can also only go up. middles is the
+    node a shortcut bypasses, or -1 for an original link.
+    """
+    def __init__(self, node_ids, rank, up, down, fingerprint: str):
+        self.node_ids = node_ids
+        self.rank = rank
+        self.up_offsets, self.up_targets, self.up_weights, self.up_middles = up
+        self.down_offsets, self.down_targets, self.down_weights, self.down_middles = down
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, graph: CSRGraph, witness_limit: int = 500, progress_every: int = 100000):
+        """
+        Contracts every node in order of edge difference, adding a shortcut u->x
+        around v only when a bounded witness search finds no path at most as short.
+        """
+        n = graph.number_of_nodes()
+        out_adj = [dict() for _ in range(n)]
+        in_adj = [dict() for _ in range(n)]
+        offsets = graph.offsets.tolist()
+        targets = graph.targets.tolist()
+        weights = graph.weights.tolist()
+        for u in range(n):
+            for i in range(offsets[u], offsets[u + 1]):
+                v = targets[i]
+                if v != u:
+                    out_adj[u][v] = (weights[i], -1)
+                    in_adj[v][u] = (weights[i], -1)
+
+        contracted = [False] * n
+        deleted_neighbors = [0] * n
+        level = [0] * n
+
+        def witness_distances(source, skip, goals, max_cost, limit):
+            """Bounded Dijkstra from source that never passes through skip."""
+            dist = {source: 0.0}
+            heap = [(0.0, source)]
+            remaining = set(goals)
+            remaining.discard(source)
+            settled = 0
+            while heap and remaining and settled < limit:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                if d > max_cost:
+                    break
+                remaining.discard(u)
+                settled += 1
+                for x, (w, _) in out_adj[u].items():
+                    if x == skip:
+                        continue
+                    nd = d + w
+                    if nd < dist.get(x, float('inf')):
+                        dist[x] = nd
+                        heapq.heappush(heap, (nd, x))
+            return dist
+
+        def shortcuts_for(v, limit):
+            shortcuts = []
+            outgoing = out_adj[v]
+            if not outgoing:
+                return shortcuts
+            max_out = max(w for w, _ in outgoing.values())
+            for u, (w_uv, _) in in_adj[v].items():
+                dist = witness_distances(u, v, outgoing, w_uv + max_out, limit)
+                for x, (w_vx, _) in outgoing.items():
+                    if x == u:
+                        continue
+                    via = w_uv + w_vx
+                    if dist.get(x, float('inf')) > via:
+                        shortcuts.append((u, x, via))
+            return shortcuts
+
+        def priority(v):
+            added = len(shortcuts_for(v, 50))
+            return 2 * (added - len(in_adj[v]) - len(out_adj[v])) + deleted_neighbors[v] + level[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = np.empty(n, dtype=np.int32)
+        up = [None] * n
+        down = [None] * n
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            # Lazy update: re-evaluate and put back if it is no longer the cheapest.
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            for u, x, w in shortcuts_for(v, witness_limit):
+                existing = out_adj[u].get(x)
+                if existing is None or w < existing[0]:
+                    out_adj[u][x] = (w, v)
+                    in_adj[x][u] = (w, v)
+
+            up[v] = out_adj[v]
+            down[v] = in_adj[v]
+            for x in up[v]:
+                del in_adj[x][v]
+                deleted_neighbors[x] += 1
+                level[x] = max(level[x], level[v] + 1)
+            for u in down[v]:
+                del out_adj[u][v]
+                deleted_neighbors[u] += 1
+                level[u] = max(level[u], level[v] + 1)
+            out_adj[v] = {}
+            in_adj[v] = {}
+
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+            if progress_every and order % progress_every == 0:
+                logger.info("Contracted %d/%d nodes...", order, n)
+
+        return cls(graph.node_ids, rank, _pack(n, up), _pack(n, down), graph_fingerprint(graph))
+
+    def number_of_shortcuts(self):
+        return int((self.up_middles >= 0).sum() + (self.down_middles >= 0).sum())
+
+    def save(self, path: str):
+        # Stored in the memory-mappable snapshot format so worker processes share one copy.
+        save_snapshot(path, {
+            "node_ids": self.node_ids,
+            "rank": self.rank,
+            "up_offsets": self.up_offsets, "up_targets": self.up_targets,
+            "up_weights": self.up_weights, "up_middles": self.up_middles,
+            "down_offsets": self.down_offsets, "down_targets": self.down_targets,
+            "down_weights": self.down_weights, "down_middles": self.down_middles,
+        }, meta={"ch_version": CH_FORMAT_VERSION, "fingerprint": self.fingerprint})
+
+    @classmethod
+    def load(cls, path: str):
+        """Maps a saved hierarchy, or returns None if it is missing or from an older format."""
+        snapshot = load_snapshot(path)
+        if snapshot is None:
+            return None
+        _, data, meta = snapshot
+        if meta.get("ch_version") != CH_FORMAT_VERSION:
+            return None
+        up = (data["up_offsets"], data["up_targets"], data["up_weights"], data["up_middles"])
+        down = (data["down_offsets"], data["down_targets"], data["down_weights"], data["down_middles"])
+        return cls(data["node_ids"], data["rank"], up, down, meta["fingerprint"])
+
+    def index_of(self, node_id: int):
+        idx = int(np.searchsorted(self.node_ids, node_id))
+        if idx < len(self.node_ids) and self.node_ids[idx] == node_id:
+            return idx
+        return None
+
+    def _edge(self, offsets, targets, weights, middles, u, v):
+        start, end = offsets[u], offsets[u + 1]
+        for i in range(start, end):
+            if targets[i] == v:
+                return weights[i], middles[i]
+        raise KeyError((u, v))
+
+    def _unpack(self, u, v, middle, out: list):
+        """Appends the original nodes of edge u->v after u, expanding shortcuts."""
+        stack = [(u, v, middle)]
+        while stack:
+            a, b, m = stack.pop()
+            if m < 0:
+                out.append(b)
+                continue
+            # The bypassed node is ranked below both ends: a->m is stored
+            # in m's down edges and m->b in m's up edges.
+            _, m_left = self._edge(self.down_offsets, self.down_targets, self.down_weights, self.down_middles, m, a)
+            _, m_right = self._edge(self.up_offsets, self.up_targets, self.up_weights, self.up_middles, m, b)
+            stack.append((m, b, m_right))
+            stack.append((a, m, m_left))
+
+    def shortest_path(self, start_costs: dict[int, float], end_costs: dict[int, float], stats: dict = None) -> tuple[list, float]:
+        """
+        Bidirectional upward Dijkstra with stall-on-demand, keyed by NODE_ID like
+        pathfinder.find_shortest_path. Returns the NODE_ID path with shortcuts
+        unpacked and the total distance, or (None, 0) if no path exists.
+        If a stats dict is given, the number of settled nodes is stored in it.
+        """
+        up = (self.up_offsets, self.up_targets, self.up_weights)
+        down = (self.down_offsets, self.down_targets, self.down_weights)
+        # Each side searches upward over its own edges and is stalled by the other's.
+        forward = self._init_side(start_costs, up, down)
+        backward = self._init_side(end_costs, down, up)
+
+        best_total = float('inf')
+        meeting = -1
+        expanded = 0
+        while True:
+            f_key = forward["heap"][0][0] if forward["heap"] else float('inf')
+            b_key = backward["heap"][0][0] if backward["heap"] else float('inf')
+            # A side whose smallest key reaches best_total can no longer improve it.
+            if min(f_key, b_key) >= best_total:
+                break
+            side, other = (forward, backward) if f_key <= b_key else (backward, forward)
+            dist = side["dist"]
+
+            d, u = heapq.heappop(side["heap"])
+            if d > dist[u]:
+                continue
+            expanded += 1
+            other_d = other["dist"].get(u)
+            if other_d is not None and d + other_d < best_total:
+                best_total = d + other_d
+                meeting = u
+
+            # Stall-on-demand: if a higher node reaches u more cheaply, u cannot be
+            # on a shortest up-down path and need not be expanded.
+            offsets, targets, weights = side["stall"]
+            start, end = offsets[u], offsets[u + 1]
+            if any(dist.get(w, float('inf')) + c < d for w, c in zip(targets[start:end].tolist(), weights[start:end].tolist())):
+                continue
+
+            offsets, targets, weights = side["edges"]
+            start, end = offsets[u], offsets[u + 1]
+            pred = side["pred"]
+            heap = side["heap"]
+            for i, (v, w) in enumerate(zip(targets[start:end].tolist(), weights[start:end].tolist()), start):
+                nd = d + w
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    pred[v] = (u, i)
+                    heapq.heappush(heap, (nd, v))
+
+        if stats is not None:
+            stats["expanded"] = expanded
+        if meeting < 0:
+            return None, 0
+
+        # Walk back to the start over the forward tree, then on to the end over
+        # the backward tree, expanding each shortcut on the way.
+        up_chain = []
+        node = meeting
+        while True:
+            parent, i = forward["pred"][node]
+            if parent < 0:
+                break
+            up_chain.append((parent, node, int(self.up_middles[i])))
+            node = parent
+        path = [node]
+        for parent, child, middle in reversed(up_chain):
+            self._unpack(parent, child, middle, path)
+
+        node = meeting
+        while True:
+            parent, i = backward["pred"][node]
+            if parent < 0:
+                break
+            self._unpack(node, parent, int(self.down_middles[i]), path)
+            node = parent
+
+        return self.node_ids[path].tolist(), best_total
+
+    def _init_side(self, costs: dict[int, float], edges, stall) -> dict:
+        dist, pred, heap = {}, {}, []
+        for node, cost in costs.items():
+            idx = self.index_of(node)
+            if idx is not None and cost < dist.get(idx, float('inf')):
+                dist[idx] = cost
+                pred[idx] = (-1, -1)
+                heapq.heappush(heap, (cost, idx))
+        return {"dist": dist, "pred": pred, "heap": heap, "edges": edges, "stall": stall}
+
+    def _upward_search(self, costs: dict[int, float], edges, stall) -> dict[int, float]:
+        """Complete upward Dijkstra from NODE_ID seeds; returns the settled, unstalled search space."""
+        side = self._init_side(costs, edges, stall)
+        dist, heap = side["dist"], side["heap"]
+        edge_offsets, edge_targets, edge_weights = edges
+        stall_offsets, stall_targets, stall_weights = stall
+        space = {}
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            start, end = stall_offsets[u], stall_offsets[u + 1]
+            if any(dist.get(w, float('inf')) + c < d for w, c in zip(stall_targets[start:end].tolist(), stall_weights[start:end].tolist())):
+                continue
+            space[u] = d
+            start, end = edge_offsets[u], edge_offsets[u + 1]
+            for v, w in zip(edge_targets[start:end].tolist(), edge_weights[start:end].tolist()):
+                nd = d + w
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return space
+
+    def distance_matrix(self, sources: list[dict[int, float]], targets: list[dict[int, float]]) -> np.ndarray:
+        """
+        Many-to-many distances with buckets: one backward upward search per target
+        leaves (target, distance) entries at every node it settles, then one forward
+        upward search per source scans the buckets it meets. Unreachable pairs are inf.
+        """
+        up = (self.up_offsets, self.up_targets, self.up_weights)
+        down = (self.down_offsets, self.down_targets, self.down_weights)
+
+        buckets = {}
+        for j, costs in enumerate(targets):
+            for node, d in self._upward_search(costs, down, up).items():
+                buckets.setdefault(node, []).append((j, d))
+
+        result = np.full((len(sources), len(targets)), np.inf)
+        for i, costs in enumerate(sources):
+            row = result[i]
+            for node, d in self._upward_search(costs, up, down).items():
+                for j, d_target in buckets.get(node, ()):
+                    if d + d_target < row[j]:
+                        row[j] = d + d_target
+        return result
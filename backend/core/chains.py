@@ -0,0 +1,397 @@
+import numpy as np
+
+from .csr import CSRGraph
+from .profiles import DISTANCE
+
+# Component reachability is tabulated up to this many components; beyond that every pair is searched.
+_MAX_TABULATED_COMPONENTS = 4096
+
+class ChainGraph:
+    """
+    Road graph with every chain of degree-2 nodes contracted into one edge, for
+    point-to-point searches, plus what it takes to move seeds on contracted
+    nodes onto it and to expand its paths back to the original nodes.
+
+    A node is contracted when it only passes traffic through: one way in and
+    one way out, or both ways to exactly two neighbours. graph is a CSRGraph
+    over the remaining junction nodes whose edge i is chain i: the dense
+    indices of the full graph chain_nodes[chain_offsets[i]:chain_offsets[i + 1]],
+    joined by the full graph's edges at the same positions in chain_edges (-1
+    at each chain's first node). positions[v] holds the positions of a
+    contracted node v in chain_nodes, one per chain through it, and -1 for
+    junctions. components labels the junctions with their strongly connected
+    component, and reach[a, b] tells whether component b can be reached from
+    component a (None if there are too many components to tabulate).
+    """
+    def __init__(self, full: CSRGraph, graph: CSRGraph, chain_offsets: np.ndarray, chain_nodes: np.ndarray,
+                 chain_edges: np.ndarray, positions: np.ndarray, components: np.ndarray, reach: np.ndarray = None):
+        self.full = full
+        self.graph = graph
+        self.chain_offsets = chain_offsets
+        self.chain_nodes = chain_nodes
+        self.chain_edges = chain_edges
+        self.positions = positions
+        self.components = components
+        self.reach = reach
+        # Cost from the start of its chain to every chain position, per profile, built on first use.
+        self._cumulative = {}
+
+    @classmethod
+    def build(cls, full: CSRGraph, components: np.ndarray):
+        """
+        Contracts the degree-2 chains of full, given the strongly connected
+        component of each of its nodes. Chains that would become parallel
+        edges, and cycles with no junction on them, keep one node as a junction
+        so every edge of the compressed graph expands to a single chain.
+        """
+        n = full.number_of_nodes()
+        offsets, targets = full.offsets, full.targets
+        out_degree = np.diff(offsets)
+        in_offsets, in_sources, _ = full._reverse_edges(DISTANCE)
+        in_degree = np.diff(in_offsets)
+        nodes = np.arange(n)
+
+        interior = np.zeros(n, dtype=bool)
+        one_way = np.flatnonzero((out_degree == 1) & (in_degree == 1))
+        succ, pred = targets[offsets[one_way]], in_sources[in_offsets[one_way]]
+        interior[one_way] = (succ != pred) & (succ != one_way)
+        two_way = np.flatnonzero((out_degree == 2) & (in_degree == 2))
+        out_a, out_b = targets[offsets[two_way]], targets[offsets[two_way] + 1]
+        in_a, in_b = in_sources[in_offsets[two_way]], in_sources[in_offsets[two_way] + 1]
+        interior[two_way] = (
+            (np.minimum(out_a, out_b) == np.minimum(in_a, in_b)) & (np.maximum(out_a, out_b) == np.maximum(in_a, in_b))
+            & (out_a != two_way) & (out_b != two_way)
+        )
+
+        # The edge continuing each edge through a contracted node: its only out-edge one way, or
+        # the out-edge that does not lead back on a two-way road. -1 where the edge ends at a junction.
+        sources = np.repeat(nodes, out_degree)
+        continues = np.flatnonzero(interior[targets])
+        via = targets[continues]
+        first = offsets[via]
+        following = np.full(len(targets), -1, dtype=np.int64)
+        following[continues] = np.where((out_degree[via] == 2) & (targets[first] == sources[continues]), first + 1, first)
+
+        junction = ~interior
+        while True:
+            chain_offsets, chain_nodes, chain_edges = _follow_chains(junction, sources, targets, following)
+            heads = chain_nodes[chain_offsets[:-1]]
+            tails = chain_nodes[chain_offsets[1:] - 1]
+            lengths = np.diff(chain_offsets)
+
+            split = np.zeros(n, dtype=bool)
+            # Edges never reached from a junction lie on cycles of contracted nodes.
+            visited = np.zeros(len(targets), dtype=bool)
+            visited[chain_edges[chain_edges >= 0]] = True
+            split[sources[~visited]] = True
+            # Of chains joining the same two junctions, keep a plain edge or else the first one.
+            order = np.lexsort((lengths, tails, heads))
+            same = (heads[order][1:] == heads[order][:-1]) & (tails[order][1:] == tails[order][:-1])
+            duplicates = order[1:][same]
+            split[chain_nodes[chain_offsets[duplicates] + 1]] = True
+            split &= ~junction
+            if not split.any():
+                break
+            junction |= split
+
+        junction_ids = np.flatnonzero(junction)
+        dense = np.full(n, -1, dtype=np.int64)
+        dense[junction_ids] = np.arange(len(junction_ids))
+        # Chains in (head, tail) order, so chain i is edge i of the compressed CSR arrays.
+        order = np.lexsort((dense[tails], dense[heads]))
+        lengths = lengths[order]
+        new_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=new_offsets[1:])
+        gather = np.repeat(chain_offsets[order] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+        chain_offsets, chain_nodes, chain_edges = new_offsets, chain_nodes[gather], chain_edges[gather]
+        heads, tails = heads[order], tails[order]
+
+        graph_offsets = np.zeros(len(junction_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(dense[heads], minlength=len(junction_ids)), out=graph_offsets[1:])
+        profiles = {name: _chain_sums(weights, chain_offsets, chain_edges) for name, weights in full.profiles.items()}
+        graph = CSRGraph(
+            full.node_ids[junction_ids], graph_offsets, dense[tails].astype(np.int32), profiles.pop(DISTANCE),
+            full.xy[junction_ids], profiles,
+        )
+
+        positions = np.full((n, 2), -1, dtype=np.int64)
+        inner = np.ones(len(chain_nodes), dtype=bool)
+        inner[chain_offsets[:-1]] = False
+        inner[chain_offsets[1:] - 1] = False
+        inner_positions = np.flatnonzero(inner)
+        by_node = inner_positions[np.argsort(chain_nodes[inner_positions], kind="stable")]
+        owners = chain_nodes[by_node]
+        second = np.zeros(len(by_node), dtype=bool)
+        second[1:] = owners[1:] == owners[:-1]
+        positions[owners[~second], 0] = by_node[~second]
+        positions[owners[second], 1] = by_node[second]
+
+        return cls(full, graph, chain_offsets, chain_nodes, chain_edges, positions,
+                   components[junction_ids], _component_reach(full, components))
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Everything but the full graph, for a snapshot; see from_arrays."""
+        arrays = {
+            "chain_node_ids": self.graph.node_ids,
+            "chain_graph_offsets": self.graph.offsets,
+            "chain_graph_targets": self.graph.targets,
+            "chain_graph_weights": self.graph.weights,
+            "chain_graph_xy": self.graph.xy,
+            "chain_offsets": self.chain_offsets,
+            "chain_nodes": self.chain_nodes,
+            "chain_edges": self.chain_edges,
+            "chain_positions": self.positions,
+            "chain_components": self.components,
+            **{f"chain_profile_{name}": weights for name, weights in self.graph.profiles.items() if name != DISTANCE},
+        }
+        if self.reach is not None:
+            arrays["chain_reach"] = self.reach
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, full: CSRGraph, arrays: dict):
+        """Rebuilds a ChainGraph from the arrays of a snapshot, or returns None if it has none."""
+        if "chain_node_ids" not in arrays:
+            return None
+        profiles = {name[len("chain_profile_"):]: weights for name, weights in arrays.items() if name.startswith("chain_profile_")}
+        graph = CSRGraph(arrays["chain_node_ids"], arrays["chain_graph_offsets"], arrays["chain_graph_targets"],
+                         arrays["chain_graph_weights"], arrays["chain_graph_xy"], profiles)
+        return cls(full, graph, arrays["chain_offsets"], arrays["chain_nodes"], arrays["chain_edges"],
+                   arrays["chain_positions"], arrays["chain_components"], arrays.get("chain_reach"))
+
+    def cumulative(self, profile: str = DISTANCE) -> np.ndarray:
+        """Cost in a profile from the start of its chain to every position in chain_nodes."""
+        cumulative = self._cumulative.get(profile)
+        if cumulative is None:
+            steps = np.where(self.chain_edges >= 0, self.full.profiles[profile][np.maximum(self.chain_edges, 0)], 0.0)
+            cumulative = np.cumsum(steps)
+            cumulative -= np.repeat(cumulative[self.chain_offsets[:-1]], np.diff(self.chain_offsets))
+            self._cumulative[profile] = cumulative
+        return cumulative
+
+    def _occurrences(self, costs: dict[int, float]) -> list[tuple[int, int, float]]:
+        """(chain, position in chain_nodes, cost) for each seed on a contracted node."""
+        found = []
+        for node, cost in costs.items():
+            idx = self.full.index_of(node)
+            if idx is None:
+                continue
+            for position in self.positions[idx].tolist():
+                if position >= 0:
+                    chain = int(np.searchsorted(self.chain_offsets, position, side="right")) - 1
+                    found.append((chain, position, cost))
+        return found
+
+    def _node_ids(self, start: int, end: int) -> list[int]:
+        return self.full.node_ids[self.chain_nodes[start:end]].tolist()
+
+    def start_seeds(self, costs: dict[int, float], profile: str = DISTANCE) -> dict[int, tuple[float, list]]:
+        """
+        Start seeds moved onto junctions: {junction NODE_ID: (cost, NODE_IDs
+        from the seed node up to, not including, the junction)}. A seed on a
+        contracted node continues to the end of each chain through it.
+        """
+        seeds = {}
+        for node, cost in costs.items():
+            if self.graph.index_of(node) is not None and cost < seeds.get(node, (float('inf'),))[0]:
+                seeds[node] = (cost, [])
+        cumulative = self.cumulative(profile)
+        for chain, position, cost in self._occurrences(costs):
+            last = int(self.chain_offsets[chain + 1]) - 1
+            junction = int(self.full.node_ids[self.chain_nodes[last]])
+            total = cost + float(cumulative[last] - cumulative[position])
+            if total < seeds.get(junction, (float('inf'),))[0]:
+                seeds[junction] = (total, self._node_ids(position, last))
+        return seeds
+
+    def end_seeds(self, costs: dict[int, float], profile: str = DISTANCE) -> dict[int, tuple[float, list]]:
+        """
+        End seeds moved onto junctions: {junction NODE_ID: (cost, NODE_IDs
+        after the junction up to and including the seed node)}. A seed on a
+        contracted node is reached from the start of each chain through it.
+        """
+        seeds = {}
+        for node, cost in costs.items():
+            if self.graph.index_of(node) is not None and cost < seeds.get(node, (float('inf'),))[0]:
+                seeds[node] = (cost, [])
+        cumulative = self.cumulative(profile)
+        for chain, position, cost in self._occurrences(costs):
+            first = int(self.chain_offsets[chain])
+            junction = int(self.full.node_ids[self.chain_nodes[first]])
+            total = cost + float(cumulative[position] - cumulative[first])
+            if total < seeds.get(junction, (float('inf'),))[0]:
+                seeds[junction] = (total, self._node_ids(first + 1, position + 1))
+        return seeds
+
+    def _direct_routes(self, start_costs: dict[int, float], end_costs: dict[int, float], profile: str):
+        """Routes along a single chain from a seed on it to a later one, which pass no junction."""
+        ends = {}
+        for chain, position, cost in self._occurrences(end_costs):
+            ends.setdefault(chain, []).append((position, cost))
+        cumulative = self.cumulative(profile)
+        best = None
+        for chain, start, start_cost in self._occurrences(start_costs):
+            for end, end_cost in ends.get(chain, ()):
+                if end >= start:
+                    total = start_cost + float(cumulative[end] - cumulative[start]) + end_cost
+                    if best is None or total < best[1]:
+                        best = (self._node_ids(start, end + 1), total)
+        return best
+
+    def expand(self, path: list[int]) -> list[int]:
+        """Expands a NODE_ID path on the compressed graph to every original node along it."""
+        graph = self.graph
+        idx = [graph.index_of(node) for node in path]
+        expanded = path[:1]
+        for u, v in zip(idx, idx[1:]):
+            chain = graph._edge(u, v)
+            expanded.extend(self._node_ids(int(self.chain_offsets[chain]) + 1, int(self.chain_offsets[chain + 1])))
+        return expanded
+
+    def reachable(self, start_nodes, end_nodes) -> bool:
+        """Whether any of the end junctions can be reached from any of the start junctions, from the component table."""
+        if self.reach is None:
+            return True
+        graph = self.graph
+        starts = [self.components[graph.index_of(node)] for node in start_nodes]
+        ends = [self.components[graph.index_of(node)] for node in end_nodes]
+        return bool(self.reach[np.ix_(starts, ends)].any())
+
+    def _reachable_pairs(self, starts: list, ends: list) -> np.ndarray:
+        """reachable for every pair of seed sets at once, as a (starts, ends) bool array."""
+        has_start = np.array([bool(seeds) for seeds in starts])
+        has_end = np.array([bool(seeds) for seeds in ends])
+        if self.reach is None:
+            return has_start[:, None] & has_end[None, :]
+        graph = self.graph
+        # Components each start can get to, then whether that covers any component of each end.
+        reached = np.array([
+            self.reach[[self.components[graph.index_of(node)] for node in seeds]].any(axis=0)
+            if seeds else np.zeros(len(self.reach), dtype=bool)
+            for seeds in starts
+        ]).reshape(len(starts), len(self.reach))
+        pairs = np.zeros((len(starts), len(ends)), dtype=bool)
+        for j, seeds in enumerate(ends):
+            if seeds:
+                pairs[:, j] = reached[:, [self.components[graph.index_of(node)] for node in seeds]].any(axis=1)
+        return pairs
+
+    def routes(self, search, start_costs: dict[int, float], end_costs: dict[int, float],
+               profile: str = DISTANCE) -> list[tuple[list, float]]:
+        """
+        Runs search(start seeds, end seeds), which returns a list of (NODE_ID
+        path, total cost), on the compressed graph with the seeds moved onto
+        junctions. Returns its routes expanded to the original nodes, from seed
+        node to seed node, cheapest first. A route that stays on one chain is
+        found without searching and leads the list when it is the cheapest, and
+        nothing is searched when the components of the seeds rule out every path.
+        """
+        starts = self.start_seeds(start_costs, profile)
+        ends = self.end_seeds(end_costs, profile)
+        found = []
+        if starts and ends and self.reachable(starts, ends):
+            for path, total in search({node: cost for node, (cost, _) in starts.items()},
+                                      {node: cost for node, (cost, _) in ends.items()}):
+                expanded = starts[path[0]][1] + self.expand(path) + ends[path[-1]][1]
+                # Moving a seed to both ends of a two-way chain can let a longer route double back over it.
+                if not found or len(set(expanded)) == len(expanded):
+                    found.append((expanded, total))
+        direct = self._direct_routes(start_costs, end_costs, profile)
+        # Only as the best route: as an alternative it would skip the search's stretch and share checks.
+        if direct is not None and (not found or direct[1] < found[0][1]):
+            found.insert(0, direct)
+        return found
+
+    def shortest_path(self, search, start_costs: dict[int, float], end_costs: dict[int, float],
+                      profile: str = DISTANCE) -> tuple[list, float]:
+        """routes for a search returning a single (path, total), or (None, 0) like the engines."""
+        def search_one(starts, ends):
+            path, total = search(starts, ends)
+            return [] if path is None else [(path, total)]
+
+        found = self.routes(search_one, start_costs, end_costs, profile)
+        return found[0] if found else (None, 0)
+
+    def distance_matrix(self, engine, sources: list[dict[int, float]], targets: list[dict[int, float]]) -> np.ndarray:
+        """
+        engine.distance_matrix on the compressed graph with every seed moved
+        onto junctions. Sources are grouped by which targets their components can
+        reach, so no search runs until it has exhausted the graph looking for an
+        unreachable target. Pairs on one chain get their direct distance too.
+        """
+        starts = [self.start_seeds(costs) for costs in sources]
+        ends = [self.end_seeds(costs) for costs in targets]
+        result = np.full((len(sources), len(targets)), np.inf)
+        if not sources or not targets:
+            return result
+        reachable = self._reachable_pairs(starts, ends)
+        patterns, groups = np.unique(reachable, axis=0, return_inverse=True)
+        for pattern, columns in enumerate(patterns):
+            rows = np.flatnonzero(groups.ravel() == pattern)
+            columns = np.flatnonzero(columns)
+            if len(rows) and len(columns):
+                result[np.ix_(rows, columns)] = engine.distance_matrix(
+                    [{node: cost for node, (cost, _) in starts[i].items()} for i in rows],
+                    [{node: cost for node, (cost, _) in ends[j].items()} for j in columns],
+                )
+
+        cumulative = self.cumulative()
+        by_chain = {}
+        for j, costs in enumerate(targets):
+            for chain, position, cost in self._occurrences(costs):
+                by_chain.setdefault(chain, []).append((j, position, cost))
+        for i, costs in enumerate(sources):
+            for chain, start, start_cost in self._occurrences(costs):
+                for j, end, end_cost in by_chain.get(chain, ()):
+                    if end >= start:
+                        result[i, j] = min(result[i, j], start_cost + float(cumulative[end] - cumulative[start]) + end_cost)
+        return result
+
+def _follow_chains(junction: np.ndarray, sources: np.ndarray, targets: np.ndarray, following: np.ndarray):
+    """Walks every out-edge of every junction on to the next junction: (chain_offsets, chain_nodes, chain_edges)."""
+    source_list = sources.tolist()
+    target_list = targets.tolist()
+    following_list = following.tolist()
+    is_junction = junction.tolist()
+    offsets, nodes, edges = [0], [], []
+    for edge in np.flatnonzero(junction[sources]).tolist():
+        nodes.append(source_list[edge])
+        edges.append(-1)
+        while True:
+            nodes.append(target_list[edge])
+            edges.append(edge)
+            if is_junction[target_list[edge]]:
+                break
+            edge = following_list[edge]
+        offsets.append(len(nodes))
+    return np.array(offsets, dtype=np.int64), np.array(nodes, dtype=np.int64), np.array(edges, dtype=np.int64)
+
+def _chain_sums(weights: np.ndarray, chain_offsets: np.ndarray, chain_edges: np.ndarray) -> np.ndarray:
+    if len(chain_offsets) < 2:
+        return np.zeros(0)
+    steps = np.where(chain_edges >= 0, np.asarray(weights)[np.maximum(chain_edges, 0)], 0.0)
+    return np.add.reduceat(steps, chain_offsets[:-1])
+
+def _component_reach(full: CSRGraph, components: np.ndarray):
+    """reach[a, b]: whether component b can be reached from component a, or None for too many components."""
+    count = int(components.max()) + 1 if len(components) else 0
+    if count > _MAX_TABULATED_COMPONENTS:
+        return None
+    sources = components[np.repeat(np.arange(full.number_of_nodes()), np.diff(full.offsets))]
+    targets = components[full.targets]
+    between = sources != targets
+    successors = [set() for _ in range(count)]
+    for a, b in set(zip(sources[between].tolist(), targets[between].tolist())):
+        successors[a].add(b)
+
+    reach = np.zeros((count, count), dtype=bool)
+    for a in range(count):
+        reach[a, a] = True
+        frontier = [a]
+        while frontier:
+            c = frontier.pop()
+            for b in successors[c]:
+                if not reach[a, b]:
+                    reach[a, b] = True
+                    frontier.append(b)
+    return reach
@@ -0,0 +1,104 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Which in-memory graph the route search runs on: "networkx" or "csr".
+GRAPH_ENGINE = os.getenv("GRAPH_ENGINE", "networkx").lower()
+
+if GRAPH_ENGINE not in ("networkx", "csr"):
+    raise ValueError(f"Unknown GRAPH_ENGINE '{GRAPH_ENGINE}', expected 'networkx' or 'csr'")
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Contraction hierarchy written by scripts/build_ch.py. /route uses it when it matches the loaded graph.
+CH_PATH = os.getenv("CH_PATH", os.path.join(BACKEND_DIR, "data", "contraction_hierarchy.snapshot"))
+
+# Memory-mapped graph snapshot shared by all workers. It is rewritten from the database when missing or stale.
+GRAPH_SNAPSHOT_PATH = os.getenv("GRAPH_SNAPSHOT_PATH", os.path.join(BACKEND_DIR, "data", "graph.snapshot"))
+
+# Where link geometry work happens: "db" asks PostGIS on every request, "memory" loads all
+# link geometries at startup and snaps points in-process.
+LINK_GEOMETRY_MODE = os.getenv("LINK_GEOMETRY_MODE", "db").lower()
+
+if LINK_GEOMETRY_MODE not in ("db", "memory"):
+    raise ValueError(f"Unknown LINK_GEOMETRY_MODE '{LINK_GEOMETRY_MODE}', expected 'db' or 'memory'")
+
+LINK_SNAPSHOT_PATH = os.getenv("LINK_SNAPSHOT_PATH", os.path.join(BACKEND_DIR, "data", "links.snapshot"))
+
+# Strongly connected components with fewer nodes than this are dropped at load: fragments, stubs and
+# one-way dead ends a route could not leave. Islands such as Jeju are far larger and are kept.
+GRAPH_MIN_COMPONENT_NODES = int(os.getenv("GRAPH_MIN_COMPONENT_NODES", "100"))
+
+# Without the in-memory link index, the nearest SNAP_CANDIDATES links are fetched per point and the
+# first one left on the graph after pruning is snapped to. If none is, the point cannot be routed.
+SNAP_CANDIDATES = int(os.getenv("SNAP_CANDIDATES", "8"))
+
+# Database connection pool: DB_POOL_SIZE connections kept open, up to DB_MAX_OVERFLOW more under
+# load, and a request waits at most DB_POOL_TIMEOUT seconds for one before failing.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Route searches run in their own bounded pool: this many at once, and this many admitted
+# (running plus waiting) before further requests get a 503.
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+SEARCH_QUEUE_LIMIT = int(os.getenv("SEARCH_QUEUE_LIMIT", "64"))
+
+# Number of routing worker processes. 0 runs searches on threads in the API process; above 0
+# searches are dispatched to processes that all map the same graph snapshot read-only.
+ROUTING_PROCESSES = int(os.getenv("ROUTING_PROCESSES", "0"))
+
+# Route caches: node paths by search seeds inside the pathfinder, and whole /route responses by
+# snapped link and position. Positions along a link are rounded to ROUTE_CACHE_QUANTUM_M meters.
+PATH_CACHE_SIZE = int(os.getenv("PATH_CACHE_SIZE", "10000"))
+ROUTE_CACHE_SIZE = int(os.getenv("ROUTE_CACHE_SIZE", "2000"))
+ROUTE_CACHE_TTL = float(os.getenv("ROUTE_CACHE_TTL", "3600"))
+ROUTE_CACHE_QUANTUM_M = float(os.getenv("ROUTE_CACHE_QUANTUM_M", "1.0"))
+
+# Alternative routes (/route with alternatives above 0) cost at most ALTERNATIVE_MAX_STRETCH times the
+# shortest route and share at most ALTERNATIVE_MAX_SHARE of their cost with a route listed before them.
+ALTERNATIVE_MAX_STRETCH = float(os.getenv("ALTERNATIVE_MAX_STRETCH", "1.2"))
+ALTERNATIVE_MAX_SHARE = float(os.getenv("ALTERNATIVE_MAX_SHARE", "0.75"))
+
+# /isochrone polygons: the target_percent of PostGIS ST_ConcaveHull, from 1 (convex hull) down to
+# tighter, slower hulls.
+ISOCHRONE_CONCAVITY = float(os.getenv("ISOCHRONE_CONCAVITY", "0.8"))
+
+# /match: up to MATCH_MAX_CANDIDATES links within MATCH_SEARCH_RADIUS_M of each GPS fix are considered;
+# each direction of a road is its own link, so a fix at a four-way junction is near eight of them.
+# MATCH_GPS_SIGMA_M is the GPS noise, MATCH_BETA_M how far driving distances between fixes may stray
+# from the straight-line distance. Paths between candidates are kept in a cache of MATCH_CACHE_SIZE.
+MATCH_SEARCH_RADIUS_M = float(os.getenv("MATCH_SEARCH_RADIUS_M", "50"))
+MATCH_MAX_CANDIDATES = int(os.getenv("MATCH_MAX_CANDIDATES", "8"))
+MATCH_GPS_SIGMA_M = float(os.getenv("MATCH_GPS_SIGMA_M", "5"))
+MATCH_BETA_M = float(os.getenv("MATCH_BETA_M", "10"))
+MATCH_CACHE_SIZE = int(os.getenv("MATCH_CACHE_SIZE", "100000"))
+
+# Optional CSV of per-link speeds (profile,LINK_ID,speed_kmh) adding travel time profiles next to
+# "distance" and the free-flow "time" profile, e.g. one profile per hour from traffic data.
+TRAFFIC_PROFILES_PATH = os.getenv("TRAFFIC_PROFILES_PATH")
+
+# Shared secret for the /admin endpoints, sent in the X-Admin-Token header. Unset disables them.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# Logging: LOG_LEVEL applies to the application loggers (DEBUG shows per-search details and SQL), and
+# LOG_REQUEST_METRICS logs a one-line stage timing summary for every /route and /matrix request.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_REQUEST_METRICS = os.getenv("LOG_REQUEST_METRICS", "false").lower() in ("1", "true", "yes")
+
+# Place search and reverse geocoding: "nominatim" forwards every lookup to NOMINATIM_URL, "local"
+# answers from an in-memory index of named OSM features and MOCT node names built at startup.
+# With GEOCODER_FALLBACK, local mode still asks Nominatim when the index has no answer.
+GEOCODER_MODE = os.getenv("GEOCODER_MODE", "nominatim").lower()
+
+if GEOCODER_MODE not in ("nominatim", "local"):
+    raise ValueError(f"Unknown GEOCODER_MODE '{GEOCODER_MODE}', expected 'nominatim' or 'local'")
+
+GEOCODER_FALLBACK = os.getenv("GEOCODER_FALLBACK", "true").lower() in ("1", "true", "yes")
+GEOCODER_REVERSE_RADIUS_M = float(os.getenv("GEOCODER_REVERSE_RADIUS_M", "150"))
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+NOMINATIM_TIMEOUT = float(os.getenv("NOMINATIM_TIMEOUT", "5"))
+GEOCODER_CACHE_SIZE = int(os.getenv("GEOCODER_CACHE_SIZE", "10000"))
+GEOCODER_CACHE_TTL = float(os.getenv("GEOCODER_CACHE_TTL", "86400"))
@@ -0,0 +1,603 @@
+import heapq
+import math
+
+import networkx as nx
+import numpy as np
+
+from .profiles import DISTANCE
+
+class CSRGraph:
+    """
+    Directed road graph stored in compressed sparse row form.
+
+    NODE_IDs are mapped to dense indices 0..n-1 through the sorted node_ids array.
+    The out-edges of node i are targets[offsets[i]:offsets[i + 1]] with matching
+    weights, and xy holds the EPSG:5186 position of each node (NaN if unknown).
+
+    weights are link lengths in meters. Other cost profiles, such as travel
+    time, are extra weight arrays aligned with targets in profiles, so every
+    profile searches the same topology and adds only one float per edge.
+    """
+    def __init__(self, node_ids: np.ndarray, offsets: np.ndarray, targets: np.ndarray, weights: np.ndarray, xy: np.ndarray = None,
+                 profiles: dict[str, np.ndarray] = None):
+        self.node_ids = node_ids
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        if xy is None:
+            xy = np.full((len(node_ids), 2), np.nan)
+        self.xy = xy
+        self.profiles = {DISTANCE: weights, **(profiles or {})}
+        self._heuristic_scales = {DISTANCE: 1.0}
+        # In-edges, built on first use by backward searches: (offsets, sources, edge positions).
+        self._reverse = None
+        self._reverse_weights = {}
+
+    @classmethod
+    def from_edges(cls, f_nodes: np.ndarray, t_nodes: np.ndarray, lengths: np.ndarray, coords=None,
+                   profiles: dict[str, np.ndarray] = None):
+        """
+        Builds the graph from parallel F_NODE/T_NODE/LENGTH arrays, plus per-link
+        weights for each extra profile. When a pair of nodes is joined by several
+        links only one edge is kept, weighted with the lowest cost among them in
+        each profile, since that is the only one a cheapest path can use.
+        """
+        f_nodes = np.asarray(f_nodes, dtype=np.int64)
+        t_nodes = np.asarray(t_nodes, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.float64)
+
+        node_ids = np.unique(np.concatenate([f_nodes, t_nodes]))
+        f_idx = np.searchsorted(node_ids, f_nodes)
+        t_idx = np.searchsorted(node_ids, t_nodes).astype(np.int32)
+
+        # Sort by source, then target, then length so the first of each pair is the shortest.
+        order = np.lexsort((lengths, t_idx, f_idx))
+        f_idx, t_idx, lengths = f_idx[order], t_idx[order], lengths[order]
+        keep = np.ones(len(f_idx), dtype=bool)
+        keep[1:] = (f_idx[1:] != f_idx[:-1]) | (t_idx[1:] != t_idx[:-1])
+        f_idx, t_idx, lengths = f_idx[keep], t_idx[keep], lengths[keep]
+        group_starts = np.flatnonzero(keep)
+        edge_profiles = {
+            name: np.minimum.reduceat(np.asarray(weights, dtype=np.float64)[order], group_starts)
+            for name, weights in (profiles or {}).items()
+        } if len(group_starts) else {name: np.zeros(0) for name in profiles or {}}
+
+        offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(f_idx, minlength=len(node_ids)), out=offsets[1:])
+
+        xy = np.full((len(node_ids), 2), np.nan)
+        if coords is not None and len(coords):
+            pos = np.searchsorted(coords.node_ids, node_ids)
+            pos[pos == len(coords.node_ids)] = 0
+            found = coords.node_ids[pos] == node_ids
+            xy[found] = coords.xy[pos[found]]
+
+        return cls(node_ids, offsets, np.ascontiguousarray(t_idx), np.ascontiguousarray(lengths), xy, edge_profiles)
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.targets)
+
+    def nbytes(self):
+        return (self.node_ids.nbytes + self.offsets.nbytes + self.targets.nbytes + self.xy.nbytes
+                + sum(weights.nbytes for weights in self.profiles.values()))
+
+    def profile_weights(self, profile: str) -> np.ndarray:
+        """Edge weights of a cost profile; raises KeyError for an unknown one."""
+        return self.profiles[profile]
+
+    def heuristic_scale(self, profile: str) -> float:
+        """
+        Lowest cost per meter of length over all edges in a profile. Straight-line
+        meters times this never overestimate the profile cost, so A* stays exact.
+        """
+        scale = self._heuristic_scales.get(profile)
+        if scale is None:
+            weights = self.profiles[profile]
+            positive = self.weights > 0
+            scale = float(np.min(weights[positive] / self.weights[positive])) if positive.any() else 0.0
+            self._heuristic_scales[profile] = scale
+        return scale
+
+    def _edge(self, u: int, v: int):
+        """Position of the edge u -> v in targets, or None."""
+        start, end = self.offsets[u], self.offsets[u + 1]
+        hits = np.flatnonzero(self.targets[start:end] == v)
+        return int(start + hits[0]) if len(hits) else None
+
+    def path_weight(self, node_path: list[int], profile: str = DISTANCE) -> float:
+        """Sum of a profile's edge weights along a NODE_ID path."""
+        weights = self.profiles[profile]
+        idx = [self.index_of(node) for node in node_path]
+        return float(sum(weights[self._edge(u, v)] for u, v in zip(idx, idx[1:])))
+
+    def cost_per_meter(self, a: int, b: int, profile: str) -> float:
+        """
+        Profile cost per meter of the link between NODE_IDs a and b, in either
+        direction, used to price the partial links at the start and end of a route.
+        Falls back to the profile's lowest rate if the nodes are not adjacent.
+        """
+        if profile == DISTANCE:
+            return 1.0
+        ia, ib = self.index_of(a), self.index_of(b)
+        if ia is not None and ib is not None:
+            for u, v in ((ia, ib), (ib, ia)):
+                edge = self._edge(u, v)
+                if edge is not None and self.weights[edge] > 0:
+                    return float(self.profiles[profile][edge] / self.weights[edge])
+        return self.heuristic_scale(profile)
+
+    def index_of(self, node_id: int):
+        """Returns the dense index of a NODE_ID, or None if it is not in the graph."""
+        idx = int(np.searchsorted(self.node_ids, node_id))
+        if idx < len(self.node_ids) and self.node_ids[idx] == node_id:
+            return idx
+        return None
+
+    def strongly_connected_components(self) -> np.ndarray:
+        """
+        Strongly connected component of every dense index (iterative Tarjan),
+        numbered by size: 0 is the largest component, 1 the next and so on.
+        """
+        n = len(self.node_ids)
+        offsets = self.offsets.tolist()
+        targets = self.targets.tolist()
+        order = [-1] * n
+        low = [0] * n
+        on_stack = [False] * n
+        labels = [-1] * n
+        stack = []
+        counter = 0
+        count = 0
+        for root in range(n):
+            if order[root] >= 0:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            # Depth-first work stack of (node, next out-edge to look at).
+            work = [(root, offsets[root])]
+            while work:
+                v, i = work[-1]
+                end = offsets[v + 1]
+                while i < end:
+                    w = targets[i]
+                    i += 1
+                    if order[w] < 0:
+                        work[-1] = (v, i)
+                        order[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = True
+                        work.append((w, offsets[w]))
+                        break
+                    if on_stack[w] and order[w] < low[v]:
+                        low[v] = order[w]
+                else:
+                    work.pop()
+                    if work:
+                        u = work[-1][0]
+                        if low[v] < low[u]:
+                            low[u] = low[v]
+                    if low[v] == order[v]:
+                        while True:
+                            w = stack.pop()
+                            on_stack[w] = False
+                            labels[w] = count
+                            if w == v:
+                                break
+                        count += 1
+
+        labels = np.array(labels, dtype=np.int64)
+        if n == 0:
+            return labels
+        # Renumber by size, largest first.
+        rank = np.empty(count, dtype=np.int64)
+        rank[np.argsort(-np.bincount(labels, minlength=count), kind="stable")] = np.arange(count)
+        return rank[labels]
+
+    def to_networkx(self) -> nx.DiGraph:
+        G = nx.DiGraph()
+        node_ids = self.node_ids.tolist()
+        targets = self.targets.tolist()
+        weights = self.weights.tolist()
+        offsets = self.offsets.tolist()
+        for u in range(len(node_ids)):
+            for i in range(offsets[u], offsets[u + 1]):
+                G.add_edge(node_ids[u], node_ids[targets[i]], weight=weights[i])
+        return G
+
+    def _heuristic(self, end_costs: dict[int, float], scale: float = 1.0):
+        """
+        Straight-line A* estimate to the closest end index, or None if unusable.
+        scale converts meters into the units of the profile being searched.
+        """
+        goals = []
+        for idx, cost in end_costs.items():
+            x, y = self.xy[idx]
+            if math.isnan(x) or math.isnan(y):
+                return None
+            goals.append((float(x), float(y), cost))
+        xy = self.xy
+
+        def heuristic(idx):
+            x = xy.item(idx, 0)
+            if x != x:
+                return 0.0
+            y = xy.item(idx, 1)
+            return min(math.hypot(x - gx, y - gy) * scale + cost for gx, gy, cost in goals)
+
+        return heuristic
+
+    def shortest_path(self, start_costs: dict[int, float], end_costs: dict[int, float], stats: dict = None,
+                      profile: str = DISTANCE) -> tuple[list, float]:
+        """
+        Multi-source/multi-target A* over the CSR arrays, keyed by NODE_ID like
+        pathfinder.find_shortest_path, minimizing the given profile's weights.
+        Returns the NODE_ID path and the total cost including the partial costs,
+        or (None, 0) if no path exists.
+        If a stats dict is given, the number of settled nodes is stored in it.
+        """
+        sources = {}
+        for node, cost in start_costs.items():
+            idx = self.index_of(node)
+            if idx is not None:
+                sources[idx] = min(cost, sources.get(idx, float('inf')))
+        goals = {}
+        for node, cost in end_costs.items():
+            idx = self.index_of(node)
+            if idx is not None:
+                goals[idx] = min(cost, goals.get(idx, float('inf')))
+        if not sources or not goals:
+            return None, 0
+
+        heuristic = self._heuristic(goals, self.heuristic_scale(profile)) or (lambda idx: 0.0)
+        offsets = self.offsets
+        targets = self.targets
+        weights = self.profiles[profile]
+
+        estimates = {}
+        dist = {}
+        pred = {}
+        heap = []
+        for idx, cost in sources.items():
+            dist[idx] = cost
+            pred[idx] = -1
+            estimates[idx] = heuristic(idx)
+            heapq.heappush(heap, (cost + estimates[idx], idx))
+
+        settled = set()
+        best_total = float('inf')
+        best_end = -1
+        while heap:
+            f, u = heapq.heappop(heap)
+            if f >= best_total:
+                break
+            if u in settled:
+                continue
+            settled.add(u)
+            d = dist[u]
+
+            if u in goals and d + goals[u] < best_total:
+                best_total = d + goals[u]
+                best_end = u
+
+            start, end = offsets[u], offsets[u + 1]
+            for v, w in zip(targets[start:end].tolist(), weights[start:end].tolist()):
+                nd = d + w
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    pred[v] = u
+                    if v not in estimates:
+                        estimates[v] = heuristic(v)
+                    heapq.heappush(heap, (nd + estimates[v], v))
+
+        if stats is not None:
+            stats["expanded"] = len(settled)
+        if best_end < 0:
+            return None, 0
+
+        path = [best_end]
+        while pred[path[-1]] >= 0:
+            path.append(pred[path[-1]])
+        path.reverse()
+        return self.node_ids[path].tolist(), best_total
+
+    def _seed_indices(self, costs: dict[int, float]) -> dict[int, float]:
+        seeds = {}
+        for node, cost in costs.items():
+            idx = self.index_of(node)
+            if idx is not None:
+                seeds[idx] = min(cost, seeds.get(idx, float('inf')))
+        return seeds
+
+    def _reverse_edges(self, profile: str):
+        """In-edge CSR arrays: offsets, source of each in-edge and the profile's weights."""
+        if self._reverse is None:
+            sources = np.repeat(np.arange(len(self.node_ids), dtype=np.int32), np.diff(self.offsets))
+            order = np.argsort(self.targets, kind="stable")
+            offsets = np.zeros(len(self.node_ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=len(self.node_ids)), out=offsets[1:])
+            self._reverse = (offsets, sources[order], order)
+        offsets, sources, order = self._reverse
+        weights = self._reverse_weights.get(profile)
+        if weights is None:
+            weights = self._reverse_weights[profile] = self.profiles[profile][order]
+        return offsets, sources, weights
+
+    @staticmethod
+    def _search_tree(seeds: dict[int, float], offsets, targets, weights, heuristic, goals: dict[int, float] = None,
+                     stretch: float = 1.0, bound: float = float('inf')):
+        """
+        A* that keeps going past the first goal until every node whose estimate is
+        within bound has settled. With goals the bound becomes stretch times the
+        best total once a goal settles. Returns the settled distances, the search
+        tree as predecessors and the best total (inf without goals).
+        """
+        estimates = {}
+        dist = {}
+        pred = {}
+        heap = []
+        for idx, cost in seeds.items():
+            dist[idx] = cost
+            pred[idx] = -1
+            estimates[idx] = heuristic(idx)
+            heapq.heappush(heap, (cost + estimates[idx], idx))
+
+        settled = {}
+        best_total = float('inf')
+        while heap:
+            f, u = heapq.heappop(heap)
+            if f > bound:
+                break
+            if u in settled:
+                continue
+            d = settled[u] = dist[u]
+
+            if goals and u in goals and d + goals[u] < best_total:
+                best_total = d + goals[u]
+                bound = min(bound, best_total * stretch)
+
+            start, end = offsets[u], offsets[u + 1]
+            for v, w in zip(targets[start:end].tolist(), weights[start:end].tolist()):
+                nd = d + w
+                if nd < dist.get(v, float('inf')):
+                    if v not in estimates:
+                        estimates[v] = heuristic(v)
+                    if nd + estimates[v] > bound:
+                        continue
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd + estimates[v], v))
+        return settled, pred, best_total
+
+    def alternative_paths(self, start_costs: dict[int, float], end_costs: dict[int, float], k: int,
+                          stretch: float = 1.2, max_share: float = 0.75, min_plateau: float = 0.1, stats: dict = None,
+                          profile: str = DISTANCE) -> list[tuple[list, float]]:
+        """
+        The shortest path plus up to k alternatives from one forward and one
+        backward search, with the plateau method (choice routing). A forward
+        search from the start seeds and a backward search from the end seeds each
+        settle every node within stretch times the shortest total. Edges that are
+        in both search trees form plateaus, and the path through a plateau is the
+        forward tree path to its end followed by the backward tree path from there.
+        The longest plateaus are the most natural detours. The shortest path is
+        always kept; an alternative only if its plateau covers at least min_plateau
+        of its cost and it shares at most max_share of its cost with the routes
+        kept before it.
+        Returns (NODE_ID path, total cost) pairs, shortest first, or [] if no path exists.
+        """
+        sources = self._seed_indices(start_costs)
+        goals = self._seed_indices(end_costs)
+        if not sources or not goals:
+            return []
+
+        scale = self.heuristic_scale(profile)
+        forward_heuristic = self._heuristic(goals, scale) or (lambda idx: 0.0)
+        dist_f, pred_f, best = self._search_tree(
+            sources, self.offsets, self.targets, self.profiles[profile], forward_heuristic, goals, stretch
+        )
+        if best == float('inf'):
+            if stats is not None:
+                stats["expanded"] = len(dist_f)
+            return []
+        # Searching the in-edges from the end seeds builds the tree of shortest paths to the end.
+        # A node on a route within the bound has settled forward, so the exact forward distance
+        # serves as the heuristic and the backward search never leaves the candidate via nodes.
+        unreached = float('inf')
+        dist_b, succ_b, _ = self._search_tree(
+            goals, *self._reverse_edges(profile), lambda idx: dist_f.get(idx, unreached), bound=best * stretch
+        )
+        if stats is not None:
+            stats["expanded"] = len(dist_f) + len(dist_b)
+
+        # Group the nodes both searches reached into plateaus: runs of edges u -> v that are in
+        # the forward tree (pred_f[v] == u) and in the backward tree (succ_b[u] == v).
+        limit = best * stretch
+        plateaus = {}
+        for v, db in dist_b.items():
+            df = dist_f[v]
+            if df + db > limit:
+                continue
+            w = succ_b[v]
+            if w >= 0 and w in dist_f and pred_f[w] == v:
+                continue  # Not the last node of its plateau.
+            first = v
+            while pred_f[first] >= 0 and succ_b.get(pred_f[first]) == first and pred_f[first] in dist_b:
+                first = pred_f[first]
+            plateaus[v] = (df - dist_f[first], df + db)
+
+        routes = []
+        shared_edges = {}
+        # The shortest path is a single plateau spanning the whole route; it goes first even when
+        # that plateau is empty, e.g. for a route on one node. Then the longest plateaus.
+        shortest = min(plateaus, key=lambda last: plateaus[last][1])
+        order = sorted(plateaus.items(), key=lambda item: (item[0] != shortest, -item[1][0], item[1][1]))
+        for last, (length, total) in order:
+            if len(routes) > k:
+                break
+            path = [last]
+            while pred_f[path[-1]] >= 0:
+                path.append(pred_f[path[-1]])
+            path.reverse()
+            while succ_b[path[-1]] >= 0:
+                path.append(succ_b[path[-1]])
+            if len(set(path)) != len(path):
+                continue
+            # Edge costs come from the search distances, so no edge lookups are needed.
+            costs = [
+                dist_f[v] - dist_f[u] if v in dist_f and pred_f[v] == u else dist_b[u] - dist_b[v]
+                for u, v in zip(path, path[1:])
+            ]
+            main_cost = total - dist_f[path[0]] - dist_b[path[-1]]
+            if routes and length < min_plateau * main_cost:
+                continue
+            if routes and sum(c for e, c in zip(zip(path, path[1:]), costs) if e in shared_edges) > max_share * main_cost:
+                continue
+            shared_edges.update(zip(zip(path, path[1:]), costs))
+            routes.append((self.node_ids[path].tolist(), total))
+
+        routes.sort(key=lambda route: route[1])
+        return routes
+
+    def costs_within(self, start_costs: dict[int, float], max_cost: float, stats: dict = None,
+                     profile: str = DISTANCE) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Dijkstra from the start seeds that stops once the next node would cost
+        more than max_cost. Returns the dense indices of every node reached within
+        it and their costs, in the order they settled (cheapest first).
+        If a stats dict is given, the number of settled nodes is stored in it.
+        """
+        offsets = self.offsets
+        targets = self.targets
+        weights = self.profiles[profile]
+        dist = {}
+        heap = []
+        for idx, cost in self._seed_indices(start_costs).items():
+            if cost <= max_cost:
+                dist[idx] = cost
+                heapq.heappush(heap, (cost, idx))
+
+        settled = {}
+        while heap:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled[u] = d
+            start, end = offsets[u], offsets[u + 1]
+            for v, w in zip(targets[start:end].tolist(), weights[start:end].tolist()):
+                nd = d + w
+                if nd <= max_cost and nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+
+        if stats is not None:
+            stats["expanded"] = len(settled)
+        indices = np.fromiter(settled.keys(), dtype=np.int64, count=len(settled))
+        costs = np.fromiter(settled.values(), dtype=np.float64, count=len(settled))
+        return indices, costs
+
+    def paths_from(self, source: int, target_nodes, max_cost: float) -> dict[int, tuple[float, list]]:
+        """
+        Dijkstra from one NODE_ID to several, stopping once all have settled or
+        the next node would cost more than max_cost. Returns {NODE_ID: (cost,
+        NODE_ID path)} for the targets reached; the others are left out.
+        """
+        src = self.index_of(source)
+        remaining = {}
+        for node in target_nodes:
+            idx = self.index_of(node)
+            if idx is not None:
+                remaining[idx] = node
+        if src is None or not remaining:
+            return {}
+
+        offsets = self.offsets
+        targets = self.targets
+        weights = self.weights
+        dist = {src: 0.0}
+        pred = {src: -1}
+        heap = [(0.0, src)]
+        settled = set()
+        found = {}
+        while heap and remaining:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            if u in remaining:
+                path = [u]
+                while pred[path[-1]] >= 0:
+                    path.append(pred[path[-1]])
+                found[remaining.pop(u)] = (d, self.node_ids[path[::-1]].tolist())
+
+            start, end = offsets[u], offsets[u + 1]
+            for v, w in zip(targets[start:end].tolist(), weights[start:end].tolist()):
+                nd = d + w
+                if nd <= max_cost and nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd, v))
+        return found
+
+    def out_edges(self, indices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Every out-edge of the given dense indices: for each edge, the position of
+        its source within indices, and its position in targets.
+        """
+        starts = self.offsets[indices]
+        counts = self.offsets[indices + 1] - starts
+        owners = np.repeat(np.arange(len(indices)), counts)
+        # Each node's run of edge positions: its first edge plus 0..count-1.
+        edges = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return owners, edges
+
+    def distance_matrix(self, sources: list[dict[int, float]], targets: list[dict[int, float]]) -> np.ndarray:
+        """
+        Many-to-many distances keyed by NODE_ID seeds, with one Dijkstra per source
+        that stops once every target node has settled. Unreachable pairs are inf.
+        """
+        goal_nodes = {}
+        for j, costs in enumerate(targets):
+            for node, cost in costs.items():
+                idx = self.index_of(node)
+                if idx is not None:
+                    goal_nodes.setdefault(idx, []).append((j, cost))
+
+        offsets = self.offsets
+        targets_array = self.targets
+        weights = self.weights
+        result = np.full((len(sources), len(targets)), np.inf)
+        for i, costs in enumerate(sources):
+            row = result[i]
+            dist = {}
+            heap = []
+            for node, cost in costs.items():
+                idx = self.index_of(node)
+                if idx is not None and cost < dist.get(idx, float('inf')):
+                    dist[idx] = cost
+                    heapq.heappush(heap, (cost, idx))
+
+            remaining = len(goal_nodes)
+            settled = set()
+            while heap and remaining:
+                d, u = heapq.heappop(heap)
+                if u in settled:
+                    continue
+                settled.add(u)
+                if u in goal_nodes:
+                    remaining -= 1
+                    for j, cost in goal_nodes[u]:
+                        if d + cost < row[j]:
+                            row[j] = d + cost
+
+                start, end = offsets[u], offsets[u + 1]
+                for v, w in zip(targets_array[start:end].tolist(), weights[start:end].tolist()):
+                    nd = d + w
+                    if nd < dist.get(v, float('inf')):
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+        return result
@@ -0,0 +1,126 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from . import config
+from .snapshot import load_snapshot
+
+logger = logging.getLogger(__name__)
+
+class SearchQueueFull(Exception):
+    """Raised when too many searches are already running or waiting."""
+
+def _attach_worker(snapshot_path: str, import_id: int):
+    """
+    Process pool initializer: map the shared graph snapshot into this worker.
+    Fails, breaking the pool, if the snapshot is not of the API process's import.
+    """
+    from .graph import graph_manager
+    graph_manager.snapshot_path = snapshot_path
+    graph_manager.attach_snapshot(import_id)
+
+class SearchExecutor:
+    """
+    Dedicated pool for CPU-bound graph searches, kept apart from the threadpool
+    FastAPI uses for sync endpoints and DB calls, so long searches cannot starve
+    short requests. At most max_workers searches run at once and at most
+    max_pending are admitted in total; beyond that callers are turned away.
+
+    Tasks must be module-level functions that find the graph through the
+    graph_manager of the process they run in, so the same call works on
+    threads and on routing worker processes.
+    """
+    def __init__(self, max_workers: int, max_pending: int):
+        self._max_workers = max_workers
+        self._executor = self._threads()
+        self._pending = threading.BoundedSemaphore(max_pending)
+        # (processes, snapshot path, import id) of the worker processes, None while on threads.
+        self._processes = None
+        self._swap_lock = threading.Lock()
+
+    def _threads(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="route-search")
+
+    @staticmethod
+    def _process_pool(processes: int, snapshot_path: str, import_id: int) -> ProcessPoolExecutor:
+        # Spawned workers start clean instead of inheriting the API process's heap.
+        return ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach_worker,
+            initargs=(snapshot_path, import_id),
+        )
+
+    def use_processes(self, processes: int, snapshot_path: str, import_id: int = None):
+        """
+        Switches to a fixed pool of worker processes that each map the graph
+        snapshot read-only, so searches run in parallel past the GIL while the
+        graph stays in memory once. Keeps the threads if there is no snapshot,
+        or if it is not of import_id, the import the API process's graph was
+        read from, e.g. because writing it failed.
+        """
+        if not os.path.exists(snapshot_path):
+            logger.warning("No graph snapshot at %s, route searches stay on threads.", snapshot_path)
+            return
+        pool = self._process_pool(processes, snapshot_path, import_id)
+        # Start every worker now rather than on the first requests.
+        try:
+            for future in [pool.submit(os.getpid) for _ in range(processes)]:
+                future.result()
+        except BrokenProcessPool:
+            pool.shutdown(wait=False)
+            logger.warning("Graph snapshot at %s is not of import %s, route searches stay on threads.",
+                           snapshot_path, import_id)
+            return
+        with self._swap_lock:
+            old, self._executor = self._executor, pool
+            self._processes = (processes, snapshot_path, import_id)
+        old.shutdown(wait=False)
+        logger.info("Route searches dispatched to %d worker processes.", processes)
+
+    def _replace_broken(self, broken):
+        """
+        Replaces a process pool that lost a worker, which fails every task
+        submitted to it afterwards, with a new one on the same snapshot. Falls
+        back to threads if the snapshot has since been replaced by another import.
+        """
+        with self._swap_lock:
+            if self._executor is not broken:
+                return
+            processes, snapshot_path, import_id = self._processes
+            snapshot = load_snapshot(snapshot_path)
+            if snapshot is not None and snapshot[2].get("import_id") == import_id:
+                logger.error("A routing worker process died, starting a new pool.")
+                self._executor = self._process_pool(processes, snapshot_path, import_id)
+            else:
+                logger.error("A routing worker process died and the graph snapshot changed, "
+                             "route searches fall back to threads.")
+                self._executor = self._threads()
+                self._processes = None
+        broken.shutdown(wait=False)
+
+    async def run(self, fn, *args):
+        if not self._pending.acquire(blocking=False):
+            raise SearchQueueFull()
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._executor
+            try:
+                return await loop.run_in_executor(executor, functools.partial(fn, *args))
+            except BrokenProcessPool:
+                # The search may have been cut short by another one taking the worker down, so it
+                # is tried once more on the new pool.
+                self._replace_broken(executor)
+                return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+        finally:
+            self._pending.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+search_executor = SearchExecutor(config.SEARCH_WORKERS, config.SEARCH_QUEUE_LIMIT)
@@ -0,0 +1,371 @@
+import logging
+import re
+import unicodedata
+
+import httpx
+import numpy as np
+from pyproj import Transformer
+from sqlalchemy import func, literal, null, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from ..db.models import Node
+from . import config
+from .cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Reverse lookups arrive in WGS84; distances between places are measured in EPSG:5186.
+_to_5186 = Transformer.from_crs(4326, 5186, always_xy=True)
+
+_WORD = re.compile(r"\w+")
+
+def _normalize(name: str) -> str:
+    return unicodedata.normalize("NFKC", name).casefold().strip()
+
+def _words(normalized: str) -> list[str]:
+    return _WORD.findall(normalized)
+
+def _word_grams(word: str) -> set[str]:
+    """Trigrams of a word padded like pg_trgm, so a word's first letters form their own trigrams."""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _prefix_grams(word: str) -> set[str]:
+    """Trigrams every word starting with this prefix has, for matching words still being typed."""
+    padded = f"  {word}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class PlaceIndex:
+    """
+    In-memory autocomplete and reverse lookup over named places.
+
+    Names are indexed by word trigrams, kept as one posting array sorted by
+    trigram then place, so a query intersects a few short slices instead of
+    scanning every name. A query matches a place when each of its words is a
+    prefix of one of the place's words. A query nothing matches that way, most
+    often a typo, gets the places sharing most of its trigrams instead. Places
+    are also bucketed into a grid in EPSG:5186 for nearest-place lookups.
+    """
+    # Candidates verified and ranked per query. Beyond this the shortest names are kept,
+    # since exact and prefix matches, which rank first, are among them.
+    MAX_CANDIDATES = 2000
+    # Share of a misspelled query's trigrams a place needs, like pg_trgm's similarity threshold.
+    TYPO_SIMILARITY = 0.5
+
+    def __init__(self, names: list, categories: list, addresses: list, lonlat: np.ndarray, xy: np.ndarray,
+                 cell_size: float = 100.0):
+        self.names = names
+        self.categories = categories
+        self.addresses = addresses
+        self.lonlat = lonlat
+        self.xy = xy
+        self._lengths = np.fromiter((len(name) for name in names), dtype=np.int32, count=len(names))
+
+        gram_ids = {}
+        grams, places = [], []
+        for place, name in enumerate(names):
+            place_grams = set()
+            for word in _words(_normalize(name)):
+                place_grams |= _word_grams(word)
+            for gram in place_grams:
+                grams.append(gram_ids.setdefault(gram, len(gram_ids)))
+                places.append(place)
+        grams = np.asarray(grams, dtype=np.int32)
+        places = np.asarray(places, dtype=np.int32)
+        order = np.lexsort((places, grams))
+        self._gram_ids = gram_ids
+        self._postings = places[order]
+        self._gram_offsets = np.searchsorted(grams[order], np.arange(len(gram_ids) + 1)).astype(np.int64)
+
+        self.cell_size = cell_size
+        cells = np.floor(xy / cell_size).astype(np.int64)
+        keys = (cells[:, 0] << 32) + cells[:, 1]
+        order = np.argsort(keys, kind="stable")
+        self._cell_places = order.astype(np.int32)
+        self._cell_keys, self._cell_starts = np.unique(keys[order], return_index=True)
+        self._cell_ends = np.append(self._cell_starts[1:], len(order))
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds the index from (name, category, address, lon, lat, x, y) rows.
+        The same name within about 200 m is kept once, so a station mapped as a
+        point and a polygon, or an intersection split over several nodes, shows
+        up as one result.
+        """
+        seen = set()
+        names, categories, addresses, lonlat, xy = [], [], [], [], []
+        for name, category, address, lon, lat, x, y in rows:
+            if not name or x is None:
+                continue
+            key = (_normalize(name), round(x / 200.0), round(y / 200.0))
+            if key in seen:
+                continue
+            seen.add(key)
+            names.append(name)
+            categories.append(category)
+            addresses.append(address)
+            lonlat.append((lon, lat))
+            xy.append((x, y))
+        return cls(
+            names, categories, addresses,
+            np.asarray(lonlat, dtype=np.float64).reshape(-1, 2), np.asarray(xy, dtype=np.float64).reshape(-1, 2),
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def _item(self, place: int) -> dict:
+        lon, lat = self.lonlat[place]
+        return {
+            "name": self.names[place],
+            "category": self.categories[place] or "unknown",
+            "address": self.addresses[place] or "N/A",
+            "location": {"lat": float(lat), "lon": float(lon)},
+        }
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """Places matching query, exact names first, then names starting with it, then shorter names."""
+        normalized = _normalize(query)
+        words = _words(normalized)
+        if not words:
+            return []
+        places = self._match(normalized, words, limit)
+        # Korean names are often written without spaces ("서울역" for "서울 역"), so retry joined.
+        if not places and len(words) > 1:
+            places = self._match("".join(words), ["".join(words)], limit)
+        if not places:
+            places = self._similar(words, limit)
+        return [self._item(place) for place in places]
+
+    def _match(self, normalized: str, words: list[str], limit: int) -> list[int]:
+        slices = []
+        for gram in set().union(*(_prefix_grams(word) for word in words)):
+            gram_id = self._gram_ids.get(gram)
+            if gram_id is None:
+                return []
+            slices.append(self._postings[self._gram_offsets[gram_id]:self._gram_offsets[gram_id + 1]])
+        # Intersect the rarest trigrams first so the candidate set shrinks fastest.
+        slices.sort(key=len)
+        candidates = slices[0]
+        for postings in slices[1:]:
+            candidates = np.intersect1d(candidates, postings, assume_unique=True)
+            if not len(candidates):
+                return []
+        if len(candidates) > self.MAX_CANDIDATES:
+            candidates = candidates[np.argpartition(self._lengths[candidates], self.MAX_CANDIDATES)[:self.MAX_CANDIDATES]]
+
+        ranked = []
+        for place in candidates.tolist():
+            name = _normalize(self.names[place])
+            name_words = _words(name)
+            # Trigrams can match across words or out of order, so confirm the prefixes.
+            if all(any(w.startswith(word) for w in name_words) for word in words):
+                rank = 0 if name == normalized else 1 if name.startswith(normalized) else 2
+                ranked.append((rank, len(name), name, place))
+        ranked.sort()
+        return [place for *_, place in ranked[:limit]]
+
+    def _similar(self, words: list[str], limit: int) -> list[int]:
+        """Places sharing at least TYPO_SIMILARITY of the query's trigrams, most shared first, then shorter names."""
+        grams = set().union(*(_prefix_grams(word) for word in words))
+        slices = []
+        for gram in grams:
+            gram_id = self._gram_ids.get(gram)
+            if gram_id is not None:
+                slices.append(self._postings[self._gram_offsets[gram_id]:self._gram_offsets[gram_id + 1]])
+        if not slices:
+            return []
+        shared = np.bincount(np.concatenate(slices), minlength=len(self.names))
+        candidates = np.flatnonzero(shared >= self.TYPO_SIMILARITY * len(grams))
+        order = np.lexsort((self._lengths[candidates], -shared[candidates]))
+        return candidates[order[:limit]].tolist()
+
+    def nearest(self, lon: float, lat: float, max_distance: float):
+        """The nearest place within max_distance meters of a WGS84 point, or None."""
+        x, y = _to_5186.transform(lon, lat)
+        cx, cy = int(np.floor(x / self.cell_size)), int(np.floor(y / self.cell_size))
+        best, best_distance = None, max_distance
+        rings = int(np.ceil(max_distance / self.cell_size))
+        for ring in range(rings + 1):
+            # Places in this ring are at least (ring - 1) cells away.
+            if best is not None and best_distance <= (ring - 1) * self.cell_size:
+                break
+            for dx in range(-ring, ring + 1):
+                for dy in range(-ring, ring + 1):
+                    if max(abs(dx), abs(dy)) != ring:
+                        continue
+                    key = ((cx + dx) << 32) + (cy + dy)
+                    i = np.searchsorted(self._cell_keys, key)
+                    if i == len(self._cell_keys) or self._cell_keys[i] != key:
+                        continue
+                    places = self._cell_places[self._cell_starts[i]:self._cell_ends[i]]
+                    distances = np.hypot(self.xy[places, 0] - x, self.xy[places, 1] - y)
+                    j = int(np.argmin(distances))
+                    if distances[j] <= best_distance:
+                        best, best_distance = int(places[j]), float(distances[j])
+        return self._item(best) if best is not None else None
+
+def _osm_place_rows(db: Session):
+    """Named OSM points and areas imported by osm2pgsql, whatever projection they were imported in."""
+    columns = """
+        name, COALESCE(amenity, shop, tourism, railway, leisure, historic, place, tags -> 'office', building),
+        NULLIF(concat_ws(' ', tags -> 'addr:province', tags -> 'addr:city', tags -> 'addr:district',
+                         tags -> 'addr:street', "addr:housenumber"), ''),
+        ST_PointOnSurface(way)
+    """
+    sql = text(f"""
+        SELECT name, category, address,
+               ST_X(ST_Transform(pt, 4326)), ST_Y(ST_Transform(pt, 4326)),
+               ST_X(ST_Transform(pt, 5186)), ST_Y(ST_Transform(pt, 5186))
+        FROM (
+            SELECT {columns} FROM planet_osm_point WHERE name IS NOT NULL
+            UNION ALL
+            SELECT {columns} FROM planet_osm_polygon WHERE name IS NOT NULL
+        ) AS places(name, category, address, pt)
+    """)
+    return db.execute(sql.execution_options(yield_per=50000))
+
+def _node_place_rows(db: Session):
+    """Named MOCT nodes, mostly intersections."""
+    return db.query(
+        Node.NODE_NAME, literal("intersection"), null(),
+        func.ST_X(func.ST_Transform(Node.geom, 4326)), func.ST_Y(func.ST_Transform(Node.geom, 4326)),
+        func.ST_X(Node.geom), func.ST_Y(Node.geom),
+    ).filter(Node.NODE_NAME.isnot(None), Node.NODE_NAME != "", Node.geom.isnot(None)).yield_per(50000)
+
+class GeocoderUnavailable(Exception):
+    """Raised when the remote geocoder cannot be reached or answers with an error."""
+
+class NominatimClient:
+    """
+    Nominatim over one pooled async HTTP client with timeouts. Answers are kept
+    in a TTL cache, since autocomplete sends the same prefixes again and again.
+    """
+    HEADERS = {
+        'User-Agent': 'KDH-Map-Project/1.0 (https://github.com/Daviswhistle/PathFinderOnMap)',
+        'Accept-Language': 'ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7',
+    }
+
+    def __init__(self, base_url: str, timeout: float, cache: LRUCache):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cache = cache
+        self._client = None
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created on first use, inside the server's event loop.
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, headers=self.HEADERS, timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+            )
+        return self._client
+
+    async def _get(self, path: str, params: dict):
+        key = (path, tuple(sorted(params.items())))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            response = await self._http().get(path, params=params)
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning("Nominatim request to %s failed: %s", path, e)
+            raise GeocoderUnavailable() from e
+        self.cache.put(key, data)
+        return data
+
+    async def search(self, query: str, limit: int = 10) -> list[dict]:
+        results = await self._get("/search", {
+            'q': query, 'format': 'json', 'addressdetails': 1, 'limit': limit, 'countrycodes': 'kr',
+        })
+        items = []
+        for item in results:
+            address_parts = item.get('address', {})
+            address = ", ".join(filter(None, [
+                address_parts.get('road'),
+                address_parts.get('city'),
+                address_parts.get('county'),
+                address_parts.get('state'),
+                address_parts.get('country')
+            ]))
+            items.append({
+                "name": item.get('display_name'),
+                "category": item.get('type'),
+                "address": address,
+                "location": {"lat": float(item.get('lat')), "lon": float(item.get('lon'))},
+            })
+        return items
+
+    async def reverse(self, lat: float, lon: float):
+        # Rounded to about 1 m so nearby clicks share a cache entry.
+        data = await self._get("/reverse", {
+            'lat': round(lat, 5), 'lon': round(lon, 5), 'format': 'json', 'addressdetails': 1,
+        })
+        return data.get("display_name")
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+class Geocoder:
+    """
+    Place search and reverse geocoding for /search and /reverse. In "local"
+    mode both are answered from a PlaceIndex built at startup, and Nominatim
+    is only asked when the index has no answer and GEOCODER_FALLBACK is set.
+    In "nominatim" mode every lookup goes to Nominatim.
+    """
+    def __init__(self, mode: str = None):
+        self.mode = mode or config.GEOCODER_MODE
+        self.remote = NominatimClient(
+            config.NOMINATIM_URL, config.NOMINATIM_TIMEOUT,
+            LRUCache(config.GEOCODER_CACHE_SIZE, config.GEOCODER_CACHE_TTL),
+        )
+        self._index = None
+
+    def load(self, db: Session):
+        """Builds the local place index from OSM features and MOCT node names (local mode only)."""
+        if self.mode != "local" or self._index is not None:
+            return
+        rows = []
+        try:
+            rows.extend(_osm_place_rows(db))
+        except SQLAlchemyError as e:
+            # Not fatal: OSM data is an optional import, node names still get indexed.
+            db.rollback()
+            logger.warning("Could not read OSM places, indexing node names only: %s", e)
+        rows.extend(_node_place_rows(db))
+        self._index = PlaceIndex.from_rows(rows)
+        logger.info("Place index built: %d places, %d trigrams.", len(self._index), len(self._index._gram_ids))
+
+    def get_index(self):
+        """Returns the local place index, or None when lookups go to Nominatim."""
+        return self._index
+
+    def _use_remote(self) -> bool:
+        return self._index is None or config.GEOCODER_FALLBACK
+
+    async def search(self, query: str, limit: int = 10) -> list[dict]:
+        if self._index is not None:
+            results = self._index.search(query, limit)
+            if results or not self._use_remote():
+                return results
+        return await self.remote.search(query, limit)
+
+    async def reverse(self, lat: float, lon: float) -> str:
+        if self._index is not None:
+            place = self._index.nearest(lon, lat, config.GEOCODER_REVERSE_RADIUS_M)
+            if place is not None:
+                return place["name"]
+            if not self._use_remote():
+                return None
+        return await self.remote.reverse(lat, lon)
+
+    async def aclose(self):
+        await self.remote.aclose()
+
+geocoder = Geocoder()
@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+
+# Web Mercator ground resolution at the equator and zoom 0, in meters per 256 px tile pixel.
+_METERS_PER_PIXEL_Z0 = 156543.03392
+_METERS_PER_DEGREE = 111320.0
+
+def zoom_tolerance(zoom: int, lat: float) -> float:
+    """Simplification tolerance in meters matching one screen pixel at a map zoom level."""
+    return _METERS_PER_PIXEL_Z0 * math.cos(math.radians(lat)) / 2 ** zoom
+
+def simplify_lonlat(coords: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """
+    Douglas–Peucker simplification of an (n, 2) WGS84 lon/lat line, keeping
+    every vertex farther than tolerance_m from the simplified line. Distances
+    are measured in a local equirectangular projection, which is accurate to
+    well under a percent over the extent of a route.
+    """
+    if len(coords) < 3 or tolerance_m <= 0:
+        return coords
+    scale = np.array([_METERS_PER_DEGREE * math.cos(math.radians(float(coords[:, 1].mean()))), _METERS_PER_DEGREE])
+    xy = coords * scale
+    keep = np.zeros(len(xy), dtype=bool)
+    keep[0] = keep[-1] = True
+
+    # Iterative over (first, last) index ranges, so long routes cannot hit the recursion limit.
+    stack = [(0, len(xy) - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        a, b = xy[first], xy[last]
+        points = xy[first + 1:last]
+        ab = b - a
+        length_sq = float(ab @ ab)
+        if length_sq == 0:
+            distances = np.hypot(*(points - a).T)
+        else:
+            # Distance to the segment, not the infinite line, so a route doubling back is kept.
+            t = np.clip((points - a) @ ab / length_sq, 0.0, 1.0)
+            distances = np.hypot(*(points - a - t[:, None] * ab).T)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return coords[keep]
+
+def encode_polyline(coords: np.ndarray, precision: int = 5) -> str:
+    """
+    Encodes an (n, 2) lon/lat line in the Google encoded polyline format
+    (lat/lon pairs, delta and zigzag encoded, 5-bit chunks). precision 6 gives
+    the variant used by OSRM and Valhalla.
+    """
+    if len(coords) == 0:
+        return ""
+    values = np.round(np.asarray(coords)[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    zigzag = np.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # One column per 5-bit chunk, least significant first, as many as the largest value needs.
+    shifts = np.arange(max(-(-int(zigzag.max()).bit_length() // 5), 1), dtype=np.int64) * 5
+    rest = zigzag[:, None] >> shifts
+    chunks = rest & 31
+    more = (rest >> 5) > 0
+    # A chunk is written if it is the first one or the one before it had more to follow.
+    present = np.ones_like(more)
+    present[:, 1:] = more[:, :-1]
+    chars = (chunks | np.where(more, 0x20, 0)) + 63
+    return chars[present].astype(np.uint8).tobytes().decode("ascii")
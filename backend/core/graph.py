@@ -1,25 +1,372 @@
-import networkx as nx
+import logging
+import threading
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from ..db.models import Link
+from ..db.models import Node, Link, DataImport
+from . import config
+from .csr import CSRGraph
+from .chains import ChainGraph
+from .profiles import DISTANCE, link_profiles
+from .ch import ContractionHierarchy, graph_fingerprint
+from .snapshot import load_snapshot, save_snapshot
+from .links import LinkGeometryStore, LinkIndex
+
+logger = logging.getLogger(__name__)
+
+class NodeCoordinates:
+    """
+    Compact EPSG:5186 coordinate lookup for graph nodes, stored as a sorted
+    NODE_ID array and a matching (n, 2) float array instead of per-node dicts.
+    """
+    def __init__(self, node_ids: np.ndarray, xy: np.ndarray, presorted: bool = False):
+        if not presorted:
+            order = np.argsort(node_ids)
+            node_ids = np.ascontiguousarray(node_ids[order], dtype=np.int64)
+            xy = np.ascontiguousarray(xy[order], dtype=np.float64)
+        self.node_ids = node_ids
+        self.xy = xy
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def get(self, node_id: int):
+        """Returns the (x, y) of a node, or None if the node has no geometry."""
+        idx = np.searchsorted(self.node_ids, node_id)
+        if idx < len(self.node_ids) and self.node_ids[idx] == node_id:
+            x, y = self.xy[idx]
+            return float(x), float(y)
+        return None
+
+class LoadedGraph:
+    """
+    Everything load_graph builds, published as one object and never changed
+    afterwards. A search takes the current one once and only uses that, so a
+    reload swapping in a new one cannot mix parts of two graphs in a search.
+    """
+    def __init__(self, graph, csr: CSRGraph, chains: ChainGraph, coords: NodeCoordinates,
+                 hierarchy: ContractionHierarchy = None, links: LinkGeometryStore = None,
+                 link_index: LinkIndex = None, import_id: int = None):
+        self.graph = graph
+        self.csr = csr
+        self.chains = chains
+        self.coords = coords
+        self.hierarchy = hierarchy
+        self.links = links
+        self.link_index = link_index
+        # The import the graph was read from, as recorded in its snapshot.
+        self.import_id = import_id
+
+    def search_csr(self) -> CSRGraph:
+        """The CSR graph point-to-point searches and the hierarchy are built on."""
+        return self.chains.graph if self.chains is not None else self.csr
+
+    def is_routable(self, f_node: int, t_node: int) -> bool:
+        """Whether a link between these nodes is part of the graph, i.e. was not pruned with its component."""
+        return self.csr.index_of(f_node) is not None and self.csr.index_of(t_node) is not None
 
 class GraphManager:
-    def __init__(self):
+    # What load_graph builds, held on the manager only until it is published as a LoadedGraph.
+    _BUILT = ("_graph", "_csr", "_chains", "_coords", "_hierarchy", "_links", "_link_index", "_import_id")
+
+    def __init__(self, engine: str = None, snapshot_path: str = None, link_geometry_mode: str = None):
+        self.engine = engine or config.GRAPH_ENGINE
+        self.snapshot_path = snapshot_path or config.GRAPH_SNAPSHOT_PATH
+        self.link_geometry_mode = link_geometry_mode or config.LINK_GEOMETRY_MODE
+        # The graph requests see; replaced as a whole on reload.
+        self._state = None
         self._graph = None
+        self._csr = None
+        self._chains = None
+        self._coords = None
+        self._hierarchy = None
+        self._links = None
+        self._link_index = None
+        self._import_id = None
+        self._reload_listeners = []
+        self._reload_lock = threading.Lock()
 
     def load_graph(self, db: Session):
-        if self._graph is None:
-            print("Loading graph from database...")
-            G = nx.DiGraph()
-            links = db.query(Link.F_NODE, Link.T_NODE, Link.LENGTH).all()
-            for link in links:
-                G.add_edge(link.F_NODE, link.T_NODE, weight=link.LENGTH)
-            self._graph = G
-            print(f"Graph loaded: {self._graph.number_of_nodes()} nodes, {self._graph.number_of_edges()} edges.")
+        if self._state is None:
+            # Read before the graph: an import committing in between then only makes the snapshot stale.
+            import_id = self._last_import_id(db)
+            if not self._load_snapshot(db):
+                self._load_from_db(db)
+                self._save_snapshot(import_id)
+            self._import_id = import_id
 
-    def get_graph(self):
-        if self._graph is None:
+            # Point-to-point searches run on the chain-compressed graph.
+            if self.engine == "csr":
+                self._graph = self._search_csr()
+            else:
+                self._graph = self._search_csr().to_networkx()
+            logger.info("Graph loaded (%s): %d nodes, %d edges, searched as %d nodes, %d edges.", self.engine,
+                        self._csr.number_of_nodes(), self._csr.number_of_edges(),
+                        self._graph.number_of_nodes(), self._graph.number_of_edges())
+
+            self._hierarchy = self._load_hierarchy()
+
+            if self.link_geometry_mode == "memory":
+                self._load_links(db)
+
+            self._publish()
+
+    def reload(self, db: Session) -> bool:
+        """
+        Builds the graph again from the latest snapshot or import next to the
+        one being served, then swaps it in at once. Requests keep searching the
+        old graph until the swap, and a failed reload leaves it in place.
+        Returns False without doing anything if a reload is already running.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            staged = GraphManager(self.engine, self.snapshot_path, self.link_geometry_mode)
+            staged.load_graph(db)
+            self._publish(staged.get_state())
+            logger.info("Graph reloaded and swapped in.")
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def is_reloading(self) -> bool:
+        return self._reload_lock.locked()
+
+    def add_reload_listener(self, callback):
+        """Registers a callback run whenever a graph is (re)loaded, e.g. to clear caches."""
+        self._reload_listeners.append(callback)
+
+    def _publish(self, state: LoadedGraph = None):
+        """
+        Makes state, by default the graph just built on this manager, the one
+        requests see. A single reference assignment, so other threads see either
+        the old graph or the new one. Then runs the reload listeners.
+        """
+        if state is None:
+            state = LoadedGraph(**{name[1:]: getattr(self, name) for name in self._BUILT})
+            # Not kept here too, so the graph is freed once a reload replaces it.
+            for name in self._BUILT:
+                setattr(self, name, None)
+        self._state = state
+        for callback in self._reload_listeners:
+            callback()
+
+    def _load_from_db(self, db: Session):
+        logger.info("Loading graph from database...")
+        nodes = db.query(Node.NODE_ID, func.ST_X(Node.geom), func.ST_Y(Node.geom)).filter(Node.geom.isnot(None)).all()
+        node_ids = np.fromiter((node[0] for node in nodes), dtype=np.int64, count=len(nodes))
+        xy = np.array([(node[1], node[2]) for node in nodes], dtype=np.float64).reshape(-1, 2)
+        self._coords = NodeCoordinates(node_ids, xy)
+        logger.info("Node coordinates loaded: %d nodes.", len(self._coords))
+
+        links = self._query_links(db)
+        f_nodes = np.fromiter((link.F_NODE for link in links), dtype=np.int64, count=len(links))
+        t_nodes = np.fromiter((link.T_NODE for link in links), dtype=np.int64, count=len(links))
+        lengths = np.fromiter((link.LENGTH for link in links), dtype=np.float64, count=len(links))
+        profiles = {}
+        if links and hasattr(links[0], "ROAD_RANK"):
+            link_ids = np.fromiter((link.LINK_ID for link in links), dtype=np.int64, count=len(links))
+            profiles = link_profiles(link_ids, lengths, [link.ROAD_RANK for link in links],
+                                     [link.MAX_SPD for link in links], config.TRAFFIC_PROFILES_PATH)
+        # The compact CSR form is always kept; the chain-compressed search graph is built from it.
+        csr = CSRGraph.from_edges(f_nodes, t_nodes, lengths, self._coords, profiles)
+        logger.info("Cost profiles: %s.", ", ".join(csr.profiles))
+
+        # Drop components too small to route through. They are numbered by size, so the
+        # ones kept are always 0 to kept - 1.
+        components = csr.strongly_connected_components()
+        kept = int(np.count_nonzero(np.bincount(components) >= config.GRAPH_MIN_COMPONENT_NODES)) or 1
+        keep = components < kept
+        if not keep.all():
+            routable = np.isin(f_nodes, csr.node_ids[keep]) & np.isin(t_nodes, csr.node_ids[keep])
+            logger.info("Dropped %d nodes in %d strongly connected components below %d nodes, %d components kept.",
+                        np.count_nonzero(~keep), components.max() + 1 - kept, config.GRAPH_MIN_COMPONENT_NODES, kept)
+            csr = CSRGraph.from_edges(f_nodes[routable], t_nodes[routable], lengths[routable], self._coords,
+                                      {name: weights[routable] for name, weights in profiles.items()})
+            components = components[keep]
+        self._csr = csr
+        self._chains = ChainGraph.build(csr, components)
+
+    def _query_links(self, db: Session) -> list:
+        """Link rows with the road attributes travel time profiles need, or without them if they were not imported."""
+        try:
+            return db.query(Link.LINK_ID, Link.F_NODE, Link.T_NODE, Link.LENGTH, Link.ROAD_RANK, Link.MAX_SPD).all()
+        except SQLAlchemyError:
+            db.rollback()
+            logger.warning("Links have no ROAD_RANK/MAX_SPD columns, routing by distance only. Rerun scripts/import_data.py.")
+            return db.query(Link.F_NODE, Link.T_NODE, Link.LENGTH).all()
+
+    def _fresh_snapshot(self, db: Session, path: str):
+        """
+        Returns the arrays of the snapshot at path if it exists and was built
+        from the data of the last import. Imports are compared by id rather than
+        time, since an import is one long transaction and its rows only appear
+        when it commits.
+        """
+        snapshot = load_snapshot(path)
+        if snapshot is None:
+            logger.info("No usable snapshot at %s.", path)
+            return None
+        created_at, arrays, meta = snapshot
+
+        last_import = self._last_import_id(db)
+        if meta.get("import_id") != last_import:
+            logger.info("Snapshot at %s was built before the last import (id %s).", path, last_import)
+            return None
+        logger.info("Mapped snapshot %s (created %s).", path, created_at)
+        return arrays
+
+    def _load_snapshot(self, db: Session) -> bool:
+        """Maps the graph from its snapshot file if it is fresh."""
+        arrays = self._fresh_snapshot(db, self.snapshot_path)
+        if arrays is None:
+            return False
+        self._use_snapshot_arrays(arrays)
+        if self._chains is None:
+            logger.info("Snapshot at %s has no chain compression.", self.snapshot_path)
+            return False
+        return True
+
+    def _use_snapshot_arrays(self, arrays: dict):
+        self._coords = NodeCoordinates(arrays["coord_node_ids"], arrays["coord_xy"], presorted=True)
+        profiles = {name[len("profile_"):]: weights for name, weights in arrays.items() if name.startswith("profile_")}
+        self._csr = CSRGraph(arrays["node_ids"], arrays["offsets"], arrays["targets"], arrays["weights"], arrays["xy"], profiles)
+        self._chains = ChainGraph.from_arrays(self._csr, arrays)
+
+    def attach_snapshot(self, import_id: int = None):
+        """
+        Maps the graph and hierarchy read-only from the snapshot files without
+        touching the database. Used by routing worker processes, which always
+        search the CSR arrays so the mapped pages stay shared between them.
+        Raises RuntimeError unless the snapshot was built from the import with
+        import_id, i.e. holds the same graph as the API process.
+        """
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is None:
+            raise RuntimeError(f"No usable graph snapshot at {self.snapshot_path}.")
+        if snapshot[2].get("import_id") != import_id:
+            raise RuntimeError(f"Graph snapshot at {self.snapshot_path} was built from import "
+                               f"{snapshot[2].get('import_id')}, not {import_id}.")
+        self._import_id = import_id
+        self._use_snapshot_arrays(snapshot[1])
+        self._graph = self._search_csr()
+        self._hierarchy = self._load_hierarchy()
+        self._publish()
+
+    def _save_snapshot(self, import_id: int = None):
+        self._write_snapshot(self.snapshot_path, import_id, {
+            "coord_node_ids": self._coords.node_ids,
+            "coord_xy": self._coords.xy,
+            "node_ids": self._csr.node_ids,
+            "offsets": self._csr.offsets,
+            "targets": self._csr.targets,
+            "weights": self._csr.weights,
+            "xy": self._csr.xy,
+            **{f"profile_{name}": weights for name, weights in self._csr.profiles.items() if name != DISTANCE},
+            **self._chains.arrays(),
+        })
+
+    def _write_snapshot(self, path: str, import_id: int, arrays: dict):
+        """Saves arrays read from the database as of the import with this id."""
+        try:
+            save_snapshot(path, arrays, meta={"import_id": import_id})
+            logger.info("Snapshot written to %s.", path)
+        except OSError as e:
+            # Not fatal: the next worker start just loads from the database again.
+            logger.warning("Could not write snapshot to %s: %s", path, e)
+
+    def _load_links(self, db: Session):
+        """Loads every link geometry into a LinkGeometryStore and indexes it for snapping."""
+        arrays = self._fresh_snapshot(db, config.LINK_SNAPSHOT_PATH)
+        if arrays is not None:
+            self._links = LinkGeometryStore(**arrays)
+        else:
+            logger.info("Loading link geometries from database...")
+            import_id = self._last_import_id(db)
+            rows = db.query(
+                Link.LINK_ID, Link.F_NODE, Link.T_NODE, Link.LENGTH, func.ST_AsBinary(func.ST_Force2D(Link.geom))
+            ).order_by(Link.LINK_ID).yield_per(50000)
+            self._links = LinkGeometryStore.from_rows(rows)
+            self._write_snapshot(config.LINK_SNAPSHOT_PATH, import_id, self._links.arrays())
+        # Links dropped with their component are left out, so points never snap onto them.
+        routable = np.isin(self._links.f_nodes, self._csr.node_ids) & np.isin(self._links.t_nodes, self._csr.node_ids)
+        self._link_index = LinkIndex(self._links, mask=routable)
+        logger.info("Link geometries loaded: %d links, %d vertices.", len(self._links), len(self._links.xy))
+
+    def _last_import_id(self, db: Session):
+        """Id of the latest recorded import, or None if the database has no import log."""
+        try:
+            return db.query(func.max(DataImport.id)).scalar()
+        except SQLAlchemyError:
+            db.rollback()
+            return None
+
+    def _load_hierarchy(self):
+        hierarchy = ContractionHierarchy.load(config.CH_PATH)
+        if hierarchy is None:
+            logger.info("No contraction hierarchy at %s, routing with A*.", config.CH_PATH)
+            return None
+        if hierarchy.fingerprint != graph_fingerprint(self._search_csr()):
+            logger.warning("Contraction hierarchy at %s is out of date, routing with A*. Rerun scripts/build_ch.py.", config.CH_PATH)
+            return None
+        logger.info("Contraction hierarchy loaded: %d shortcuts.", hierarchy.number_of_shortcuts())
+        return hierarchy
+
+    def _search_csr(self) -> CSRGraph:
+        """The CSR graph point-to-point searches and the hierarchy are built on, while building."""
+        return self._chains.graph if self._chains is not None else self._csr
+
+    def is_loaded(self) -> bool:
+        return self._state is not None
+
+    def get_state(self) -> LoadedGraph:
+        """
+        The loaded graph as a whole. Code using more than one part of it should
+        take it once and read the parts from it, as a reload can replace it at
+        any time; the getters below each read the current one.
+        """
+        state = self._state
+        if state is None:
             raise RuntimeError("Graph is not loaded. Call load_graph first.")
-        return self._graph
+        return state
+
+    def get_graph(self):
+        return self.get_state().graph
+
+    def get_csr(self):
+        return self.get_state().csr
+
+    def get_chains(self):
+        """Returns the chain-compressed search graph, or None if the graph was loaded without one."""
+        return self.get_state().chains
+
+    def is_routable(self, f_node: int, t_node: int) -> bool:
+        """Whether a link between these nodes is part of the loaded graph, i.e. was not pruned with its component."""
+        return self.get_state().is_routable(f_node, t_node)
+
+    def get_profiles(self) -> list[str]:
+        """Names of the cost profiles routes can be searched with."""
+        return list(self.get_csr().profiles)
+
+    def get_node_coordinates(self):
+        return self.get_state().coords
+
+    def get_link_index(self):
+        """Returns the in-memory link index, or None when snapping is left to PostGIS."""
+        return self.get_state().link_index
+
+    def get_link_geometries(self):
+        """Returns the in-memory link geometry store, or None when geometry is built by PostGIS."""
+        return self.get_state().links
+
+    def get_import_id(self):
+        """Id of the import the loaded graph was read from, or None if the database has no import log."""
+        return self.get_state().import_id
+
+    def get_hierarchy(self):
+        """Returns the contraction hierarchy for the loaded graph, or None if there is none."""
+        return self.get_state().hierarchy
 
 # Create a single instance of the graph manager
 graph_manager = GraphManager()
@@ -0,0 +1,394 @@
+import math
+
+import numpy as np
+from pyproj import Transformer
+
+# Request points arrive in WGS84 while link geometries are stored in EPSG:5186.
+_to_5186 = Transformer.from_crs(4326, 5186, always_xy=True)
+_to_4326 = Transformer.from_crs(5186, 4326, always_xy=True)
+
+def to_5186(lons, lats) -> np.ndarray:
+    """Projects WGS84 longitudes and latitudes to an (n, 2) EPSG:5186 array."""
+    x, y = _to_5186.transform(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+    return np.column_stack([x, y])
+
+def to_wgs84(xy: np.ndarray) -> np.ndarray:
+    """Projects an (n, 2) EPSG:5186 array to (n, 2) WGS84 longitudes and latitudes."""
+    lon, lat = _to_4326.transform(xy[:, 0], xy[:, 1])
+    return np.column_stack([lon, lat])
+
+def to_wgs84_linestring(xy: np.ndarray) -> dict:
+    """Reprojects EPSG:5186 vertices to a GeoJSON LineString in WGS84, dropping repeated vertices."""
+    if len(xy) > 1:
+        keep = np.ones(len(xy), dtype=bool)
+        keep[1:] = np.any(xy[1:] != xy[:-1], axis=1)
+        xy = xy[keep]
+    lon, lat = _to_4326.transform(xy[:, 0], xy[:, 1])
+    return {"type": "LineString", "coordinates": np.column_stack([lon, lat]).tolist()}
+
+def to_wgs84_multilinestring(parts: list[np.ndarray]) -> dict:
+    """Reprojects EPSG:5186 lines to a GeoJSON MultiLineString in WGS84 with a single transform."""
+    if not parts:
+        return {"type": "MultiLineString", "coordinates": []}
+    xy = np.concatenate(parts)
+    lon, lat = _to_4326.transform(xy[:, 0], xy[:, 1])
+    coords = np.column_stack([lon, lat]).tolist()
+    bounds = np.cumsum([0] + [len(part) for part in parts]).tolist()
+    return {"type": "MultiLineString", "coordinates": [coords[a:b] for a, b in zip(bounds, bounds[1:])]}
+
+class LinkGeometryStore:
+    """
+    All link geometries in EPSG:5186 as flat arrays: link i has the attributes
+    link_ids[i], f_nodes[i], t_nodes[i] and lengths[i], and its vertices are
+    xy[offsets[i]:offsets[i + 1]].
+    """
+    def __init__(self, link_ids, f_nodes, t_nodes, lengths, offsets, xy):
+        self.link_ids = link_ids
+        self.f_nodes = f_nodes
+        self.t_nodes = t_nodes
+        self.lengths = lengths
+        self.offsets = offsets
+        self.xy = xy
+
+        # (F_NODE, T_NODE) lookup: node pairs are packed into one sorted int64 key over
+        # dense node indices. Parallel links resolve to the shortest one, like CSRGraph.
+        self._node_ids = np.unique(np.concatenate([f_nodes, t_nodes]))
+        keys = self._pair_keys(f_nodes, t_nodes)
+        order = np.lexsort((lengths, keys))
+        keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        self._pair_keys_sorted = keys[first]
+        self._pair_links = order[first]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Builds the store from (LINK_ID, F_NODE, T_NODE, LENGTH, WKB) rows of 2D LineStrings."""
+        link_ids, f_nodes, t_nodes, lengths, parts = [], [], [], [], []
+        for link_id, f_node, t_node, length, wkb in rows:
+            wkb = bytes(wkb)
+            # LineString WKB: byte order, geometry type, point count, then x/y doubles.
+            dtype = '<f8' if wkb[0] == 1 else '>f8'
+            parts.append(np.frombuffer(wkb, dtype=dtype, offset=9).reshape(-1, 2))
+            link_ids.append(link_id)
+            f_nodes.append(f_node)
+            t_nodes.append(t_node)
+            lengths.append(length)
+
+        offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([len(part) for part in parts], out=offsets[1:])
+        xy = np.concatenate(parts).astype(np.float64) if parts else np.empty((0, 2))
+        return cls(
+            np.array(link_ids, dtype=np.int64),
+            np.array(f_nodes, dtype=np.int64),
+            np.array(t_nodes, dtype=np.int64),
+            np.array(lengths, dtype=np.float64),
+            offsets,
+            xy,
+        )
+
+    def __len__(self):
+        return len(self.link_ids)
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return {
+            "link_ids": self.link_ids,
+            "f_nodes": self.f_nodes,
+            "t_nodes": self.t_nodes,
+            "lengths": self.lengths,
+            "offsets": self.offsets,
+            "xy": self.xy,
+        }
+
+    def coordinates(self, link: int) -> np.ndarray:
+        return self.xy[self.offsets[link]:self.offsets[link + 1]]
+
+    def link_of_vertex(self, vertex):
+        """Maps vertex indices into xy back to the links they belong to."""
+        return np.searchsorted(self.offsets, vertex, side='right') - 1
+
+    def index_of_link(self, link_id: int):
+        """Position of a LINK_ID in the store (links are stored in LINK_ID order), or None."""
+        idx = int(np.searchsorted(self.link_ids, link_id))
+        if idx < len(self.link_ids) and self.link_ids[idx] == link_id:
+            return idx
+        return None
+
+    def _pair_keys(self, f_nodes, t_nodes):
+        n = len(self._node_ids)
+        f_idx = np.searchsorted(self._node_ids, f_nodes).clip(max=max(n - 1, 0))
+        t_idx = np.searchsorted(self._node_ids, t_nodes).clip(max=max(n - 1, 0))
+        keys = f_idx.astype(np.int64) * n + t_idx
+        # Pairs with an unknown node get a key no link can have.
+        unknown = (self._node_ids[f_idx] != f_nodes) | (self._node_ids[t_idx] != t_nodes)
+        keys[unknown] = -1
+        return keys
+
+    def find_links(self, f_nodes, t_nodes) -> np.ndarray:
+        """Link positions for each (F_NODE, T_NODE) pair, -1 where no link joins them."""
+        f_nodes = np.asarray(f_nodes, dtype=np.int64)
+        t_nodes = np.asarray(t_nodes, dtype=np.int64)
+        if len(f_nodes) == 0 or len(self._node_ids) == 0:
+            return np.full(len(f_nodes), -1, dtype=np.int64)
+        keys = self._pair_keys(f_nodes, t_nodes)
+        pos = np.searchsorted(self._pair_keys_sorted, keys).clip(max=len(self._pair_keys_sorted) - 1)
+        found = (self._pair_keys_sorted[pos] == keys) & (keys >= 0)
+        return np.where(found, self._pair_links[pos], -1)
+
+    def substring(self, link: int, start_fraction: float, end_fraction: float) -> np.ndarray:
+        """
+        Vertices of the part of a link between two fractions of its 2D length,
+        like ST_LineSubstring, but also allowing start > end for the reversed part.
+        """
+        coords = self.coordinates(link)
+        lo, hi = sorted((start_fraction, end_fraction))
+        seg_lengths = np.hypot(*np.diff(coords, axis=0).T)
+        cum = np.concatenate([[0.0], np.cumsum(seg_lengths)])
+        total = cum[-1]
+        if total == 0:
+            return coords[:1]
+
+        def point_at(distance):
+            k = min(int(np.searchsorted(cum, distance, side='right')) - 1, len(seg_lengths) - 1)
+            t = (distance - cum[k]) / seg_lengths[k] if seg_lengths[k] > 0 else 0.0
+            return coords[k] + t * (coords[k + 1] - coords[k])
+
+        d0, d1 = lo * total, hi * total
+        inner = coords[(cum > d0) & (cum < d1)]
+        part = np.vstack([point_at(d0), inner, point_at(d1)])
+        return part[::-1] if start_fraction > end_fraction else part
+
+    def path_geometry(self, start_info: dict, end_info: dict, main_path_nodes: list[int]):
+        """
+        In-memory equivalent of the SQL in pathfinder.get_full_path_geometry_and_length:
+        the part of the start link from the snapped point to the first path node,
+        the links along the path, then the part of the end link up to the snapped
+        end point. Returns the EPSG:5186 vertices, or None if a link is missing.
+        """
+        start_link = self.index_of_link(start_info['link_id'])
+        end_link = self.index_of_link(end_info['link_id'])
+        path_links = self.find_links(main_path_nodes[:-1], main_path_nodes[1:])
+        if start_link is None or end_link is None or (path_links < 0).any():
+            return None
+
+        start_node, end_node = main_path_nodes[0], main_path_nodes[-1]
+        parts = [self.substring(start_link, start_info['fraction'], 0.0 if start_node == self.f_nodes[start_link] else 1.0)]
+        parts.extend(self.coordinates(link) for link in path_links.tolist())
+        parts.append(self.substring(end_link, 0.0 if end_node == self.f_nodes[end_link] else 1.0, end_info['fraction']))
+        return np.vstack(parts)
+
+class LinkIndex:
+    """
+    Uniform grid over link segments for nearest-link queries. Every segment is
+    registered in each cell its bounding box touches; segments are identified by
+    the index of their first vertex in the store's xy array. If mask is given,
+    only the links where it is True are indexed.
+    """
+    def __init__(self, store: LinkGeometryStore, cell_size: float = 250.0, max_radius: float = 50000.0,
+                 mask: np.ndarray = None):
+        self.store = store
+        self.cell_size = cell_size
+        self.max_rings = int(math.ceil(max_radius / cell_size))
+
+        # Every vertex except the last one of each link starts a segment.
+        is_start = np.ones(len(store.xy), dtype=bool)
+        is_start[store.offsets[1:] - 1] = False
+        if mask is not None:
+            is_start &= np.repeat(mask, np.diff(store.offsets))
+        starts = np.flatnonzero(is_start)
+        a = store.xy[starts]
+        b = store.xy[starts + 1]
+        lo = np.floor(np.minimum(a, b) / cell_size).astype(np.int64)
+        hi = np.floor(np.maximum(a, b) / cell_size).astype(np.int64)
+
+        # Expand each segment into one entry per covered cell.
+        spans = hi - lo + 1
+        counts = spans[:, 0] * spans[:, 1]
+        seg = np.repeat(np.arange(len(starts)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cx = lo[seg, 0] + local % spans[seg, 0]
+        cy = lo[seg, 1] + local // spans[seg, 0]
+
+        keys = self._key(cx, cy)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        self.segments = starts[seg[order]]
+        self.cell_keys, first = np.unique(keys, return_index=True)
+        self.cell_offsets = np.append(first, len(keys)).astype(np.int64)
+        self._along_lengths = None
+        self._link_lengths = None
+
+    @staticmethod
+    def _key(cx, cy):
+        # EPSG:5186 coordinates are positive and well below 2**31 cells per axis.
+        return (cx << 32) + cy
+
+    def _cells(self, cx: int, cy: int, ring: int) -> np.ndarray:
+        """Segments registered in the cells at Chebyshev distance `ring` from (cx, cy)."""
+        if ring == 0:
+            xs, ys = np.array([cx]), np.array([cy])
+        else:
+            side = np.arange(-ring, ring + 1)
+            inner = side[1:-1]
+            xs = np.concatenate([side, side, np.full(len(inner), -ring), np.full(len(inner), ring)]) + cx
+            ys = np.concatenate([np.full(len(side), -ring), np.full(len(side), ring), inner, inner]) + cy
+        keys = self._key(xs, ys)
+        pos = np.searchsorted(self.cell_keys, keys)
+        found = pos < len(self.cell_keys)
+        found[found] = self.cell_keys[pos[found]] == keys[found]
+        pos = pos[found]
+        if len(pos) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([self.segments[self.cell_offsets[p]:self.cell_offsets[p + 1]] for p in pos])
+
+    def nearest(self, x: float, y: float):
+        """
+        Returns (link, segment start vertex, t along segment, distance) for the
+        segment closest to (x, y) in EPSG:5186, or None if none is within range.
+        """
+        cx = int(math.floor(x / self.cell_size))
+        cy = int(math.floor(y / self.cell_size))
+        xy = self.store.xy
+        best = None
+        for ring in range(self.max_rings + 1):
+            segments = self._cells(cx, cy, ring)
+            if len(segments):
+                a = xy[segments]
+                d = xy[segments + 1] - a
+                seg_len2 = (d * d).sum(axis=1)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    t = ((x - a[:, 0]) * d[:, 0] + (y - a[:, 1]) * d[:, 1]) / seg_len2
+                t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+                px = a[:, 0] + t * d[:, 0] - x
+                py = a[:, 1] + t * d[:, 1] - y
+                dist2 = px * px + py * py
+                # Ties go to the lowest vertex index, so the result does not depend on cell order.
+                i = np.lexsort((segments, dist2))[0]
+                candidate = (float(dist2[i]), int(segments[i]), float(t[i]))
+                if best is None or candidate < best:
+                    best = candidate
+            # Anything in cells outside this ring is farther than ring * cell_size.
+            if best is not None and math.sqrt(best[0]) <= ring * self.cell_size:
+                break
+        if best is None:
+            return None
+        dist2, vertex, t = best
+        return int(self.store.link_of_vertex(vertex)), vertex, t, math.sqrt(dist2)
+
+    def _along(self):
+        """
+        2D length of each link's geometry up to every vertex, and in total,
+        computed on first use.
+        """
+        if self._along_lengths is None:
+            store = self.store
+            seg_lengths = np.hypot(*np.diff(store.xy, axis=0).T)
+            # The step from the last vertex of a link to the first of the next is not a segment.
+            seg_lengths[store.offsets[1:-1] - 1] = 0.0
+            along = np.concatenate([[0.0], np.cumsum(seg_lengths)])
+            along -= np.repeat(along[store.offsets[:-1]], np.diff(store.offsets))
+            self._along_lengths = along
+            self._link_lengths = along[np.maximum(store.offsets[1:] - 1, 0)]
+        return self._along_lengths, self._link_lengths
+
+    def _fraction(self, link, vertex, t):
+        """Fraction of the 2D geometry length up to a point on a segment, as ST_LineLocatePoint does."""
+        along, totals = self._along()
+        seg_lengths = along[vertex + 1] - along[vertex]
+        total = totals[link]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(total > 0, (along[vertex] + t * seg_lengths) / total, 0.0)
+
+    def candidates(self, xy: np.ndarray, radius: float, limit: int, chunk: int = 4096) -> list[list[dict]]:
+        """
+        For each of many (n, 2) EPSG:5186 points, the closest point of every link
+        within radius meters, nearest first and at most limit of them, for map
+        matching. Each is a dict with the link attributes, its fraction, distance
+        and EPSG:5186 position. Points are handled chunk at a time with array
+        operations.
+        """
+        results = []
+        for first in range(0, len(xy), chunk):
+            results.extend(self._chunk_candidates(np.asarray(xy[first:first + chunk]), radius, limit))
+        return results
+
+    def _chunk_candidates(self, points: np.ndarray, radius: float, limit: int) -> list[list[dict]]:
+        store = self.store
+        results = [[] for _ in range(len(points))]
+
+        # Every (point, cell) pair for the cells covering the radius box around each point,
+        # then every (point, segment) pair.
+        side = np.arange(int(math.ceil(2 * radius / self.cell_size)) + 1)
+        lo = np.floor((points - radius) / self.cell_size).astype(np.int64)
+        cx = (lo[:, 0, None] + np.repeat(side, len(side))).ravel()
+        cy = (lo[:, 1, None] + np.tile(side, len(side))).ravel()
+        keys = self._key(cx, cy)
+        pos = np.searchsorted(self.cell_keys, keys).clip(max=max(len(self.cell_keys) - 1, 0))
+        found = np.flatnonzero(self.cell_keys[pos] == keys) if len(self.cell_keys) else np.empty(0, dtype=np.int64)
+        pos = pos[found]
+        counts = self.cell_offsets[pos + 1] - self.cell_offsets[pos]
+        entries = np.repeat(self.cell_offsets[pos] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        owners = np.repeat(found // len(side) ** 2, counts)
+        segments = self.segments[entries]
+
+        a = store.xy[segments]
+        d = store.xy[segments + 1] - a
+        p = points[owners]
+        seg_len2 = (d * d).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = ((p - a) * d).sum(axis=1) / seg_len2
+        t = np.clip(np.nan_to_num(t), 0.0, 1.0)
+        snapped = a + t[:, None] * d
+        dist = np.hypot(*(snapped - p).T)
+
+        # Nearest segment of each (point, link) first, then up to limit links per point, nearest first.
+        within = np.flatnonzero(dist <= radius)
+        within = within[np.lexsort((segments[within], dist[within], owners[within]))]
+        links = store.link_of_vertex(segments[within])
+        _, first = np.unique(owners[within] * len(store) + links, return_index=True)
+        keep = np.sort(first)
+        within, links = within[keep], links[keep]
+        starts = np.searchsorted(owners[within], owners[within])
+        rank = np.arange(len(within)) - starts
+        within, links = within[rank < limit], links[rank < limit]
+
+        fractions = self._fraction(links, segments[within], t[within])
+        for owner, link, fraction, distance, (x, y) in zip(
+            owners[within].tolist(), links.tolist(), fractions.tolist(), dist[within].tolist(), snapped[within].tolist()
+        ):
+            results[owner].append({
+                "link_id": int(store.link_ids[link]),
+                "f_node": int(store.f_nodes[link]),
+                "t_node": int(store.t_nodes[link]),
+                "link_length": float(store.lengths[link]),
+                "fraction": fraction,
+                "distance": distance,
+                "x": x,
+                "y": y,
+            })
+        return results
+
+    def snap(self, lon: float, lat: float):
+        """
+        In-memory equivalent of pathfinder.find_nearest_link_and_snapped_point:
+        returns the same dict for the link closest to a WGS84 point.
+        """
+        x, y = _to_5186.transform(lon, lat)
+        found = self.nearest(x, y)
+        if found is None:
+            return None
+        link, vertex, t, _ = found
+        store = self.store
+        fraction = float(self._fraction(link, vertex, t))
+
+        a, b = store.xy[vertex], store.xy[vertex + 1]
+        sx, sy = a + t * (b - a)
+        return {
+            "link_id": int(store.link_ids[link]),
+            "f_node": int(store.f_nodes[link]),
+            "t_node": int(store.t_nodes[link]),
+            "link_length": float(store.lengths[link]),
+            "snapped_point_wkt": f"POINT({float(sx)} {float(sy)})",
+            "fraction": float(fraction),
+            "user_point_wkt": f"SRID=4326;POINT({lon} {lat})",
+        }
@@ -0,0 +1,258 @@
+import json
+import math
+import time
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import config
+from .cache import LRUCache
+from .graph import graph_manager
+from .links import LinkGeometryStore, to_wgs84
+
+# Shortest paths between candidate links: (exit node, entry node) -> (cost, node path, bound searched),
+# with an infinite cost and no path if the entry was not reached within the bound. Shared by
+# consecutive fixes and repeated traces, and emptied whenever the graph is reloaded.
+transition_cache = LRUCache(config.MATCH_CACHE_SIZE)
+graph_manager.add_reload_listener(transition_cache.clear)
+
+# A transition may drive at most this many times the straight-line distance between two fixes,
+# plus twice the candidate radius; anything longer is treated as impossible.
+_MAX_DETOUR_FACTOR = 2.0
+
+def _node_paths(csr, exit_node: int, entry_nodes: set, max_cost: float, generation: int) -> dict[int, tuple]:
+    """
+    (cost, node path) from exit_node to each entry node reachable within
+    max_cost, through transition_cache. generation is the cache's generation
+    from before csr was read.
+    """
+    results = {}
+    missing = []
+    for node in entry_nodes:
+        cached = transition_cache.get((exit_node, node))
+        if cached is None or (cached[1] is None and cached[2] < max_cost):
+            missing.append(node)
+        elif cached[0] <= max_cost:
+            results[node] = cached[:2]
+    if missing:
+        found = csr.paths_from(exit_node, missing, max_cost)
+        for node in missing:
+            cost, path = found.get(node, (math.inf, None))
+            transition_cache.put((exit_node, node), (cost, path, max_cost), generation)
+            if path is not None:
+                results[node] = (cost, path)
+    return results
+
+def _transition_pieces(a: dict, b: dict, path: list) -> list[tuple]:
+    """
+    Link parts driven from candidate a to candidate b as (LINK_ID or None,
+    F_NODE, T_NODE, start fraction, end fraction); links between the two are
+    only known by their nodes. A small step back along the same link, which
+    is GPS noise, drives nothing.
+    """
+    if path is None:
+        if b['fraction'] > a['fraction']:
+            return [(a['link_id'], a['f_node'], a['t_node'], a['fraction'], b['fraction'])]
+        return []
+    pieces = [(a['link_id'], a['f_node'], a['t_node'], a['fraction'], 1.0)]
+    pieces.extend((None, u, v, 0.0, 1.0) for u, v in zip(path, path[1:]))
+    pieces.append((b['link_id'], b['f_node'], b['t_node'], 0.0, b['fraction']))
+    return [piece for piece in pieces if piece[4] > piece[3]]
+
+def _backtrack(history: list, scores: list, chosen: list, segments: list) -> float:
+    """Follows the Viterbi back pointers of a finished segment, recording its choices and link parts."""
+    q = int(np.argmax(scores))
+    pieces = []
+    distance = 0.0
+    for fix, candidates, back, routes in reversed(history):
+        chosen[fix] = candidates[q]
+        if back is not None:
+            p = back[q]
+            route, path, previous = routes[q]
+            pieces[:0] = _transition_pieces(previous[p], candidates[q], path)
+            distance += route
+            q = p
+    merged = []
+    for piece in pieces:
+        last = merged[-1] if merged else None
+        if last is not None and piece[0] is not None and piece[0] == last[0] and piece[3] == last[4]:
+            merged[-1] = last[:4] + (piece[4],)
+        else:
+            merged.append(piece)
+    if merged:
+        segments.append(merged)
+    return distance
+
+def match_trace(xy: np.ndarray, candidates: list[list[dict]]) -> dict:
+    """
+    Hidden Markov model map matching (Newson & Krumm) of one trace of EPSG:5186
+    fixes, given the candidate links of each fix from link_candidates.
+    Emissions fall off with the GPS distance to a candidate (MATCH_GPS_SIGMA_M),
+    and transitions with the difference between the driving distance and the
+    straight-line distance between fixes (MATCH_BETA_M). Fixes within two sigma
+    of the previous one are matched like it, and where no transition is possible
+    the trace is split and matching starts again.
+    Returns the chosen candidate per fix (None where there was none), the
+    driven link parts of each matched segment and the total driven distance.
+    """
+    sigma = config.MATCH_GPS_SIGMA_M
+    beta = config.MATCH_BETA_M
+    radius = config.MATCH_SEARCH_RADIUS_M
+    generation = transition_cache.generation
+    csr = graph_manager.get_csr()
+
+    chosen = [None] * len(xy)
+    followers = {}
+    segments = []
+    distance = 0.0
+    history = []
+    scores = None
+    last = None
+    for i, fix_candidates in enumerate(candidates):
+        if not fix_candidates:
+            continue
+        if last is not None and math.hypot(*(xy[i] - xy[last])) < 2 * sigma:
+            followers[i] = last
+            continue
+        emission = [-0.5 * (c['distance'] / sigma) ** 2 for c in fix_candidates]
+        if scores is None:
+            history = [(i, fix_candidates, None, None)]
+            scores = emission
+            last = i
+            continue
+
+        previous = history[-1][1]
+        straight = math.hypot(*(xy[i] - xy[last]))
+        max_route = _MAX_DETOUR_FACTOR * straight + 2 * radius
+        best = [-math.inf] * len(fix_candidates)
+        back = [None] * len(fix_candidates)
+        routes = [None] * len(fix_candidates)
+        for p, a in enumerate(previous):
+            if scores[p] == -math.inf:
+                continue
+            exit_cost = (1 - a['fraction']) * a['link_length']
+            entries = {b['f_node'] for b in fix_candidates if b['link_id'] != a['link_id']}
+            node_paths = _node_paths(csr, a['t_node'], entries, max_route - exit_cost, generation) if entries else {}
+            for q, b in enumerate(fix_candidates):
+                if b['link_id'] == a['link_id']:
+                    route, path = abs(b['fraction'] - a['fraction']) * a['link_length'], None
+                elif b['f_node'] in node_paths:
+                    cost, path = node_paths[b['f_node']]
+                    route = exit_cost + cost + b['fraction'] * b['link_length']
+                else:
+                    continue
+                if route > max_route:
+                    continue
+                score = scores[p] - abs(route - straight) / beta
+                if score > best[q]:
+                    best[q], back[q], routes[q] = score, p, (route, path, previous)
+
+        new_scores = [s + e for s, e in zip(best, emission)]
+        if max(new_scores) == -math.inf:
+            # Nothing connects the two fixes: close the segment and start a new one here.
+            distance += _backtrack(history, scores, chosen, segments)
+            history = [(i, fix_candidates, None, None)]
+            scores = emission
+        else:
+            history.append((i, fix_candidates, back, routes))
+            scores = new_scores
+        last = i
+
+    if scores is not None:
+        distance += _backtrack(history, scores, chosen, segments)
+    for i, leader in followers.items():
+        chosen[i] = chosen[leader]
+    return {"points": chosen, "segments": segments, "distance": distance}
+
+def match_traces(traces: list[tuple]) -> tuple[list[dict], dict]:
+    """
+    match_trace for a batch of (EPSG:5186 fixes, candidates) traces on the
+    graph_manager of the current process, plus search stats for metrics.
+    """
+    started = time.perf_counter()
+    results = [match_trace(xy, candidates) for xy, candidates in traces]
+    return results, {"engine": "csr", "seconds": time.perf_counter() - started}
+
+def _combine(lines: list[list]) -> dict:
+    """One GeoJSON LineString, or a MultiLineString where the match has gaps."""
+    if not lines:
+        return None
+    if len(lines) == 1:
+        return {"type": "LineString", "coordinates": lines[0]}
+    return {"type": "MultiLineString", "coordinates": lines}
+
+def _dedupe(link_ids: list[int]) -> list[int]:
+    return [link for i, link in enumerate(link_ids) if i == 0 or link != link_ids[i - 1]]
+
+def get_matched_routes(db: Session, results: list[dict], links: LinkGeometryStore = None) -> list[tuple]:
+    """
+    The driven LINK_ID sequence and GeoJSON geometry of each match_trace result.
+    Link parts are cut in memory when a link geometry store is given, otherwise
+    every trace is resolved in one query.
+    """
+    if links is not None:
+        routes = []
+        for result in results:
+            link_ids, lines = [], []
+            for pieces in result["segments"]:
+                unknown = [k for k, piece in enumerate(pieces) if piece[0] is None]
+                by_nodes = links.find_links([pieces[k][1] for k in unknown], [pieces[k][2] for k in unknown]).tolist()
+                positions = [links.index_of_link(piece[0]) if piece[0] is not None else None for piece in pieces]
+                for k, link in zip(unknown, by_nodes):
+                    positions[k] = link if link >= 0 else None
+                parts = []
+                for link, piece in zip(positions, pieces):
+                    if link is None:
+                        continue
+                    link_ids.append(int(links.link_ids[link]))
+                    start, end = piece[3], piece[4]
+                    parts.append(links.coordinates(link) if start == 0.0 and end == 1.0 else links.substring(link, start, end))
+                if parts:
+                    xy = np.vstack(parts)
+                    keep = np.ones(len(xy), dtype=bool)
+                    keep[1:] = np.any(xy[1:] != xy[:-1], axis=1)
+                    lines.append(to_wgs84(xy[keep]).tolist())
+            routes.append((_dedupe(link_ids), _combine(lines)))
+        return routes
+
+    sql = text("""
+        SELECT trace, segment, array_agg(link_id ORDER BY seq),
+               ST_AsGeoJSON(ST_Transform(ST_LineMerge(ST_Collect(part ORDER BY seq)), 4326))
+        FROM (
+            -- Links between candidates are only known by their nodes; like the graph, take the shortest.
+            SELECT DISTINCT ON (p.seq) p.trace, p.segment, p.seq, l."LINK_ID" as link_id,
+                   ST_LineSubstring(l.geom, p.start_fraction, p.end_fraction) as part
+            FROM unnest(CAST(:traces AS int[]), CAST(:segments AS int[]), CAST(:link_ids AS bigint[]),
+                        CAST(:f_nodes AS bigint[]), CAST(:t_nodes AS bigint[]),
+                        CAST(:starts AS float8[]), CAST(:ends AS float8[])) WITH ORDINALITY
+                AS p(trace, segment, link_id, f_node, t_node, start_fraction, end_fraction, seq)
+            JOIN links l ON l."F_NODE" = p.f_node AND l."T_NODE" = p.t_node
+            ORDER BY p.seq, (l."LINK_ID" = p.link_id) IS TRUE DESC, l."LENGTH"
+        ) parts
+        GROUP BY trace, segment
+        ORDER BY trace, segment;
+    """)
+    params = {"traces": [], "segments": [], "link_ids": [], "f_nodes": [], "t_nodes": [], "starts": [], "ends": []}
+    for trace, result in enumerate(results):
+        for segment, pieces in enumerate(result["segments"]):
+            for link_id, f_node, t_node, start, end in pieces:
+                params["traces"].append(trace)
+                params["segments"].append(segment)
+                params["link_ids"].append(link_id)
+                params["f_nodes"].append(f_node)
+                params["t_nodes"].append(t_node)
+                params["starts"].append(start)
+                params["ends"].append(end)
+
+    link_ids = [[] for _ in results]
+    lines = [[] for _ in results]
+    if params["traces"]:
+        for trace, _, segment_links, geom_json in db.execute(sql, params).all():
+            link_ids[trace].extend(segment_links)
+            geometry = json.loads(geom_json)
+            if geometry["type"] == "LineString":
+                lines[trace].append(geometry["coordinates"])
+            else:
+                lines[trace].extend(geometry["coordinates"])
+    return [(_dedupe(ids), _combine(trace_lines)) for ids, trace_lines in zip(link_ids, lines)]
@@ -0,0 +1,212 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Metrics rendered by /metrics, in registration order.
+_registry = []
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """Monotonically increasing count, optionally split by labels."""
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {value}" for key, value in values
+        ]
+
+class Gauge(_Metric):
+    """
+    Value read from a callback at scrape time. The callback returns a number,
+    or a dict of label value to number. Pass kind="counter" for running totals
+    kept elsewhere, such as cache hit counts.
+    """
+    def __init__(self, name: str, documentation: str, callback, labelname: str = None, kind: str = "gauge"):
+        super().__init__(name, documentation, (labelname,) if labelname else ())
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> list[str]:
+        value = self.callback()
+        if not self.labelnames:
+            return self._header() + [f"{self.name} {value}"]
+        return self._header() + [
+            f"{self.name}{_format_labels({self.labelnames[0]: label})} {v}" for label, v in value.items()
+        ]
+
+class Histogram(_Metric):
+    """Distribution of observed values over fixed upper bounds, with their count and sum."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), then the sum.
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = self._header()
+        for key, counts, total in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': le})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUESTS = Counter("pathfinder_requests_total", "Requests handled, by endpoint and HTTP status.", ("endpoint", "status"))
+REQUEST_SECONDS = Histogram("pathfinder_request_seconds", "Time spent handling a request.", SECONDS_BUCKETS, ("endpoint",))
+STAGE_SECONDS = Histogram(
+    "pathfinder_stage_seconds", "Time spent in each stage of a request.", SECONDS_BUCKETS, ("endpoint", "stage")
+)
+SEARCH_SECONDS = Histogram(
+    "pathfinder_search_seconds", "Time a graph search computed for, excluding queueing.", SECONDS_BUCKETS, ("engine",)
+)
+NODES_EXPANDED = Histogram(
+    "pathfinder_search_nodes_expanded", "Nodes settled by a graph search.",
+    (10, 100, 1000, 10000, 100000, 1000000), ("engine",)
+)
+PATH_NODES = Histogram("pathfinder_path_nodes", "Nodes in a found route.", (2, 10, 50, 100, 500, 1000, 5000, 10000))
+ROUTE_METERS = Histogram(
+    "pathfinder_route_distance_meters", "Length of a returned route.",
+    (100, 500, 1000, 5000, 10000, 50000, 100000, 500000)
+)
+DB_QUERIES = Counter("pathfinder_db_queries_total", "SQL statements sent to the database.")
+DB_QUERIES_PER_REQUEST = Histogram(
+    "pathfinder_request_db_queries", "SQL statements sent while handling a request.", (0, 1, 2, 3, 5, 10, 25), ("endpoint",)
+)
+
+# The request being measured in this context. Starlette copies the context into the threadpool,
+# so database work done for a request in a worker thread is still counted against it.
+_current = contextvars.ContextVar("pathfinder_request_metrics", default=None)
+
+class RequestMetrics:
+    """
+    Collects stage timings and counters for one request and records them on
+    exit, logging a one-line summary when LOG_REQUEST_METRICS is set. HTTP
+    errors raised out of the block are counted under their status code.
+    """
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.stages = {}
+        self.values = {}
+        self.db_queries = 0
+        self.status = 200
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        elapsed = time.perf_counter() - self._started
+        if exc is not None:
+            self.status = getattr(exc, "status_code", 500)
+        REQUESTS.inc(endpoint=self.endpoint, status=self.status)
+        REQUEST_SECONDS.observe(elapsed, endpoint=self.endpoint)
+        DB_QUERIES_PER_REQUEST.observe(self.db_queries, endpoint=self.endpoint)
+        if config.LOG_REQUEST_METRICS:
+            fields = [f"status={self.status}", f"total={elapsed * 1000:.1f}ms"]
+            fields += [f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.stages.items()]
+            fields.append(f"db_queries={self.db_queries}")
+            fields += [f"{name}={value}" for name, value in self.values.items()]
+            logger.info("%s %s", self.endpoint, " ".join(fields))
+        return False
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+            STAGE_SECONDS.observe(elapsed, endpoint=self.endpoint, stage=name)
+
+    def record_search(self, stats: dict):
+        """Records the stats a route_search returned alongside its result."""
+        if stats.get("cached"):
+            self.values["search_cached"] = True
+            return
+        engine = stats.get("engine", "unknown")
+        SEARCH_SECONDS.observe(stats["seconds"], engine=engine)
+        self.stages["search_compute"] = self.stages.get("search_compute", 0.0) + stats["seconds"]
+        if "expanded" in stats:
+            NODES_EXPANDED.observe(stats["expanded"], engine=engine)
+            self.values["expanded"] = self.values.get("expanded", 0) + stats["expanded"]
+
+    def record_route(self, distance: float, path_nodes: int):
+        ROUTE_METERS.observe(distance)
+        PATH_NODES.observe(path_nodes)
+        self.values["distance_m"] = round(distance, 1)
+        self.values["path_nodes"] = path_nodes
+
+def track_queries(engine):
+    """Counts every statement the SQLAlchemy engine executes, overall and for the current request."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERIES.inc()
+        current = _current.get()
+        if current is not None:
+            current.db_queries += 1
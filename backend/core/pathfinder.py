@@ -2,16 +2,37 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, text
 from geoalchemy2.functions import ST_Transform, ST_SetSRID, ST_MakePoint, ST_AsGeoJSON, ST_LineLocatePoint, ST_LineSubstring, ST_Length, ST_ClosestPoint
 import networkx as nx
+import heapq
 import json
+import logging
+import math
+import time
+
+import numpy as np
 
 from ..db.models import Node, Link
+from . import config
+from .cache import LRUCache
+from .graph import NodeCoordinates, graph_manager
+from .csr import CSRGraph
+from .chains import ChainGraph
+from .profiles import DISTANCE
+from .ch import ContractionHierarchy
+from .links import LinkIndex, LinkGeometryStore, to_wgs84_linestring, to_wgs84_multilinestring
 from ..schemas.route import Point
 
-def find_nearest_link_and_snapped_point(db: Session, point: Point):
+logger = logging.getLogger(__name__)
+
+def find_nearest_link_and_snapped_point(db: Session, point: Point, link_index: LinkIndex = None):
     """
     Finds the nearest link to a given point, and returns information 
     about the link and the snapped point on it.
+    If an in-memory link index is given, the database is not queried.
+    Links pruned from the graph are passed over for the next nearest one.
     """
+    if link_index is not None:
+        return link_index.snap(point.lon, point.lat)
+
     # Directly create the WKT string for the point in WGS84
     wgs84_wkt = f"SRID=4326;POINT({point.lon} {point.lat})"
 
@@ -26,10 +47,11 @@ def find_nearest_link_and_snapped_point(db: Session, point: Point):
             ST_LineLocatePoint(geom, ST_Transform(ST_GeomFromEWKT(:wgs84_wkt), 5186)) as fraction
         FROM links
         ORDER BY geom <-> ST_Transform(ST_GeomFromEWKT(:wgs84_wkt), 5186)
-        LIMIT 1;
+        LIMIT :limit;
     """)
     
-    result = db.execute(sql, {'wgs84_wkt': wgs84_wkt}).first()
+    rows = db.execute(sql, {'wgs84_wkt': wgs84_wkt, 'limit': config.SNAP_CANDIDATES}).all()
+    result = next((row for row in rows if graph_manager.is_routable(row[1], row[2])), None)
 
     if not result:
         return None
@@ -44,22 +66,526 @@ def find_nearest_link_and_snapped_point(db: Session, point: Point):
         "user_point_wkt": wgs84_wkt  # Return the original point WKT as well
     }
 
-def find_shortest_path(graph: nx.DiGraph, start_node: int, end_node: int) -> tuple[list, float]:
-    """Finds the shortest path using A* algorithm."""
-    try:
-        path_nodes = nx.astar_path(graph, start_node, end_node, weight='weight')
-        path_length = nx.astar_path_length(graph, start_node, end_node, weight='weight')
-        print(f"Debug (pathfinder): Path found from {start_node} to {end_node}. Nodes: {path_nodes}, Length: {path_length}")
-        return path_nodes, path_length
-    except nx.NetworkXNoPath:
-        print(f"Debug (pathfinder): No path found from {start_node} to {end_node}.")
+def snap_points(db: Session, points: list[Point], link_index: LinkIndex = None) -> list:
+    """
+    Snaps many points at once. Returns one dict per point in the format of
+    find_nearest_link_and_snapped_point, or None where no link was found.
+    Without an in-memory link index all points are snapped in a single query.
+    """
+    if link_index is not None:
+        return [link_index.snap(point.lon, point.lat) for point in points]
+    if not points:
+        return []
+
+    sql = text("""
+        SELECT
+            p.idx,
+            l."LINK_ID",
+            l."F_NODE",
+            l."T_NODE",
+            l."LENGTH",
+            ST_AsText(ST_ClosestPoint(l.geom, p.geom)) as snapped_point_wkt,
+            ST_LineLocatePoint(l.geom, p.geom) as fraction
+        FROM (
+            SELECT idx, ST_Transform(ST_SetSRID(ST_MakePoint(lon, lat), 4326), 5186) as geom
+            FROM unnest(CAST(:lons AS float8[]), CAST(:lats AS float8[])) WITH ORDINALITY AS t(lon, lat, idx)
+        ) p
+        CROSS JOIN LATERAL (
+            SELECT "LINK_ID", "F_NODE", "T_NODE", "LENGTH", geom, links.geom <-> p.geom as distance
+            FROM links
+            ORDER BY links.geom <-> p.geom
+            LIMIT :limit
+        ) l
+        ORDER BY p.idx, l.distance;
+    """)
+
+    rows = db.execute(sql, {
+        'lons': [point.lon for point in points],
+        'lats': [point.lat for point in points],
+        'limit': config.SNAP_CANDIDATES,
+    }).all()
+
+    results = [None] * len(points)
+    for row in rows:
+        # The nearest link per point that was not pruned from the graph.
+        if results[row[0] - 1] is not None or not graph_manager.is_routable(row[2], row[3]):
+            continue
+        point = points[row[0] - 1]
+        results[row[0] - 1] = {
+            "link_id": row[1],
+            "f_node": row[2],
+            "t_node": row[3],
+            "link_length": row[4],
+            "snapped_point_wkt": row[5],
+            "fraction": row[6],
+            "user_point_wkt": f"SRID=4326;POINT({point.lon} {point.lat})",
+        }
+    return results
+
+def link_candidates(db: Session, xy, radius: float, limit: int, link_index: LinkIndex = None) -> list[list[dict]]:
+    """
+    Candidate links for many EPSG:5186 points, for map matching: the closest
+    point of up to limit links within radius meters of each, nearest first, in
+    the format of LinkIndex.candidates. Without an in-memory link index all
+    points are looked up in a single query.
+    """
+    if link_index is not None:
+        return link_index.candidates(xy, radius, limit)
+    if len(xy) == 0:
+        return []
+
+    sql = text("""
+        SELECT
+            p.idx,
+            l."LINK_ID",
+            l."F_NODE",
+            l."T_NODE",
+            l."LENGTH",
+            ST_LineLocatePoint(l.geom, p.geom) as fraction,
+            ST_Distance(l.geom, p.geom) as distance,
+            ST_X(ST_ClosestPoint(l.geom, p.geom)),
+            ST_Y(ST_ClosestPoint(l.geom, p.geom))
+        FROM (
+            SELECT idx, ST_SetSRID(ST_MakePoint(x, y), 5186) as geom
+            FROM unnest(CAST(:xs AS float8[]), CAST(:ys AS float8[])) WITH ORDINALITY AS t(x, y, idx)
+        ) p
+        CROSS JOIN LATERAL (
+            SELECT "LINK_ID", "F_NODE", "T_NODE", "LENGTH", geom
+            FROM links
+            WHERE ST_DWithin(links.geom, p.geom, :radius)
+            ORDER BY links.geom <-> p.geom
+            LIMIT :limit
+        ) l
+        ORDER BY p.idx, distance;
+    """)
+
+    rows = db.execute(sql, {'xs': xy[:, 0].tolist(), 'ys': xy[:, 1].tolist(), 'radius': radius, 'limit': limit}).all()
+
+    results = [[] for _ in range(len(xy))]
+    for row in rows:
+        if not graph_manager.is_routable(row[2], row[3]):
+            continue
+        results[row[0] - 1].append({
+            "link_id": row[1],
+            "f_node": row[2],
+            "t_node": row[3],
+            "link_length": row[4],
+            "fraction": row[5],
+            "distance": row[6],
+            "x": row[7],
+            "y": row[8],
+        })
+    return results
+
+def snapped_node_costs(link_info: dict) -> dict[int, float]:
+    """
+    Returns the partial-link distance between the snapped point and each node of
+    its link. The same costs apply whether the point is a start or an end.
+    """
+    costs = {}
+    for node, cost in ((link_info['f_node'], link_info['link_length'] * link_info['fraction']),
+                       (link_info['t_node'], link_info['link_length'] * (1 - link_info['fraction']))):
+        costs[node] = min(cost, costs.get(node, float('inf')))
+    return costs
+
+def straight_line_heuristic(coords: NodeCoordinates, end_costs: dict[int, float]):
+    """
+    Builds an A* heuristic from EPSG:5186 node coordinates. The estimate for a node
+    is the straight-line distance to the closest end node plus that node's finishing
+    cost, which never overestimates since no link is shorter than its chord.
+    Nodes without coordinates get 0, which keeps the heuristic admissible.
+    """
+    targets = []
+    for node, cost in end_costs.items():
+        xy = coords.get(node)
+        if xy is None:
+            # One end node without a position makes every estimate unsafe.
+            return lambda node: 0.0
+        targets.append((xy[0], xy[1], cost))
+
+    def heuristic(node):
+        xy = coords.get(node)
+        if xy is None:
+            return 0.0
+        return min(math.hypot(xy[0] - tx, xy[1] - ty) + cost for tx, ty, cost in targets)
+
+    return heuristic
+
+def find_shortest_path(graph: nx.DiGraph | CSRGraph | ContractionHierarchy, start_costs: dict[int, float], end_costs: dict[int, float],
+                       coords: NodeCoordinates = None, stats: dict = None, profile: str = DISTANCE) -> tuple[list, float]:
+    """
+    Finds the shortest path from any of the start nodes to any of the end nodes
+    with a single multi-source/multi-target A* search.
+
+    start_costs maps each candidate start node to the cost of reaching it from the
+    snapped start point, and end_costs maps each candidate end node to the cost of
+    reaching the snapped end point from it. When node coordinates are given they
+    guide the search with a straight-line heuristic, otherwise this is Dijkstra.
+    A CSRGraph carries its own coordinates and is searched on its arrays, and a
+    ContractionHierarchy is searched with a bidirectional upward query.
+    Returns the node path and the total distance including both partial costs,
+    or (None, 0) if no path exists. If a stats dict is given, the number of
+    nodes the search settled is stored in it under "expanded".
+
+    Any other profile than distance is searched on a CSRGraph's weight array
+    for it, and the costs and total are then in that profile's units.
+    """
+    if profile != DISTANCE and not isinstance(graph, CSRGraph):
+        raise ValueError(f"Profile '{profile}' can only be searched on a CSRGraph.")
+    if isinstance(graph, (CSRGraph, ContractionHierarchy)):
+        if isinstance(graph, CSRGraph):
+            path_nodes, total = graph.shortest_path(start_costs, end_costs, stats, profile)
+        else:
+            path_nodes, total = graph.shortest_path(start_costs, end_costs, stats)
+        if path_nodes is None:
+            logger.debug("No path found from %s to %s.", list(start_costs), list(end_costs))
+        else:
+            logger.debug("Path found from %s to %s. Nodes: %d, Length: %s", path_nodes[0], path_nodes[-1], len(path_nodes), total)
+        return path_nodes, total
+
+    adj = graph._succ
+    heuristic = straight_line_heuristic(coords, end_costs) if coords is not None else (lambda node: 0.0)
+    estimates = {}
+    dist = {}
+    pred = {}
+    heap = []
+    counter = 0
+    for node, cost in start_costs.items():
+        if node in adj and cost < dist.get(node, float('inf')):
+            dist[node] = cost
+            pred[node] = None
+            estimates[node] = heuristic(node)
+            heapq.heappush(heap, (cost + estimates[node], counter, node))
+            counter += 1
+
+    settled = set()
+    best_total = float('inf')
+    best_end = None
+    while heap:
+        f, _, u = heapq.heappop(heap)
+        # Every remaining candidate is at least this long, so the best end node has settled.
+        if f >= best_total:
+            break
+        if u in settled:
+            continue
+        settled.add(u)
+        d = dist[u]
+
+        if u in end_costs and d + end_costs[u] < best_total:
+            best_total = d + end_costs[u]
+            best_end = u
+
+        for v, attrs in adj[u].items():
+            nd = d + attrs['weight']
+            if nd < dist.get(v, float('inf')):
+                dist[v] = nd
+                pred[v] = u
+                if v not in estimates:
+                    estimates[v] = heuristic(v)
+                heapq.heappush(heap, (nd + estimates[v], counter, v))
+                counter += 1
+
+    if stats is not None:
+        stats["expanded"] = len(settled)
+    if best_end is None:
+        logger.debug("No path found from %s to %s.", list(start_costs), list(end_costs))
         return None, 0
 
-def get_full_path_geometry_and_length(db: Session, start_info: dict, end_info: dict, main_path_nodes: list[int]):
+    path_nodes = [best_end]
+    while pred[path_nodes[-1]] is not None:
+        path_nodes.append(pred[path_nodes[-1]])
+    path_nodes.reverse()
+    logger.debug("Path found from %s to %s. Nodes: %d, Length: %s, Expanded: %d", path_nodes[0], best_end, len(path_nodes), best_total, len(settled))
+    return path_nodes, best_total
+
+# Node path cache: (profile, start seeds, end seeds) -> (node path, length and cost between its end nodes).
+# Each process has its own, and it is emptied whenever its graph_manager loads a graph.
+path_cache = LRUCache(config.PATH_CACHE_SIZE, config.ROUTE_CACHE_TTL)
+graph_manager.add_reload_listener(path_cache.clear)
+
+def _engine_name(graph) -> str:
+    if isinstance(graph, ContractionHierarchy):
+        return "ch"
+    return "csr" if isinstance(graph, CSRGraph) else "networkx"
+
+def _seed_key(costs: dict[int, float]) -> tuple:
+    quantum = config.ROUTE_CACHE_QUANTUM_M
+    return tuple(sorted((node, round(cost / quantum)) for node, cost in costs.items()))
+
+def _profile_seeds(csr: CSRGraph, costs: dict[int, float], link_info: dict, profile: str) -> dict[int, float]:
+    """Converts partial-link meters into profile costs at the rate of the snapped link."""
+    rate = csr.cost_per_meter(link_info['f_node'], link_info['t_node'], profile)
+    return {node: meters * rate for node, meters in costs.items()}
+
+def route_search(start_costs: dict[int, float], end_costs: dict[int, float], profile: str = DISTANCE,
+                 start_info: dict = None, end_info: dict = None) -> tuple[list, float, float, dict]:
+    """
+    find_shortest_path on the graph_manager of the current process, using the
+    contraction hierarchy when one is loaded. Only plain data goes in and out,
+    so this can run in a routing worker process as well as in the API process.
+    Results are cached by profile, seed nodes and rounded seed costs; the totals
+    are recomputed from the exact costs of the current request.
+
+    start_costs and end_costs are partial-link meters. For any profile other
+    than distance they are priced at the rate of the snapped links, given as
+    start_info and end_info, and the CSR arrays are searched with that
+    profile's weights. Searches run on the chain-compressed graph when one is
+    loaded, and the path is expanded back to every node. Returns the node
+    path, its distance in meters and its cost in the profile's units, which
+    for distance is the same number.
+    Also returns search stats for metrics: the engine, compute time in seconds
+    and nodes expanded, or just {"cached": True} on a cache hit.
+    """
+    key = (profile, _seed_key(start_costs), _seed_key(end_costs))
+    # Read before the graph, so a path from a graph that is reloaded meanwhile is not cached.
+    generation = path_cache.generation
+    # Every part of the graph comes from this one state, even if a reload swaps in another meanwhile.
+    state = graph_manager.get_state()
+    cached = path_cache.get(key)
+    if cached is not None:
+        path_nodes, main_length, main_cost = cached
+        stats = {"cached": True}
+    else:
+        stats = None
+    csr = state.csr
+    if profile == DISTANCE:
+        start_seeds, end_seeds = start_costs, end_costs
+    else:
+        start_seeds = _profile_seeds(csr, start_costs, start_info, profile)
+        end_seeds = _profile_seeds(csr, end_costs, end_info, profile)
+
+    if stats is None:
+        chains = state.chains
+        graph = (state.hierarchy or state.graph) if profile == DISTANCE else state.search_csr()
+        stats = {"engine": _engine_name(graph), "expanded": 0}
+        coords = state.coords
+        search = lambda starts, ends: find_shortest_path(graph, starts, ends, coords, stats, profile)
+        started = time.perf_counter()
+        if chains is not None:
+            path_nodes, total = chains.shortest_path(search, start_seeds, end_seeds, profile)
+        else:
+            path_nodes, total = search(start_seeds, end_seeds)
+        stats["seconds"] = time.perf_counter() - started
+        main_length = main_cost = 0
+        if path_nodes is not None:
+            main_cost = total - start_seeds[path_nodes[0]] - end_seeds[path_nodes[-1]]
+            main_length = main_cost if profile == DISTANCE else csr.path_weight(path_nodes)
+        # Unreachable pairs are cached too, so repeating them does not rerun a full search.
+        path_cache.put(key, (path_nodes, main_length, main_cost), generation)
+
+    if path_nodes is None:
+        return None, 0, 0, stats
+    first, last = path_nodes[0], path_nodes[-1]
+    return (path_nodes, start_costs[first] + main_length + end_costs[last],
+            start_seeds[first] + main_cost + end_seeds[last], stats)
+
+def alternatives_search(start_costs: dict[int, float], end_costs: dict[int, float], k: int, profile: str = DISTANCE,
+                        start_info: dict = None, end_info: dict = None) -> tuple[list, dict]:
+    """
+    Like route_search, but returns the shortest route and up to k alternatives
+    as (node path, distance, cost) tuples, shortest first, plus search stats.
+    All of them come from one forward and one backward search over the CSR
+    arrays, see CSRGraph.alternative_paths, and are cached together.
+    """
+    key = ("alternatives", k, profile, _seed_key(start_costs), _seed_key(end_costs))
+    generation = path_cache.generation
+    state = graph_manager.get_state()
+    csr = state.csr
+    start_seeds = _profile_seeds(csr, start_costs, start_info, profile) if profile != DISTANCE else start_costs
+    end_seeds = _profile_seeds(csr, end_costs, end_info, profile) if profile != DISTANCE else end_costs
+
+    cached = path_cache.get(key)
+    if cached is not None:
+        stats = {"cached": True}
+    else:
+        stats = {"engine": "csr", "expanded": 0}
+        chains = state.chains
+        graph = state.search_csr()
+        search = lambda starts, ends: graph.alternative_paths(
+            starts, ends, k, config.ALTERNATIVE_MAX_STRETCH, config.ALTERNATIVE_MAX_SHARE,
+            stats=stats, profile=profile,
+        )
+        started = time.perf_counter()
+        if chains is not None:
+            paths = chains.routes(search, start_seeds, end_seeds, profile)[:k + 1]
+        else:
+            paths = search(start_seeds, end_seeds)
+        stats["seconds"] = time.perf_counter() - started
+        cached = []
+        for path_nodes, total in paths:
+            main_cost = total - start_seeds[path_nodes[0]] - end_seeds[path_nodes[-1]]
+            main_length = main_cost if profile == DISTANCE else csr.path_weight(path_nodes)
+            cached.append((path_nodes, main_length, main_cost))
+        path_cache.put(key, cached, generation)
+
+    routes = [
+        (path_nodes, start_costs[path_nodes[0]] + main_length + end_costs[path_nodes[-1]],
+         start_seeds[path_nodes[0]] + main_cost + end_seeds[path_nodes[-1]])
+        for path_nodes, main_length, main_cost in cached
+    ]
+    return routes, stats
+
+def isochrone_search(start_costs: dict[int, float], thresholds: list[float], profile: str = DISTANCE,
+                     start_info: dict = None) -> tuple[list, dict]:
+    """
+    Everything reachable from a snapped point within each threshold, from one
+    search bounded by the largest. start_costs are partial-link meters as for
+    route_search and thresholds are in the profile's units.
+    Returns, per threshold, the reachable link parts as (F_NODE, T_NODE, start
+    fraction, end fraction) arrays, plus search stats. A link whose start node
+    is reachable is cut where the remaining budget runs out, and the snapped
+    link is covered in both directions from the snapped point.
+    """
+    csr = graph_manager.get_csr()
+    seeds = _profile_seeds(csr, start_costs, start_info, profile) if profile != DISTANCE else start_costs
+    stats = {"engine": "csr"}
+    started = time.perf_counter()
+    reached, costs = csr.costs_within(seeds, max(thresholds), stats, profile)
+
+    owners, edges = csr.out_edges(reached)
+    source_costs = costs[owners]
+    weights = csr.profiles[profile][edges]
+    f_nodes = csr.node_ids[reached[owners]]
+    t_nodes = csr.node_ids[csr.targets[edges]]
+    start_rate = csr.cost_per_meter(start_info['f_node'], start_info['t_node'], profile)
+
+    bands = []
+    for threshold in thresholds:
+        inside = source_costs < threshold
+        remaining = threshold - source_costs[inside]
+        edge_weights = weights[inside]
+        fractions = np.ones(len(remaining))
+        np.divide(remaining, edge_weights, out=fractions, where=edge_weights > 0)
+        # The snapped link, from the snapped point towards both of its nodes.
+        reach = threshold / start_rate / start_info['link_length'] if start_rate > 0 and start_info['link_length'] > 0 else 1.0
+        bands.append((
+            np.append(f_nodes[inside], start_info['f_node']),
+            np.append(t_nodes[inside], start_info['t_node']),
+            np.append(np.zeros(len(remaining)), max(start_info['fraction'] - reach, 0.0)),
+            np.append(np.minimum(fractions, 1.0), min(start_info['fraction'] + reach, 1.0)),
+        ))
+    stats["seconds"] = time.perf_counter() - started
+    return bands, stats
+
+def get_isochrone_geometries(db: Session, bands: list, shape: str = "links", links: LinkGeometryStore = None) -> list[dict]:
+    """
+    GeoJSON for each band of isochrone_search: the reachable link parts as a
+    MultiLineString, or with shape "hull" a concave hull around them from
+    PostGIS. Link parts are cut in memory when a link geometry store is given.
+    """
+    if shape == "links" and links is not None:
+        geometries = []
+        for f_nodes, t_nodes, starts, ends in bands:
+            parts = []
+            for link, start, end in zip(links.find_links(f_nodes, t_nodes).tolist(), starts.tolist(), ends.tolist()):
+                if link < 0 or end <= start:
+                    continue
+                parts.append(links.coordinates(link) if start == 0.0 and end == 1.0 else links.substring(link, start, end))
+            geometries.append(to_wgs84_multilinestring(parts))
+        return geometries
+
+    collected = "ST_ConcaveHull(ST_Collect(part), :concavity)" if shape == "hull" else "ST_Multi(ST_Collect(part))"
+    sql = text(f"""
+        SELECT band, ST_AsGeoJSON(ST_Transform({collected}, 4326))
+        FROM (
+            SELECT p.band, ST_LineSubstring(l.geom, p.start_fraction, p.end_fraction) as part
+            FROM unnest(CAST(:bands AS int[]), CAST(:f_nodes AS bigint[]), CAST(:t_nodes AS bigint[]),
+                        CAST(:starts AS float8[]), CAST(:ends AS float8[]))
+                AS p(band, f_node, t_node, start_fraction, end_fraction)
+            JOIN links l ON l."F_NODE" = p.f_node AND l."T_NODE" = p.t_node
+            WHERE p.end_fraction > p.start_fraction
+        ) parts
+        GROUP BY band;
+    """)
+    params = {"bands": [], "f_nodes": [], "t_nodes": [], "starts": [], "ends": [], "concavity": config.ISOCHRONE_CONCAVITY}
+    for band, (f_nodes, t_nodes, starts, ends) in enumerate(bands):
+        params["bands"].extend([band] * len(f_nodes))
+        params["f_nodes"].extend(f_nodes.tolist())
+        params["t_nodes"].extend(t_nodes.tolist())
+        params["starts"].extend(starts.tolist())
+        params["ends"].extend(ends.tolist())
+
+    empty = {"type": "Polygon" if shape == "hull" else "MultiLineString", "coordinates": []}
+    geometries = [empty] * len(bands)
+    for band, geom_json in db.execute(sql, params).all():
+        geometries[band] = json.loads(geom_json)
+    return geometries
+
+def matrix_search(origins: list, destinations: list) -> list[list]:
+    """find_distance_matrix on the graph_manager of the current process, see route_search."""
+    state = graph_manager.get_state()
+    return find_distance_matrix(state.hierarchy or state.search_csr(), origins, destinations, state.chains)
+
+def find_distance_matrix(graph: CSRGraph | ContractionHierarchy, origins: list, destinations: list,
+                         chains: ChainGraph = None) -> list[list]:
+    """
+    Route distances between every snapped origin and destination, without
+    building any geometry. Entries are None where a point could not be snapped
+    or no path exists. Pairs on the same link use the along-link distance,
+    as /route does. With chains, graph is the compressed graph it wraps.
+    """
+    sources = [snapped_node_costs(info) if info else {} for info in origins]
+    targets = [snapped_node_costs(info) if info else {} for info in destinations]
+    if chains is not None:
+        matrix = chains.distance_matrix(graph, sources, targets)
+    else:
+        matrix = graph.distance_matrix(sources, targets)
+
+    for i, start_info in enumerate(origins):
+        for j, end_info in enumerate(destinations):
+            if start_info and end_info and start_info['link_id'] == end_info['link_id']:
+                matrix[i, j] = start_info['link_length'] * abs(start_info['fraction'] - end_info['fraction'])
+
+    return [[d if d != float('inf') else None for d in row] for row in matrix.tolist()]
+
+def get_same_link_route(db: Session, start_info: dict, end_info: dict, links: LinkGeometryStore = None):
+    """
+    Route for start and end points snapped onto the same link: the part of the
+    link between the two snapped points. Returns (GeoJSON LineString, length).
+    """
+    if links is not None:
+        geom_dict = get_full_path_geometry_and_length(db, start_info, end_info, [], links)
+        length = start_info['link_length'] * abs(start_info['fraction'] - end_info['fraction'])
+        return geom_dict, length
+
+    sql = text("""
+        SELECT ST_AsGeoJSON(ST_Transform(ST_LineSubstring(geom, :start_frac, :end_frac), 4326)),
+               "LENGTH" * abs(:start_frac - :end_frac)
+        FROM links WHERE "LINK_ID" = :link_id;
+    """)
+    start_frac, end_frac = sorted([start_info['fraction'], end_info['fraction']])
+    geom, length = db.execute(sql, {
+        'start_frac': start_frac, 
+        'end_frac': end_frac, 
+        'link_id': start_info['link_id']
+    }).first()
+
+    geom_dict = json.loads(geom)
+    # If ST_LineSubstring returns a POINT (e.g., start_frac == end_frac), convert to LineString format
+    if geom_dict["type"] == "Point":
+        geom_dict["type"] = "LineString"
+        geom_dict["coordinates"] = [geom_dict["coordinates"]]
+
+    return geom_dict, length
+
+def get_full_path_geometry_and_length(db: Session, start_info: dict, end_info: dict, main_path_nodes: list[int],
+                                      links: LinkGeometryStore = None):
     """
     Constructs the full path geometry including the snapped start/end segments 
     and the main path, returning it as a single GeoJSON LineString.
+    With an in-memory link geometry store the line is stitched in Python in
+    time linear in the path length, without touching the database.
     """
+    if links is not None:
+        if not main_path_nodes:
+            if start_info['link_id'] != end_info['link_id']:
+                return None
+            link = links.index_of_link(start_info['link_id'])
+            xy = links.substring(link, *sorted([start_info['fraction'], end_info['fraction']])) if link is not None else None
+        else:
+            xy = links.path_geometry(start_info, end_info, main_path_nodes)
+        return to_wgs84_linestring(xy) if xy is not None else None
+
     if not main_path_nodes:
         # This case should ideally be handled before calling, but as a safeguard:
         # Handle case where start and end are on the same link, but snapped points are different.
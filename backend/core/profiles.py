@@ -0,0 +1,72 @@
+import csv
+import re
+
+import numpy as np
+
+# The profile every graph has: link LENGTH in meters. Contraction hierarchies are built for it.
+DISTANCE = "distance"
+
+# Free-flow speeds in km/h by MOCT ROAD_RANK, for links without a usable MAX_SPD.
+ROAD_RANK_SPEEDS = {
+    "101": 100,  # 고속국도
+    "102": 80,   # 도시고속화도로
+    "103": 70,   # 일반국도
+    "104": 60,   # 특별·광역시도
+    "105": 60,   # 국가지원지방도
+    "106": 50,   # 지방도
+    "107": 40,   # 시·군도
+    "108": 30,   # 기타
+}
+DEFAULT_SPEED_KMH = 30.0
+# Floor for speeds read from data, so a 0 or missing value cannot make a link free or infinite.
+MIN_SPEED_KMH = 5.0
+
+_PROFILE_NAME = re.compile(r"^[a-z0-9_]+$")
+
+def free_flow_speeds(road_ranks, max_speeds) -> np.ndarray:
+    """Speed per link in km/h: MAX_SPD where set, otherwise the typical speed of its ROAD_RANK."""
+    speeds = np.array([
+        float(speed) if speed else ROAD_RANK_SPEEDS.get(str(rank), DEFAULT_SPEED_KMH)
+        for rank, speed in zip(road_ranks, max_speeds)
+    ], dtype=np.float64)
+    return np.maximum(speeds, MIN_SPEED_KMH)
+
+def travel_times(lengths: np.ndarray, speeds_kmh: np.ndarray) -> np.ndarray:
+    """Seconds to drive each link at the given speeds."""
+    return lengths / (speeds_kmh / 3.6)
+
+def read_traffic_profiles(path: str) -> dict[str, dict[int, float]]:
+    """
+    Reads speed overrides from a CSV with profile,LINK_ID,speed_kmh columns,
+    for example one profile per hour of the day from traffic data.
+    Returns {profile: {LINK_ID: speed_kmh}}.
+    """
+    profiles = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            name = row["profile"].strip().lower()
+            if not _PROFILE_NAME.match(name) or name == DISTANCE:
+                raise ValueError(f"Invalid traffic profile name '{row['profile']}' in {path}")
+            profiles.setdefault(name, {})[int(row["LINK_ID"])] = float(row["speed_kmh"])
+    return profiles
+
+def link_profiles(link_ids, lengths, road_ranks, max_speeds, traffic_path: str = None) -> dict[str, np.ndarray]:
+    """
+    Per-link weights for every profile besides distance: "time" at free-flow
+    speeds, plus one travel time profile per set of overrides in traffic_path.
+    Links a traffic profile does not mention keep their free-flow speed.
+    """
+    speeds = free_flow_speeds(road_ranks, max_speeds)
+    profiles = {"time": travel_times(lengths, speeds)}
+    if traffic_path:
+        order = np.argsort(link_ids)
+        sorted_ids = np.asarray(link_ids)[order]
+        for name, overrides in read_traffic_profiles(traffic_path).items():
+            ids = np.fromiter(overrides.keys(), dtype=np.int64, count=len(overrides))
+            values = np.fromiter(overrides.values(), dtype=np.float64, count=len(overrides))
+            pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+            known = sorted_ids[pos] == ids
+            profile_speeds = speeds.copy()
+            profile_speeds[order[pos[known]]] = np.maximum(values[known], MIN_SPEED_KMH)
+            profiles[name] = travel_times(lengths, profile_speeds)
+    return profiles
@@ -0,0 +1,73 @@
+import json
+import os
+import struct
+from datetime import datetime, timezone
+
+import numpy as np
+
+# Bump whenever the set or meaning of the stored arrays changes so old files are ignored.
+SNAPSHOT_VERSION = 2
+
+_MAGIC = b"PFGRAPH\0"
+_ALIGN = 64
+
+def save_snapshot(path: str, arrays: dict[str, np.ndarray], meta: dict = None):
+    """
+    Writes the arrays to a single binary file: a magic string, a JSON header
+    describing each array plus any extra metadata, then the raw array data
+    aligned for memory mapping.
+    The file is written next to its destination and renamed into place, so
+    other processes only ever see a complete snapshot.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    entries = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // _ALIGN) * _ALIGN
+        entries[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset += array.nbytes
+    header = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "meta": meta or {},
+        "arrays": entries,
+    }).encode()
+    data_start = -(-(len(_MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + entries[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+def load_snapshot(path: str):
+    """
+    Memory-maps a snapshot written by save_snapshot. Returns (created_at, arrays, meta)
+    with read-only arrays backed by the page cache, or None if the file is
+    missing, unreadable or from another snapshot version.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            return None
+        header_len, = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+    if header.get("version") != SNAPSHOT_VERSION:
+        return None
+    data_start = -(-(len(_MAGIC) + 8 + header_len) // _ALIGN) * _ALIGN
+
+    arrays = {}
+    for name, entry in header["arrays"].items():
+        shape = tuple(entry["shape"])
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=entry["dtype"])
+            continue
+        mapped = np.memmap(path, dtype=entry["dtype"], mode="r", offset=data_start + entry["offset"], shape=shape)
+        # A plain ndarray view over the mapping avoids memmap's per-slice overhead in the search loops.
+        arrays[name] = np.asarray(mapped)
+    return datetime.fromisoformat(header["created_at"]), arrays, header.get("meta", {})
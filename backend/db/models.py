@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, Float, String, Integer, Index
+from sqlalchemy import Column, BigInteger, Float, String, Integer, Index, DateTime, func
 from sqlalchemy.ext.declarative import declarative_base
 from geoalchemy2 import Geometry
 
@@ -10,8 +10,13 @@ class Node(Base):
     NODE_ID = Column(BigInteger, primary_key=True)
     NODE_TYPE = Column(String)
     NODE_NAME = Column(String)
-    # The geometry column for PostGIS
-    geom = Column(Geometry(geometry_type='POINT', srid=5186), index=True)
+    # The geometry column for PostGIS. Its indexes are declared explicitly so that
+    # scripts/import_data.py rebuilds all of them on the tables it loads.
+    geom = Column(Geometry(geometry_type='POINT', srid=5186, spatial_index=False))
+
+    __table_args__ = (
+        Index('ix_nodes_geom', 'geom', postgresql_using='gist'),
+    )
 
 class Link(Base):
     __tablename__ = 'links'
@@ -20,11 +25,27 @@ class Link(Base):
     F_NODE = Column(BigInteger)
     T_NODE = Column(BigInteger)
     LENGTH = Column(Float)
+    # Road class code (101 고속국도 ... 108 기타) and speed limit in km/h, used for travel time profiles
+    ROAD_RANK = Column(String)
+    MAX_SPD = Column(Float)
     # The geometry column for PostGIS
-    geom = Column(Geometry(geometry_type='LINESTRING', srid=5186), nullable=False)
+    geom = Column(Geometry(geometry_type='LINESTRING', srid=5186, spatial_index=False), nullable=False)
 
     __table_args__ = (
         # spatial_index=True 로도 가능하지만,
         # 명시적으로 GIST 인덱스를 걸려면:
         Index('ix_links_geom', 'geom', postgresql_using='gist'),
+        # Route geometry, isochrone and map matching SQL join links on their node pair.
+        Index('ix_links_f_t', 'F_NODE', 'T_NODE'),
     )
+
+class DataImport(Base):
+    """
+    One row per completed node/link import. Graph snapshots record the id of
+    the latest one they were built after, to tell whether they are stale.
+    """
+    __tablename__ = 'data_imports'
+
+    id = Column(Integer, primary_key=True)
+    imported_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    source = Column(String)
@@ -3,6 +3,8 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
+from ..core import config
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -11,13 +13,17 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable not set")
 
-# The connect_args are specific to SQLite. For PostgreSQL, they are not needed.
-engine = create_engine(DATABASE_URL, echo=True)
-
-# For PostgreSQL, you might want to use a connection pool
-# engine = create_engine(
-#     DATABASE_URL, pool_size=10, max_overflow=20
-# )
+# Size the connection pool for concurrent requests. Connections are checked before use
+# so that ones dropped by the server are replaced instead of failing a request. Statements
+# are only echoed with LOG_LEVEL=DEBUG, as logging each one costs more than most queries.
+engine = create_engine(
+    DATABASE_URL,
+    echo=config.LOG_LEVEL == "DEBUG",
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -1,9 +1,17 @@
+import logging
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from .api import routes
+from .api import routes, admin
+from .core import config, metrics
 from .core.graph import graph_manager
-from .db.session import SessionLocal
+from .core.geocoder import geocoder
+from .core.executor import search_executor
+from .db.session import SessionLocal, engine
+
+logging.basicConfig(level=config.LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+metrics.track_queries(engine)
 
 app = FastAPI(
     title="Path Finding API",
@@ -34,12 +42,29 @@ def on_startup():
     db = SessionLocal()
     try:
         graph_manager.load_graph(db)
+        geocoder.load(db)
     finally:
         db.close()
 
+    if config.ROUTING_PROCESSES > 0:
+        search_executor.use_processes(config.ROUTING_PROCESSES, graph_manager.snapshot_path,
+                                      graph_manager.get_import_id())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Stop the route search pool so pending searches do not outlive the app, and close pooled connections."""
+    search_executor.shutdown()
+    await geocoder.aclose()
+
 # Include the API router
 app.include_router(routes.router)
+app.include_router(admin.router)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Path Finding API"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Request, stage, search and cache metrics of this API process in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,25 @@
+from pydantic import BaseModel, Field
+from typing import List, Literal
+
+from .route import Point
+
+# --- Request Schemas ---
+
+class IsochroneRequest(BaseModel):
+    point: Point
+    # Cost budgets in the profile's units: meters for distance, seconds for travel time profiles
+    thresholds: List[float] = Field(..., min_length=1, max_length=10)
+    profile: str = "distance"
+    # "links" returns the reachable road parts, "hull" a polygon around them
+    shape: Literal["links", "hull"] = "links"
+
+# --- Response Schemas ---
+
+class Isochrone(BaseModel):
+    threshold: float
+    # GeoJSON MultiLineString for shape "links", Polygon for shape "hull"
+    geometry: dict
+
+class IsochroneResponse(BaseModel):
+    profile: str
+    isochrones: List[Isochrone]
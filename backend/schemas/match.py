@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field
+from typing import Annotated, List, Optional
+
+from .route import Point
+
+# --- Request Schemas ---
+
+class MatchRequest(BaseModel):
+    # One or more GPS traces, each a list of fixes in driving order
+    traces: List[Annotated[List[Point], Field(min_length=1, max_length=10000)]] = Field(..., min_length=1, max_length=100)
+
+# --- Response Schemas ---
+
+class MatchedPoint(BaseModel):
+    link_id: int
+    # The fix moved onto its matched link
+    lat: float
+    lon: float
+
+class MatchResult(BaseModel):
+    # One entry per fix, null where no link was within MATCH_SEARCH_RADIUS_M
+    matched_points: List[Optional[MatchedPoint]]
+    # Links driven, in order
+    link_ids: List[int]
+    distance_meters: float
+    # GeoJSON LineString, or MultiLineString where the trace could not be connected; null if nothing matched
+    geometry: Optional[dict] = None
+
+class MatchResponse(BaseModel):
+    matches: List[MatchResult]
@@ -0,0 +1,17 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from .route import Point
+
+# --- Request Schemas ---
+
+class MatrixRequest(BaseModel):
+    origins: List[Point] = Field(..., min_length=1, max_length=1000)
+    destinations: List[Point] = Field(..., min_length=1, max_length=1000)
+
+# --- Response Schemas ---
+
+class MatrixResponse(BaseModel):
+    # distances_meters[i][j] is the route distance from origins[i] to destinations[j],
+    # or null if either point could not be snapped or no path exists.
+    distances_meters: List[List[Optional[float]]]
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
 
 # --- Request Schemas ---
 
@@ -9,6 +10,17 @@ class Point(BaseModel):
 class RouteRequest(BaseModel):
     start_point: Point
     end_point: Point
+    # Cost the route minimizes: "distance", "time" or a traffic profile, see GET /profiles
+    profile: str = "distance"
+    # Number of alternative routes to return next to the shortest one
+    alternatives: int = Field(0, ge=0, le=5)
+    # Douglas–Peucker tolerance in meters for the returned geometry; 0 keeps every vertex
+    simplify_tolerance_m: float = Field(0, ge=0)
+    # Map zoom level to simplify for instead, with a tolerance of about one screen pixel
+    zoom: Optional[int] = Field(None, ge=0, le=22)
+    # "geojson" fills path_geometry; "polyline" and "polyline6" fill path_polyline with an
+    # encoded polyline of precision 5 or 6
+    geometry_format: Literal["geojson", "polyline", "polyline6"] = "geojson"
 
 # --- Response Schemas ---
 
@@ -16,6 +28,18 @@ class GeoJSONLineString(BaseModel):
     type: str = "LineString"
     coordinates: list[list[float]]
 
+class AlternativeRoute(BaseModel):
+    total_distance_meters: float
+    total_cost: float
+    path_geometry: Optional[GeoJSONLineString] = None
+    path_polyline: Optional[str] = None
+
 class RouteResponse(BaseModel):
     total_distance_meters: float
-    path_geometry: GeoJSONLineString
+    path_geometry: Optional[GeoJSONLineString] = None
+    path_polyline: Optional[str] = None
+    profile: str = "distance"
+    # The minimized cost in the profile's units: meters for distance, seconds for travel time profiles
+    total_cost: float
+    # Alternatives in order of cost, when requested; each is a different enough detour
+    alternatives: list[AlternativeRoute] = []
@@ -0,0 +1,372 @@
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+# Add the project root to the path so the backend package can be imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+# The API modules create a database engine on import. The benchmark never connects to it,
+# so any well-formed URL will do when no .env is present.
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://benchmark@localhost/unused")
+
+from backend.core.csr import CSRGraph
+from backend.core.ch import ContractionHierarchy
+from backend.core.graph import LoadedGraph, NodeCoordinates, graph_manager
+from backend.core.chains import ChainGraph
+from backend.core.links import LinkGeometryStore, LinkIndex
+from backend.core.pathfinder import find_shortest_path
+from backend.core.snapshot import save_snapshot, load_snapshot
+
+# Synthetic networks are laid out in EPSG:5186 around central Korea, so snapping and the
+# WGS84 output go through the same projections as real data.
+ORIGIN_X, ORIGIN_Y = 180000.0, 480000.0
+FIRST_NODE_ID = 1000000000
+ENGINES = ("networkx", "csr", "ch")
+# Route classes by straight-line distance, as a fraction of the network's diagonal.
+ROUTE_CLASSES = (("short", 0.0, 0.1), ("medium", 0.1, 0.4), ("long", 0.4, 1.0))
+
+def log(message):
+    """Progress goes to stderr so stdout stays valid JSON."""
+    print(message, file=sys.stderr, flush=True)
+
+def _links_between(node_ids, xy, a, b, oneway, rng):
+    """
+    Turns undirected node index pairs into directed links like MOCT's: each pair
+    gets links both ways unless it is one-way, and lengths are a little longer
+    than the straight line, as real roads are.
+    """
+    lengths = np.hypot(*(xy[a] - xy[b]).T) * rng.uniform(1.0, 1.3, len(a))
+    is_oneway = rng.random(len(a)) < oneway
+    flip = is_oneway & (rng.random(len(a)) < 0.5)
+    forward = np.where(flip, b, a)
+    backward = np.where(flip, a, b)
+    two_way = ~is_oneway
+    f = np.concatenate([forward, backward[two_way]])
+    t = np.concatenate([backward, forward[two_way]])
+    lengths = np.concatenate([lengths, lengths[two_way] * rng.uniform(1.0, 1.1, two_way.sum())])
+    return {"node_ids": node_ids, "xy": xy, "f_nodes": node_ids[f], "t_nodes": node_ids[t], "lengths": lengths}
+
+def grid_network(nodes, spacing=100.0, oneway=0.15, seed=0):
+    """A jittered square grid of about the given number of nodes, spacing meters apart."""
+    rng = np.random.default_rng(seed)
+    side = max(2, int(round(math.sqrt(nodes))))
+    index = np.arange(side * side)
+    row, col = np.divmod(index, side)
+    xy = np.column_stack([ORIGIN_X + col * spacing, ORIGIN_Y + row * spacing])
+    xy += rng.uniform(-0.2, 0.2, xy.shape) * spacing
+    right = index[col < side - 1]
+    up = index[row < side - 1]
+    a = np.concatenate([right, up])
+    b = np.concatenate([right + 1, up + side])
+    return _links_between(index.astype(np.int64) + FIRST_NODE_ID, xy, a, b, oneway, rng)
+
+def random_geometric_network(nodes, spacing=100.0, degree=5.0, oneway=0.15, seed=0):
+    """
+    Uniformly scattered nodes, on average spacing meters apart, joined to every
+    node within the radius that gives the requested mean degree.
+    """
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0.0, math.sqrt(nodes) * spacing, (nodes, 2))
+    radius = spacing * math.sqrt(degree / math.pi)
+
+    # Bucket nodes into radius-sized cells; neighbours are in the same or an adjacent cell.
+    cells = np.floor(xy / radius).astype(np.int64)
+    ncx, ncy = cells[:, 0].max() + 2, cells[:, 1].max() + 2
+    keys = cells[:, 0] * ncy + cells[:, 1]
+    order = np.argsort(keys, kind="stable")
+    starts = np.searchsorted(keys[order], np.arange(ncx * ncy))
+    ends = np.searchsorted(keys[order], np.arange(ncx * ncy), side="right")
+
+    pairs_a, pairs_b = [], []
+    # Half of the 3x3 neighbourhood, so each pair of cells is visited once.
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        cx, cy = cells[:, 0] + dx, cells[:, 1] + dy
+        source = np.flatnonzero((cy >= 0) & (cx < ncx) & (cy < ncy))
+        neighbour_cells = cx[source] * ncy + cy[source]
+        counts = ends[neighbour_cells] - starts[neighbour_cells]
+        i = np.repeat(source, counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(starts[neighbour_cells], counts) + within]
+        keep = np.hypot(*(xy[i] - xy[j]).T) <= radius
+        if (dx, dy) == (0, 0):
+            keep &= i < j
+        pairs_a.append(i[keep])
+        pairs_b.append(j[keep])
+
+    xy += (ORIGIN_X, ORIGIN_Y)
+    node_ids = np.arange(nodes, dtype=np.int64) + FIRST_NODE_ID
+    return _links_between(node_ids, xy, np.concatenate(pairs_a), np.concatenate(pairs_b), oneway, rng)
+
+NETWORKS = {"grid": grid_network, "random": random_geometric_network}
+
+def link_store(network):
+    """Straight two-vertex geometries for every link, as GraphManager loads them in memory mode."""
+    count = len(network["f_nodes"])
+    index = {node_id: i for i, node_id in enumerate(network["node_ids"].tolist())}
+    f = np.fromiter((index[n] for n in network["f_nodes"].tolist()), dtype=np.int64, count=count)
+    t = np.fromiter((index[n] for n in network["t_nodes"].tolist()), dtype=np.int64, count=count)
+    xy = np.stack([network["xy"][f], network["xy"][t]], axis=1).reshape(-1, 2)
+    return LinkGeometryStore(
+        np.arange(1, count + 1, dtype=np.int64), network["f_nodes"], network["t_nodes"], network["lengths"],
+        np.arange(0, 2 * count + 1, 2, dtype=np.int64), xy,
+    )
+
+def _timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def _traced_bytes(fn, *args):
+    """Bytes of Python heap still allocated by fn's result once it returns."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn(*args)
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+def bench_load(network, engines):
+    """
+    Builds each engine's graph the way GraphManager and scripts/build_ch.py do,
+    timing it and measuring its size. Every engine searches the chain-compressed
+    graph; the full CSR graph and the chains are returned next to them.
+    """
+    load, memory, graphs = {}, {}, {}
+    coords = NodeCoordinates(network["node_ids"], network["xy"])
+    csr, load["csr_build_s"] = _timed(
+        CSRGraph.from_edges, network["f_nodes"], network["t_nodes"], network["lengths"], coords
+    )
+    memory["csr_bytes"] = csr.nbytes()
+    memory["coordinates_bytes"] = coords.node_ids.nbytes + coords.xy.nbytes
+
+    # The preprocessing GraphManager adds on load: components, then degree-2 chain compression.
+    components, load["components_s"] = _timed(csr.strongly_connected_components)
+    chains, load["chains_build_s"] = _timed(ChainGraph.build, csr, components)
+    memory["chain_graph_nodes"] = chains.graph.number_of_nodes()
+    memory["chain_graph_edges"] = chains.graph.number_of_edges()
+    graphs["csr"] = chains.graph
+
+    # Round trip through the snapshot file that API workers map on startup.
+    arrays = {
+        "coord_node_ids": coords.node_ids, "coord_xy": coords.xy, "node_ids": csr.node_ids,
+        "offsets": csr.offsets, "targets": csr.targets, "weights": csr.weights, "xy": csr.xy,
+        **chains.arrays(),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "graph.snapshot")
+        _, load["snapshot_write_s"] = _timed(save_snapshot, path, arrays)
+        _, load["snapshot_map_s"] = _timed(load_snapshot, path)
+        load["snapshot_bytes"] = os.path.getsize(path)
+
+    if "networkx" in engines:
+        graphs["networkx"], load["networkx_build_s"] = _timed(chains.graph.to_networkx)
+        # A second build under tracemalloc, which would distort the timing above.
+        _, memory["networkx_bytes"] = _traced_bytes(chains.graph.to_networkx)
+
+    if "ch" in engines:
+        graphs["ch"], load["ch_build_s"] = _timed(ContractionHierarchy.build, chains.graph)
+        ch = graphs["ch"]
+        memory["ch_bytes"] = sum(a.nbytes for a in (
+            ch.rank, ch.up_offsets, ch.up_targets, ch.up_weights, ch.up_middles,
+            ch.down_offsets, ch.down_targets, ch.down_weights, ch.down_middles,
+        ))
+        memory["ch_shortcuts"] = ch.number_of_shortcuts()
+    return coords, csr, chains, graphs, load, memory
+
+def sample_queries(network, per_class, rng):
+    """Random node pairs, per_class of each route class, by straight-line distance."""
+    xy = network["xy"]
+    diagonal = float(np.hypot(*(xy.max(axis=0) - xy.min(axis=0))))
+    queries = {name: [] for name, _, _ in ROUTE_CLASSES}
+    for _ in range(1000):
+        if all(len(pairs) >= per_class for pairs in queries.values()):
+            break
+        a = rng.integers(0, len(xy), 20 * per_class)
+        b = rng.integers(0, len(xy), 20 * per_class)
+        share = np.hypot(*(xy[a] - xy[b]).T) / diagonal
+        for name, low, high in ROUTE_CLASSES:
+            picked = np.flatnonzero((share >= low) & (share < high) & (a != b))[:per_class - len(queries[name])]
+            queries[name].extend(zip(network["node_ids"][a[picked]].tolist(), network["node_ids"][b[picked]].tolist()))
+    return queries
+
+def _summary(latencies_s):
+    ms = np.asarray(latencies_s) * 1000.0
+    if not len(ms):
+        return {"count": 0}
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+    }
+
+def bench_search(graphs, engines, coords, chains, queries):
+    """
+    Latency of find_shortest_path per engine and route class, without any
+    caching. Searches go through the chains as the pathfinder's do.
+    """
+    results = {}
+    for engine in engines:
+        graph = graphs[engine]
+        results[engine] = {}
+        for name, pairs in queries.items():
+            latencies, found, path_nodes = [], 0, 0
+            search = lambda starts, ends: find_shortest_path(graph, starts, ends, coords)
+            for source, target in pairs:
+                (path, _), elapsed = _timed(chains.shortest_path, search, {source: 0.0}, {target: 0.0})
+                latencies.append(elapsed)
+                if path is not None:
+                    found += 1
+                    path_nodes += len(path)
+            results[engine][name] = dict(_summary(latencies), found=found, mean_path_nodes=path_nodes / max(found, 1))
+        log(f"Searched {engine}: " + ", ".join(f"{n} p50 {r['p50_ms']:.2f} ms" for n, r in results[engine].items() if r["count"]))
+    return results
+
+def route_points(store, count, rng):
+    """Request points a few meters off random links, in WGS84 as the API receives them."""
+    from pyproj import Transformer
+    to_4326 = Transformer.from_crs("EPSG:5186", "EPSG:4326", always_xy=True)
+    links = rng.integers(0, len(store), count)
+    start = store.xy[store.offsets[links]]
+    end = store.xy[store.offsets[links] + 1]
+    xy = start + (end - start) * rng.uniform(0.1, 0.9, (count, 1)) + rng.uniform(-5.0, 5.0, (count, 2))
+    lon, lat = to_4326.transform(xy[:, 0], xy[:, 1])
+    return [{"lat": float(la), "lon": float(lo)} for lo, la in zip(lon, lat)]
+
+async def _drive(app, points, requests, concurrency):
+    import httpx
+    latencies, statuses = [], {}
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(client, i):
+        body = {"start_point": points[2 * i], "end_point": points[2 * i + 1]}
+        async with gate:
+            started = time.perf_counter()
+            response = await client.post("/route", json=body)
+            latencies.append(time.perf_counter() - started)
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    # ASGITransport calls the app in-process and skips its startup hook, so nothing touches
+    # the database; the graph is installed into graph_manager beforehand.
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+def bench_route(graphs, engines, coords, csr, chains, store, requests, concurrency, rng):
+    """
+    End-to-end /route throughput through the FastAPI app per engine. Points are
+    snapped by the in-memory LinkIndex instead of PostGIS, and geometry is built
+    from the in-memory link store.
+    """
+    from backend.main import app
+    from backend.db.session import get_db
+    from backend.api.routes import route_cache
+    from backend.core.pathfinder import path_cache
+
+    app.dependency_overrides[get_db] = lambda: None
+    # httpx logs every request at INFO, which would bury the results.
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    index = LinkIndex(store)
+    points = route_points(store, 2 * requests, rng)
+    results = {}
+    for engine in engines:
+        graph = graphs[engine]
+        # Publishing the graph also starts every engine from empty caches.
+        graph_manager._publish(LoadedGraph(
+            graph if engine != "ch" else graphs["csr"], csr, chains, coords,
+            hierarchy=graph if engine == "ch" else None, links=store, link_index=index,
+        ))
+
+        latencies, statuses, elapsed = asyncio.run(_drive(app, points, requests, concurrency))
+        results[engine] = dict(
+            _summary(latencies), requests=requests, concurrency=concurrency, seconds=elapsed,
+            requests_per_second=requests / elapsed, statuses=statuses,
+            route_cache=route_cache.stats(), path_cache=path_cache.stats(),
+        )
+        log(f"/route on {engine}: {requests / elapsed:.1f} req/s, p50 {results[engine]['p50_ms']:.1f} ms")
+    app.dependency_overrides.pop(get_db, None)
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    """Benchmarks graph loading, search and /route on a synthetic network, without PostgreSQL."""
+    parser = argparse.ArgumentParser(description="Benchmark the routing engine on a synthetic road network.")
+    parser.add_argument("--network", choices=sorted(NETWORKS), default="grid", help="Shape of the synthetic network.")
+    parser.add_argument("--nodes", type=int, default=10000, help="Approximate number of nodes.")
+    parser.add_argument("--engines", default="networkx,csr",
+                        help=f"Comma-separated engines to compare, from {', '.join(ENGINES)}. ch builds a hierarchy first.")
+    parser.add_argument("--queries", type=int, default=100, help="Searches per route class (short, medium, long).")
+    parser.add_argument("--requests", type=int, default=200, help="/route requests per engine; 0 skips the end-to-end run.")
+    parser.add_argument("--concurrency", type=int, default=16, help="/route requests in flight at once.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout.")
+    args = parser.parse_args()
+    # Library progress, such as contraction, goes to stderr with the benchmark's own.
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format="%(message)s")
+
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    unknown = set(engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"unknown engine(s): {', '.join(sorted(unknown))}")
+    rng = np.random.default_rng(args.seed)
+
+    network, generate_s = _timed(NETWORKS[args.network], args.nodes, seed=args.seed)
+    log(f"Generated {args.network} network: {len(network['node_ids'])} nodes, {len(network['f_nodes'])} links in {generate_s:.1f}s.")
+
+    coords, csr, chains, graphs, load, memory = bench_load(network, engines)
+    log("Loaded graphs: " + ", ".join(f"{k} {v:.2f}s" for k, v in load.items() if k.endswith("_s")))
+    results = {
+        "meta": {
+            "network": args.network,
+            "nodes": len(network["node_ids"]),
+            "links": len(network["f_nodes"]),
+            "engines": engines,
+            "seed": args.seed,
+            "generate_s": generate_s,
+            "started_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+        },
+        "load": load,
+        "memory": memory,
+        "search": bench_search(graphs, engines, coords, chains, sample_queries(network, args.queries, rng)),
+    }
+    if args.requests > 0:
+        results["route"] = bench_route(graphs, engines, coords, csr, chains, link_store(network), args.requests, args.concurrency, rng)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        log(f"Results written to {args.output}.")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+# Add the project root to the path so the backend package can be imported
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from backend.core import config
+from backend.core.ch import ContractionHierarchy, graph_fingerprint
+from backend.core.graph import GraphManager
+from backend.db.session import SessionLocal
+
+def main():
+    """Builds the contraction hierarchy used by /route and saves it to CH_PATH."""
+    parser = argparse.ArgumentParser(description="Build the contraction hierarchy for the road graph.")
+    parser.add_argument("--output", default=config.CH_PATH, help="Where to write the hierarchy (default: CH_PATH).")
+    parser.add_argument("--force", action="store_true", help="Rebuild even if the existing hierarchy is up to date.")
+    args = parser.parse_args()
+    # Shows the graph loading progress GraphManager logs.
+    logging.basicConfig(level=config.LOG_LEVEL, format="%(message)s")
+
+    manager = GraphManager(engine="csr")
+    db = SessionLocal()
+    try:
+        manager.load_graph(db)
+    finally:
+        db.close()
+    # With engine="csr" this is the chain-compressed graph /route searches.
+    graph = manager.get_graph()
+
+    # Contraction is expensive, so only redo it when the link data has changed.
+    existing = ContractionHierarchy.load(args.output)
+    if existing is not None and existing.fingerprint == graph_fingerprint(graph) and not args.force:
+        print(f"Contraction hierarchy at {args.output} is up to date, nothing to do.")
+        return
+
+    print(f"Contracting {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges...")
+    started = time.time()
+    hierarchy = ContractionHierarchy.build(graph)
+    print(f"Contraction finished in {time.time() - started:.1f}s with {hierarchy.number_of_shortcuts()} shortcuts.")
+
+    hierarchy.save(args.output)
+    print(f"Contraction hierarchy saved to {args.output}.")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,18 @@
+import argparse
+import io
 import os
+import struct
 import sys
+import time
 import shapefile
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Index, MetaData, create_engine, func, inspect, text
+from sqlalchemy.schema import CreateTable
 from dotenv import load_dotenv
 
 # Add the parent directory to the path to allow relative imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from db.models import Base, Node, Link
+from db.models import Node, Link, DataImport
 
 # --- CONFIGURATION ---
 # 현재 파일(__file__) 기준으로 ../../.. 경로를 계산해 데이터 폴더를 지정
@@ -18,8 +22,196 @@ DATA_DIR = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..', '..', '[2025-05-
 NODE_SHAPEFILE_PATH = os.path.join(DATA_DIR, 'MOCT_NODE.shp')
 LINK_SHAPEFILE_PATH = os.path.join(DATA_DIR, 'MOCT_LINK.shp')
 
+SRID = 5186
+# Rows sent per COPY statement; only one chunk is held in memory at a time.
+COPY_CHUNK_ROWS = 50000
+# A full import fills tables (and indexes) with this suffix next to the live ones, then swaps them in.
+STAGED_SUFFIX = "_import"
+
+def _ewkb_point(x, y):
+    """Hex EWKB for a POINT, which PostGIS parses faster than WKT and without rounding."""
+    return struct.pack('<BIIdd', 1, 0x20000001, SRID, x, y).hex()
+
+def _ewkb_linestring(points):
+    """Hex EWKB for a LINESTRING."""
+    coords = [c for p in points for c in p[:2]]
+    return (struct.pack('<BIII', 1, 0x20000002, SRID, len(points)) + struct.pack(f'<{len(coords)}d', *coords)).hex()
+
+def _node_rows(path):
+    with shapefile.Reader(path, encoding="euc-kr") as sf:
+        for shape_rec in sf.iterShapeRecords():
+            record = shape_rec.record
+            x, y = shape_rec.shape.points[0][:2]
+            yield record['NODE_ID'], record['NODE_TYPE'], record['NODE_NAME'], _ewkb_point(x, y)
+
+def _link_rows(path):
+    with shapefile.Reader(path, encoding="euc-kr") as sf:
+        for shape_rec in sf.iterShapeRecords():
+            record = shape_rec.record
+            yield (record['LINK_ID'], record['F_NODE'], record['T_NODE'], record['LENGTH'],
+                   record['ROAD_RANK'], record['MAX_SPD'] or None, _ewkb_linestring(shape_rec.shape.points))
+
+def _copy_value(value):
+    """Formats one field for COPY's text format."""
+    if value is None:
+        return r'\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+def _columns(table):
+    """Quoted column list of a table or constraint."""
+    return ", ".join(f'"{column.name}"' for column in table.columns)
+
+def _copy_rows(cursor, table, rows, label, target=None):
+    """
+    Streams rows into the table (or into target, a table with the same columns)
+    with COPY, one chunk at a time, printing throughput as it goes.
+    """
+    sql = f"COPY {target or table.name} ({_columns(table)}) FROM STDIN"
+    started = time.time()
+    total = 0
+    buffer, pending = io.StringIO(), 0
+
+    def flush():
+        nonlocal buffer, pending, total
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+        total += pending
+        print(f"  {total:,} {label} copied ({total / max(time.time() - started, 1e-9):,.0f} rows/s)")
+        buffer, pending = io.StringIO(), 0
+
+    for row in rows:
+        buffer.write("\t".join(_copy_value(value) for value in row))
+        buffer.write("\n")
+        pending += 1
+        if pending == COPY_CHUNK_ROWS:
+            flush()
+    if pending:
+        flush()
+    return total
+
+def _create_staged_table(conn, table):
+    """
+    Creates an empty copy of the table named with STAGED_SUFFIX, without its
+    primary key or indexes, so COPY does not have to maintain them.
+    """
+    staged = table.to_metadata(MetaData(), name=f"{table.name}{STAGED_SUFFIX}")
+    conn.execute(text(f"DROP TABLE IF EXISTS {staged.name}"))
+    conn.execute(CreateTable(staged))
+    conn.execute(text(f"ALTER TABLE {staged.name} DROP CONSTRAINT {staged.name}_pkey"))
+    return staged
+
+def _create_indexes(conn, table, staged):
+    """
+    Adds the primary key and the model's indexes to the staged copy once the
+    rows are in, then refreshes planner statistics. The indexes get
+    STAGED_SUFFIX too, as index names must not clash with the live table's.
+    """
+    started = time.time()
+    primary_key = _columns(table.primary_key)
+    conn.execute(text(f"ALTER TABLE {staged.name} ADD PRIMARY KEY ({primary_key})"))
+    for index in table.indexes:
+        columns = [staged.c[column.name] for column in index.columns]
+        Index(f"{index.name}{STAGED_SUFFIX}", *columns, **index.dialect_kwargs).create(conn)
+    conn.execute(text(f"ANALYZE {staged.name}"))
+    print(f"  Indexed {staged.name} in {time.time() - started:.1f}s.")
+
+def _swap_in(conn, table, staged):
+    """
+    Replaces the live table with its staged copy. Dropping the live table is
+    the only step that blocks the API's queries on it, and only until the
+    import commits right after.
+    """
+    conn.execute(text(f"DROP TABLE IF EXISTS {table.name}"))
+    conn.execute(text(f"ALTER TABLE {staged.name} RENAME TO {table.name}"))
+    conn.execute(text(f"ALTER INDEX {staged.name}_pkey RENAME TO {table.name}_pkey"))
+    for column in table.primary_key:
+        conn.execute(text(f'ALTER SEQUENCE IF EXISTS "{staged.name}_{column.name}_seq" '
+                          f'RENAME TO "{table.name}_{column.name}_seq"'))
+    for index in table.indexes:
+        conn.execute(text(f"ALTER INDEX {index.name}{STAGED_SUFFIX} RENAME TO {index.name}"))
+
+def _apply_delta(conn, cursor, table, rows, label):
+    """
+    Copies a release into a temporary staging table and applies only the
+    differences to table, matched by primary key: new rows are inserted,
+    changed rows updated and rows missing from the release deleted.
+    Returns the number of rows touched.
+    """
+    staging = f"{table.name}_staging"
+    conn.execute(text(f"CREATE TEMP TABLE {staging} (LIKE {table.name}) ON COMMIT DROP"))
+    _copy_rows(cursor, table, rows, label, target=staging)
+
+    primary_key = _columns(table.primary_key)
+    conn.execute(text(f"ALTER TABLE {staging} ADD PRIMARY KEY ({primary_key})"))
+    conn.execute(text(f"ANALYZE {staging}"))
+
+    others = [f'"{column.name}"' for column in table.columns if not column.primary_key]
+    # The row comparison uses geometry equality, which is exact (same vertices in the same order).
+    inserted, updated = conn.execute(text(f"""
+        WITH changed AS (
+            INSERT INTO {table.name} AS t ({_columns(table)})
+            SELECT {_columns(table)} FROM {staging}
+            ON CONFLICT ({primary_key}) DO UPDATE
+            SET {", ".join(f"{column} = EXCLUDED.{column}" for column in others)}
+            WHERE ({", ".join(f"t.{column}" for column in others)})
+                IS DISTINCT FROM ({", ".join(f"EXCLUDED.{column}" for column in others)})
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM changed
+    """)).one()
+    match = " AND ".join(f's."{column.name}" = t."{column.name}"' for column in table.primary_key.columns)
+    deleted = conn.execute(text(
+        f"DELETE FROM {table.name} AS t WHERE NOT EXISTS (SELECT 1 FROM {staging} AS s WHERE {match})"
+    )).rowcount
+
+    if inserted or updated or deleted:
+        conn.execute(text(f"ANALYZE {table.name}"))
+    print(f"  {label}: {inserted:,} added, {updated:,} changed, {deleted:,} removed.")
+    return inserted + updated + deleted
+
+def _full_import(conn, cursor, node_path, link_path):
+    """
+    Replaces the nodes and links tables with the release. The release is
+    loaded and indexed in staged tables first, so the API keeps reading the
+    old ones undisturbed until they are swapped at the very end.
+    """
+    nodes = _create_staged_table(conn, Node.__table__)
+    links = _create_staged_table(conn, Link.__table__)
+
+    print(f"Copying nodes from {node_path}...")
+    _copy_rows(cursor, Node.__table__, _node_rows(node_path), "nodes", target=nodes.name)
+    _create_indexes(conn, Node.__table__, nodes)
+
+    print(f"Copying links from {link_path}...")
+    _copy_rows(cursor, Link.__table__, _link_rows(link_path), "links", target=links.name)
+    _create_indexes(conn, Link.__table__, links)
+
+    _swap_in(conn, Node.__table__, nodes)
+    _swap_in(conn, Link.__table__, links)
+    return True
+
+def _delta_import(conn, cursor, node_path, link_path):
+    """Brings the existing nodes and links tables up to the release, touching only rows that differ."""
+    # Tables from an older full import may lack indexes the models have gained since.
+    for table in (Node.__table__, Link.__table__):
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    print(f"Comparing nodes with {node_path}...")
+    changed = _apply_delta(conn, cursor, Node.__table__, _node_rows(node_path), "nodes")
+    print(f"Comparing links with {link_path}...")
+    changed += _apply_delta(conn, cursor, Link.__table__, _link_rows(link_path), "links")
+    return changed > 0
+
 def main():
     """Main function to import shapefile data into the database."""
+    parser = argparse.ArgumentParser(description="Import the MOCT node/link shapefiles into the database.")
+    parser.add_argument("--data-dir", default=DATA_DIR, help="Folder holding MOCT_NODE.shp and MOCT_LINK.shp.")
+    parser.add_argument("--delta", action="store_true",
+                        help="Update the existing tables in place, writing only rows that differ from the release.")
+    args = parser.parse_args()
+    node_path = os.path.join(args.data_dir, 'MOCT_NODE.shp')
+    link_path = os.path.join(args.data_dir, 'MOCT_LINK.shp')
+
     load_dotenv()
     DATABASE_URL = os.getenv("DATABASE_URL")
     if not DATABASE_URL:
@@ -27,61 +219,33 @@ def main():
         return
 
     engine = create_engine(DATABASE_URL)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    # Drop only nodes and links tables, if they exist
-    Node.__table__.drop(engine, checkfirst=True)
-    Link.__table__.drop(engine, checkfirst=True)
-
-    print("Creating database tables (if they don't exist)...")
-    Base.metadata.create_all(engine)
+    if args.delta and not all(inspect(engine).has_table(t.name) for t in (Node.__table__, Link.__table__)):
+        print("Error: --delta needs existing nodes and links tables. Run a full import first.")
+        return
+    DataImport.__table__.create(engine, checkfirst=True)
+    started = time.time()
 
+    # Everything runs in one transaction, so a failed import leaves the old rows untouched. A full
+    # import only locks the live tables for the final swap; a delta import locks the rows it changes.
     try:
-        # --- Import Nodes ---
-        print(f"Reading nodes from {NODE_SHAPEFILE_PATH}...")
-        with shapefile.Reader(NODE_SHAPEFILE_PATH, encoding="euc-kr") as sf:
-            nodes_to_insert = []
-            for shape_rec in sf.iterShapeRecords():
-                node = Node(
-                    NODE_ID=shape_rec.record['NODE_ID'],
-                    NODE_TYPE=shape_rec.record['NODE_TYPE'],
-                    NODE_NAME=shape_rec.record['NODE_NAME'],
-                    geom=f'SRID=5186;POINT({shape_rec.shape.points[0][0]} {shape_rec.shape.points[0][1]})'
-                )
-                nodes_to_insert.append(node)
-        
-        print(f"Importing {len(nodes_to_insert)} nodes into the database...")
-        session.bulk_save_objects(nodes_to_insert)
-        session.commit()
-        print("Nodes imported successfully.")
-
-        # --- Import Links ---
-        print(f"Reading links from {LINK_SHAPEFILE_PATH}...")
-        with shapefile.Reader(LINK_SHAPEFILE_PATH, encoding="euc-kr") as sf:
-            links_to_insert = []
-            for shape_rec in sf.iterShapeRecords():
-                # WKT representation for LineString
-                points_str = ", ".join([f"{p[0]} {p[1]}" for p in shape_rec.shape.points])
-                link = Link(
-                    LINK_ID=shape_rec.record['LINK_ID'],
-                    F_NODE=shape_rec.record['F_NODE'],
-                    T_NODE=shape_rec.record['T_NODE'],
-                    LENGTH=shape_rec.record['LENGTH'],
-                    geom=f'SRID=5186;LINESTRING({points_str})'
-                )
-                links_to_insert.append(link)
-
-        print(f"Importing {len(links_to_insert)} links into the database...")
-        session.bulk_save_objects(links_to_insert)
-        session.commit()
-        print("Links imported successfully.")
+        with engine.begin() as conn:
+            cursor = conn.connection.cursor()
+            if args.delta:
+                changed = _delta_import(conn, cursor, node_path, link_path)
+            else:
+                changed = _full_import(conn, cursor, node_path, link_path)
+
+            # Record the import so cached graph snapshots built before it are discarded.
+            if changed:
+                # clock_timestamp, unlike the column's now() default, is the time of this
+                # statement rather than the start of the long import transaction.
+                conn.execute(DataImport.__table__.insert().values(
+                    source=args.data_dir, imported_at=func.clock_timestamp()
+                ))
+        print(f"Import finished in {time.time() - started:.1f}s." if changed else "No changes to import.")
 
     except Exception as e:
         print(f"An error occurred: {e}")
-        session.rollback()
-    finally:
-        session.close()
 
 if __name__ == "__main__":
     if "/path/to/your" in NODE_SHAPEFILE_PATH:
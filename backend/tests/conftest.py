@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The tests import the backend package from the project root. Nothing connects to the
+# database, but the API modules create an engine on import, so any well-formed URL will do.
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://tests@localhost/unused")
+
+from backend.core.ch import ContractionHierarchy
+from backend.core.csr import CSRGraph
+from backend.core.graph import NodeCoordinates
+from backend.scripts.benchmark import grid_network
+
+@pytest.fixture(scope="session")
+def network():
+    """The benchmark's jittered grid, small enough to compare engines on every query."""
+    return grid_network(400, oneway=0.15, seed=1)
+
+@pytest.fixture(scope="session")
+def coords(network):
+    return NodeCoordinates(network["node_ids"], network["xy"])
+
+@pytest.fixture(scope="session")
+def csr(network, coords):
+    return CSRGraph.from_edges(network["f_nodes"], network["t_nodes"], network["lengths"], coords)
+
+def link_seeds(network, rng, count):
+    """
+    Seeds as snapped_node_costs gives them for points part way along random links:
+    both nodes of the link, each with its partial-link distance.
+    """
+    links = rng.integers(0, len(network["f_nodes"]), count)
+    fractions = rng.uniform(0.0, 1.0, count)
+    return [
+        {int(network["f_nodes"][i]): float(network["lengths"][i] * x),
+         int(network["t_nodes"][i]): float(network["lengths"][i] * (1 - x))}
+        for i, x in zip(links, fractions)
+    ]
+
+@pytest.fixture(scope="session")
+def queries(network):
+    """(start seeds, end seeds) pairs: single nodes at no cost, then snapped link points."""
+    rng = np.random.default_rng(7)
+    ids = network["node_ids"]
+    pairs = [({int(a): 0.0}, {int(b): 0.0}) for a, b in rng.choice(ids, (20, 2))]
+    starts = link_seeds(network, rng, 40)
+    ends = link_seeds(network, rng, 40)
+    return pairs + list(zip(starts, ends))
+
+@pytest.fixture(scope="session")
+def hierarchy(csr):
+    return ContractionHierarchy.build(csr)
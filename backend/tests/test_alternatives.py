@@ -0,0 +1,34 @@
+import pytest
+
+from backend.core.pathfinder import find_shortest_path
+
+STRETCH, MAX_SHARE = 1.2, 0.75
+
+def test_first_route_is_the_shortest(csr, coords, queries):
+    for start, end in queries:
+        routes = csr.alternative_paths(start, end, 3, STRETCH, MAX_SHARE)
+        _, expected_total = find_shortest_path(csr, start, end, coords)
+        assert routes
+        assert routes[0][1] == pytest.approx(expected_total)
+
+def test_alternatives_stay_within_stretch(csr, queries):
+    for start, end in queries:
+        routes = csr.alternative_paths(start, end, 3, STRETCH, MAX_SHARE)
+        assert [total for _, total in routes] == sorted(total for _, total in routes)
+        for path, total in routes:
+            assert len(set(path)) == len(path)
+            assert start[path[0]] + csr.path_weight(path) + end[path[-1]] == pytest.approx(total)
+            assert total <= STRETCH * routes[0][1] + 1e-9
+
+def test_no_alternatives_gives_the_shortest_route(csr, coords, queries):
+    for start, end in queries[::4]:
+        routes = csr.alternative_paths(start, end, 0, STRETCH, MAX_SHARE)
+        assert len(routes) == 1
+        assert routes[0][1] == pytest.approx(find_shortest_path(csr, start, end, coords)[1])
+
+def test_route_on_a_single_node_is_kept(csr):
+    # Float leftovers make the cost between the seeds slightly positive, which an empty
+    # plateau used to fall short of, dropping the only route.
+    node = int(csr.node_ids[0])
+    routes = csr.alternative_paths({node: 0.1}, {node: 0.2}, 2, STRETCH, MAX_SHARE)
+    assert routes[0] == ([node], pytest.approx(0.3))
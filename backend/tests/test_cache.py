@@ -0,0 +1,18 @@
+from backend.core.cache import LRUCache
+
+def test_clear_starts_the_counts_over():
+    cache = LRUCache(10)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+    cache.clear()
+    assert cache.stats() == {"size": 0, "maxsize": 10, "hits": 0, "misses": 0}
+
+def test_put_from_before_a_clear_is_dropped():
+    cache = LRUCache(10)
+    generation = cache.generation
+    cache.clear()
+    cache.put("stale", 1, generation)
+    cache.put("fresh", 2, cache.generation)
+    assert cache.get("stale") is None
+    assert cache.get("fresh") == 2
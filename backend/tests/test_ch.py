@@ -0,0 +1,26 @@
+import pytest
+
+from backend.core.ch import ContractionHierarchy, graph_fingerprint
+from backend.core.pathfinder import find_shortest_path
+from test_csr import assert_same_route
+
+def test_ch_routes_match_csr(csr, coords, hierarchy, queries):
+    for start, end in queries:
+        expected_path, expected_total = find_shortest_path(csr, start, end, coords)
+        assert_same_route(hierarchy, coords, csr, start, end, expected_path, expected_total)
+
+def test_ch_unpacks_shortcuts_into_graph_edges(csr, hierarchy, queries):
+    # Every step of an unpacked path is an original edge, so the path weight exists.
+    for start, end in queries:
+        path, _ = find_shortest_path(hierarchy, start, end)
+        for u, v in zip(path, path[1:]):
+            assert csr._edge(csr.index_of(u), csr.index_of(v)) is not None
+
+def test_ch_save_and_load(tmp_path, csr, hierarchy, queries):
+    path = str(tmp_path / "ch.snapshot")
+    hierarchy.save(path)
+    loaded = ContractionHierarchy.load(path)
+    assert loaded.fingerprint == graph_fingerprint(csr)
+    assert loaded.number_of_shortcuts() == hierarchy.number_of_shortcuts()
+    for start, end in queries[:10]:
+        assert find_shortest_path(loaded, start, end)[1] == pytest.approx(find_shortest_path(hierarchy, start, end)[1])
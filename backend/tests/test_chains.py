@@ -0,0 +1,113 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from backend.core.ch import ContractionHierarchy
+from backend.core.chains import ChainGraph
+from backend.core.csr import CSRGraph
+from backend.core.graph import NodeCoordinates
+from backend.core.pathfinder import find_shortest_path
+from conftest import link_seeds
+
+@pytest.fixture(scope="module")
+def shaped(network):
+    """
+    The grid with up to three shape nodes on every road, shared by both
+    directions of a two-way road, so most nodes sit inside degree-2 chains.
+    """
+    rng = np.random.default_rng(5)
+    xy = dict(zip(network["node_ids"].tolist(), network["xy"].tolist()))
+    next_id = max(xy) + 1
+    shapes = {}
+    f_nodes, t_nodes, lengths = [], [], []
+    for f, t, length in zip(network["f_nodes"].tolist(), network["t_nodes"].tolist(), network["lengths"].tolist()):
+        road = (min(f, t), max(f, t))
+        if road not in shapes:
+            a, b = np.array(xy[road[0]]), np.array(xy[road[1]])
+            shapes[road] = []
+            for fraction in np.linspace(0.0, 1.0, rng.integers(0, 4) + 2)[1:-1]:
+                xy[next_id] = (a + fraction * (b - a)).tolist()
+                shapes[road].append(next_id)
+                next_id += 1
+        nodes = [road[0], *shapes[road], road[1]]
+        if f != road[0]:
+            nodes.reverse()
+        steps = np.hypot(*np.diff([xy[node] for node in nodes], axis=0).T)
+        f_nodes.extend(nodes[:-1])
+        t_nodes.extend(nodes[1:])
+        lengths.extend((steps * length / steps.sum()).tolist())
+    return {
+        "node_ids": np.array(list(xy), dtype=np.int64),
+        "xy": np.array(list(xy.values()), dtype=np.float64),
+        "f_nodes": np.array(f_nodes, dtype=np.int64),
+        "t_nodes": np.array(t_nodes, dtype=np.int64),
+        "lengths": np.array(lengths, dtype=np.float64),
+    }
+
+@pytest.fixture(scope="module")
+def shaped_coords(shaped):
+    return NodeCoordinates(shaped["node_ids"], shaped["xy"])
+
+@pytest.fixture(scope="module")
+def full(shaped, shaped_coords):
+    return CSRGraph.from_edges(shaped["f_nodes"], shaped["t_nodes"], shaped["lengths"], shaped_coords)
+
+@pytest.fixture(scope="module")
+def chains(full):
+    return ChainGraph.build(full, full.strongly_connected_components())
+
+@pytest.fixture(scope="module")
+def shaped_queries(shaped):
+    """Single nodes, mostly shape nodes inside chains, then snapped link points."""
+    rng = np.random.default_rng(9)
+    pairs = [({int(a): 0.0}, {int(b): 0.0}) for a, b in rng.choice(shaped["node_ids"], (20, 2))]
+    return pairs + list(zip(link_seeds(shaped, rng, 40), link_seeds(shaped, rng, 40)))
+
+def test_components_match_networkx(csr):
+    components = csr.strongly_connected_components()
+    expected = list(nx.strongly_connected_components(csr.to_networkx()))
+    assert components.max() + 1 == len(expected)
+    for nodes in expected:
+        labels = {int(components[csr.index_of(node)]) for node in nodes}
+        assert len(labels) == 1
+    # Numbered by size, largest first.
+    sizes = np.bincount(components)
+    assert (np.diff(sizes) <= 0).all()
+
+def test_chains_shrink_the_graph(full, chains):
+    assert chains.graph.number_of_nodes() < full.number_of_nodes() / 2
+
+@pytest.mark.parametrize("engine", ["networkx", "csr", "ch"])
+def test_chain_routes_match_full_graph(engine, full, chains, shaped_coords, shaped_queries):
+    graph = {
+        "networkx": chains.graph.to_networkx,
+        "csr": lambda: chains.graph,
+        "ch": lambda: ContractionHierarchy.build(chains.graph),
+    }[engine]()
+    search = lambda starts, ends: find_shortest_path(graph, starts, ends, shaped_coords)
+    for start, end in shaped_queries:
+        expected_path, expected_total = find_shortest_path(full, start, end, shaped_coords)
+        path, total = chains.shortest_path(search, start, end)
+        assert (path is None) == (expected_path is None)
+        if path is None:
+            continue
+        assert total == pytest.approx(expected_total)
+        # Expanded back to every original node, with a cost that adds up on the full graph.
+        assert path[0] in start and path[-1] in end
+        assert start[path[0]] + full.path_weight(path) + end[path[-1]] == pytest.approx(total)
+
+def test_chain_matrix_matches_full_graph(full, chains, shaped_queries):
+    sources = [start for start, _ in shaped_queries[10:30]]
+    targets = [end for _, end in shaped_queries[15:30]]
+    expected = full.distance_matrix(sources, targets)
+    np.testing.assert_allclose(chains.distance_matrix(chains.graph, sources, targets), expected)
+    hierarchy = ContractionHierarchy.build(chains.graph)
+    np.testing.assert_allclose(chains.distance_matrix(hierarchy, sources, targets), expected)
+
+def test_round_trip_through_arrays(full, chains, shaped_queries):
+    loaded = ChainGraph.from_arrays(full, chains.arrays())
+    search = lambda starts, ends: find_shortest_path(loaded.graph, starts, ends)
+    for start, end in shaped_queries[::5]:
+        expected = chains.shortest_path(lambda s, e: find_shortest_path(chains.graph, s, e), start, end)
+        assert loaded.shortest_path(search, start, end) == expected
+    assert ChainGraph.from_arrays(full, {}) is None
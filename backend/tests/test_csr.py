@@ -0,0 +1,33 @@
+import pytest
+
+from backend.core.pathfinder import find_shortest_path
+
+def assert_same_route(graph, coords, csr, start, end, expected_path, expected_total):
+    """find_shortest_path on graph finds a route as cheap as the expected one, and its cost adds up."""
+    path, total = find_shortest_path(graph, start, end, coords)
+    assert (path is None) == (expected_path is None)
+    if path is None:
+        return
+    assert total == pytest.approx(expected_total)
+    assert path[0] in start and path[-1] in end
+    assert start[path[0]] + csr.path_weight(path) + end[path[-1]] == pytest.approx(total)
+
+def test_csr_routes_match_networkx(csr, coords, queries):
+    graph = csr.to_networkx()
+    for start, end in queries:
+        expected_path, expected_total = find_shortest_path(graph, start, end, coords)
+        assert expected_path is not None
+        assert_same_route(csr, coords, csr, start, end, expected_path, expected_total)
+
+def test_csr_without_coordinates_matches_networkx(csr, queries):
+    # Without coordinates both engines run plain Dijkstra.
+    graph = csr.to_networkx()
+    for start, end in queries[:10]:
+        _, expected_total = find_shortest_path(graph, start, end)
+        _, total = find_shortest_path(csr, start, end)
+        assert total == pytest.approx(expected_total)
+
+def test_unknown_nodes_have_no_route(csr, coords):
+    node = int(csr.node_ids[0])
+    assert find_shortest_path(csr, {node: 0.0}, {-1: 0.0}, coords) == (None, 0)
+    assert find_shortest_path(csr.to_networkx(), {node: 0.0}, {-1: 0.0}, coords) == (None, 0)
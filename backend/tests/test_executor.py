@@ -0,0 +1,49 @@
+import asyncio
+import os
+
+import pytest
+
+from backend.core.chains import ChainGraph
+from backend.core.executor import SearchExecutor
+from backend.core.graph import GraphManager
+
+@pytest.fixture
+def snapshot_path(tmp_path, monkeypatch, csr, coords):
+    """A graph snapshot of import 5, and no contraction hierarchy for the workers to find."""
+    monkeypatch.setenv("CH_PATH", str(tmp_path / "missing.ch"))
+    path = str(tmp_path / "graph.snapshot")
+    manager = GraphManager(engine="csr", snapshot_path=path)
+    manager._coords, manager._csr = coords, csr
+    manager._chains = ChainGraph.build(csr, csr.strongly_connected_components())
+    manager._save_snapshot(5)
+    return path
+
+def exit_once(marker: str) -> int:
+    """Takes its worker process down the first time it runs, then returns the worker's pid."""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        os._exit(1)
+    return os.getpid()
+
+def test_workers_refuse_a_snapshot_of_another_import(snapshot_path):
+    with pytest.raises(RuntimeError):
+        GraphManager(engine="csr", snapshot_path=snapshot_path).attach_snapshot(6)
+
+    executor = SearchExecutor(2, 8)
+    threads = executor._executor
+    executor.use_processes(2, snapshot_path, import_id=6)
+    assert executor._executor is threads
+    executor.shutdown()
+
+def test_broken_pool_is_replaced(snapshot_path, tmp_path):
+    executor = SearchExecutor(2, 8)
+    executor.use_processes(2, snapshot_path, import_id=5)
+    pool = executor._executor
+    assert executor._processes == (2, snapshot_path, 5)
+
+    # The search that lost its worker is retried on a new pool, and later ones run there too.
+    pid = asyncio.run(executor.run(exit_once, str(tmp_path / "crashed")))
+    assert pid != os.getpid()
+    assert executor._executor is not pool
+    assert asyncio.run(executor.run(os.getpid)) != os.getpid()
+    executor.shutdown()
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from backend.core.geocoder import PlaceIndex, _to_5186
+
+PLACES = [
+    ("서울역", "railway", 126.9706, 37.5547),
+    ("서울시청", "townhall", 126.9780, 37.5663),
+    ("Seoul Station Bus Transfer Center", "bus_station", 126.9722, 37.5530),
+    ("Gangnam Station", "railway", 127.0276, 37.4979),
+    ("Gangneung", "city", 128.8761, 37.7519),
+    ("Namsan Tower", "tourism", 126.9882, 37.5512),
+]
+
+@pytest.fixture(scope="module")
+def index():
+    rows = [(name, category, None, lon, lat, *_to_5186.transform(lon, lat)) for name, category, lon, lat in PLACES]
+    # The same name again 50 m away, as a station mapped as a point and a polygon is.
+    rows.append(("서울역", "railway", None, 126.9711, 37.5549, *_to_5186.transform(126.9711, 37.5549)))
+    return PlaceIndex.from_rows(rows)
+
+def names(results):
+    return [place["name"] for place in results]
+
+def test_duplicates_are_kept_once(index):
+    assert len(index) == len(PLACES)
+
+def test_prefixes_match_word_starts(index):
+    assert names(index.search("서울")) == ["서울역", "서울시청"]
+    assert names(index.search("gang")) == ["Gangneung", "Gangnam Station"]
+    assert names(index.search("GANGNAM st")) == ["Gangnam Station"]
+    # Words match in any order.
+    assert names(index.search("station seoul")) == ["Seoul Station Bus Transfer Center"]
+    # Korean names are written without spaces as often as with them.
+    assert names(index.search("서울 역")) == ["서울역"]
+
+def test_exact_names_rank_first(index):
+    assert names(index.search("서울역"))[0] == "서울역"
+    assert names(index.search("Gangneung", limit=1)) == ["Gangneung"]
+
+def test_typos_fall_back_to_shared_trigrams(index):
+    assert names(index.search("Gangnam Statoin"))[0] == "Gangnam Station"
+    assert names(index.search("namsam tower")) == ["Namsan Tower"]
+    assert names(index.search("서울약"))[0] == "서울역"
+    assert index.search("xyzzy") == []
+
+def test_nearest_matches_brute_force(index):
+    rng = np.random.default_rng(3)
+    for lon, lat in zip(rng.uniform(126.96, 126.99, 100), rng.uniform(37.545, 37.57, 100)):
+        x, y = _to_5186.transform(lon, lat)
+        distances = np.hypot(index.xy[:, 0] - x, index.xy[:, 1] - y)
+        place = index.nearest(lon, lat, 1000.0)
+        if distances.min() > 1000.0:
+            assert place is None
+            continue
+        assert place["name"] == index.names[int(np.argmin(distances))]
+
+def test_nearest_stays_within_the_radius(index):
+    place = index.nearest(126.9707, 37.5548, 50.0)
+    assert place["name"] == "서울역"
+    assert place["category"] == "railway" and place["address"] == "N/A"
+    assert place["location"] == pytest.approx({"lat": 37.5547, "lon": 126.9706})
+    assert index.nearest(127.2, 37.4, 1000.0) is None
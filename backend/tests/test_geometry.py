@@ -0,0 +1,73 @@
+import math
+
+import numpy as np
+import pytest
+
+from backend.core.geometry import encode_polyline, simplify_lonlat, zoom_tolerance
+
+def decode_polyline(encoded: str, precision: int = 5) -> np.ndarray:
+    """The reference decoder from Google's format description, back to lon/lat."""
+    values, value, shift = [], 0, 0
+    for char in encoded.encode("ascii"):
+        chunk = char - 63
+        value |= (chunk & 31) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    latlon = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0) / 10 ** precision
+    return latlon[:, ::-1]
+
+def random_line(rng, count):
+    """A wandering lon/lat line around Seoul with steps of a few meters to a few hundred."""
+    steps = rng.normal(0.0, 1.0, (count, 2)) * rng.choice([0.00003, 0.003], (count, 1))
+    return np.array([126.97, 37.55]) + np.cumsum(steps, axis=0)
+
+def distance_to_line(points: np.ndarray, line: np.ndarray, lat: float) -> np.ndarray:
+    """Meters from each lon/lat point to the nearest segment of a lon/lat line, in a local projection."""
+    scale = np.array([111320.0 * math.cos(math.radians(lat)), 111320.0])
+    p, a, b = points * scale, line[:-1] * scale, line[1:] * scale
+    ab = b - a
+    t = np.clip(((p[:, None] - a) * ab).sum(axis=2) / np.maximum((ab * ab).sum(axis=1), 1e-12), 0.0, 1.0)
+    return np.hypot(*(p[:, None] - a - t[..., None] * ab).transpose(2, 0, 1)).min(axis=1)
+
+def test_encodes_googles_example():
+    lonlat = np.array([(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)])[:, ::-1]
+    assert encode_polyline(lonlat) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    assert encode_polyline(np.empty((0, 2))) == ""
+
+@pytest.mark.parametrize("precision", [5, 6])
+def test_polylines_round_trip(precision):
+    line = random_line(np.random.default_rng(precision), 500)
+    # Repeated points encode as zero deltas.
+    line = np.concatenate([line, line[-1:]])
+    np.testing.assert_allclose(decode_polyline(encode_polyline(line, precision), precision), line,
+                               atol=0.5 / 10 ** precision)
+
+@pytest.mark.parametrize("tolerance", [1.0, 10.0, 100.0])
+def test_simplifying_stays_within_tolerance(tolerance):
+    line = random_line(np.random.default_rng(int(tolerance)), 2000)
+    simplified = simplify_lonlat(line, tolerance)
+    assert len(simplified) < len(line)
+    np.testing.assert_array_equal(simplified[[0, -1]], line[[0, -1]])
+    # Only original vertices are kept, in order.
+    kept = np.flatnonzero((line[:, None] == simplified).all(axis=2).any(axis=1))
+    np.testing.assert_array_equal(line[kept], simplified)
+    assert distance_to_line(line, simplified, line[:, 1].mean()).max() <= tolerance * 1.001
+
+def test_simplifying_keeps_a_route_doubling_back():
+    # Out about 90 m east and back to 9 m from the start: the far end is past the end of the chord.
+    line = np.array([[0.0, 0.0], [0.0005, 0.0], [0.001, 0.0], [0.0001, 0.0]]) + [126.97, 37.55]
+    np.testing.assert_array_equal(simplify_lonlat(line, 5.0), line[[0, 2, 3]])
+
+def test_short_lines_are_left_alone():
+    line = np.array([[126.97, 37.55], [126.98, 37.56]])
+    assert simplify_lonlat(line, 100.0) is line
+    assert simplify_lonlat(random_line(np.random.default_rng(0), 50), 0.0).shape == (50, 2)
+
+def test_zoom_tolerance_is_one_pixel():
+    assert zoom_tolerance(0, 0.0) == pytest.approx(156543.03392)
+    # Halved at every zoom level, and shrinking with the cosine of latitude.
+    assert zoom_tolerance(10, 0.0) == pytest.approx(156543.03392 / 1024)
+    assert zoom_tolerance(10, 60.0) == pytest.approx(zoom_tolerance(10, 0.0) / 2)
+    assert 0.1 < zoom_tolerance(17, 37.55) < 1.0
@@ -0,0 +1,60 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from backend.core.graph import LoadedGraph, graph_manager
+from backend.core.pathfinder import isochrone_search
+from conftest import link_seeds
+
+THRESHOLDS = [250.0, 600.0]
+
+@pytest.fixture
+def loaded(monkeypatch, csr, coords):
+    monkeypatch.setattr(graph_manager, "_state", LoadedGraph(csr, csr, None, coords))
+
+def dijkstra(csr, seeds, cutoff):
+    """Costs within cutoff from networkx, the seeds' costs paid on edges from one extra source."""
+    G = csr.to_networkx()
+    for node, cost in seeds.items():
+        G.add_edge("source", node, weight=cost)
+    costs = nx.single_source_dijkstra_path_length(G, "source", cutoff=cutoff)
+    del costs["source"]
+    return costs, G
+
+def test_costs_within_match_dijkstra(csr, network):
+    rng = np.random.default_rng(21)
+    for seeds in [{int(node): 0.0} for node in rng.choice(network["node_ids"], 5)] + link_seeds(network, rng, 10):
+        for bound in THRESHOLDS:
+            stats = {}
+            reached, costs = csr.costs_within(seeds, bound, stats)
+            expected, _ = dijkstra(csr, seeds, bound)
+            assert dict(zip(csr.node_ids[reached].tolist(), costs.tolist())) == pytest.approx(expected)
+            assert stats["expanded"] == len(expected)
+            # Settled cheapest first.
+            assert (np.diff(costs) >= 0).all()
+
+def test_isochrone_cuts_links_where_the_budget_runs_out(loaded, csr, network):
+    rng = np.random.default_rng(22)
+    for link, fraction in zip(rng.integers(0, len(network["f_nodes"]), 10), rng.uniform(0.0, 1.0, 10)):
+        f_node, t_node = int(network["f_nodes"][link]), int(network["t_nodes"][link])
+        length = float(network["lengths"][link])
+        seeds = {f_node: length * fraction, t_node: length * (1 - fraction)}
+        start_info = {"f_node": f_node, "t_node": t_node, "fraction": fraction, "link_length": length}
+        bands, stats = isochrone_search(seeds, THRESHOLDS, start_info=start_info)
+        costs, G = dijkstra(csr, seeds, max(THRESHOLDS))
+
+        for threshold, (f_nodes, t_nodes, starts, ends) in zip(THRESHOLDS, bands):
+            # Every link leaving a node reached under the threshold, as far as the rest of the budget goes.
+            expected = {
+                (u, v): min((threshold - cost) / G[u][v]["weight"], 1.0)
+                for u, cost in costs.items() if cost < threshold for v in G[u]
+            }
+            assert dict(zip(zip(f_nodes[:-1].tolist(), t_nodes[:-1].tolist()), ends[:-1].tolist())) == pytest.approx(expected)
+            assert len(f_nodes) - 1 == len(expected)
+            assert (starts[:-1] == 0.0).all()
+            # The snapped link, both ways from the snapped point.
+            reach = threshold / length
+            assert (f_nodes[-1], t_nodes[-1]) == (f_node, t_node)
+            assert starts[-1] == pytest.approx(max(fraction - reach, 0.0))
+            assert ends[-1] == pytest.approx(min(fraction + reach, 1.0))
+        assert stats["engine"] == "csr"
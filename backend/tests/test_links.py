@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from backend.core.links import LinkGeometryStore, LinkIndex, to_5186, to_wgs84
+from backend.core.pathfinder import find_shortest_path
+
+@pytest.fixture(scope="module")
+def store(network):
+    """Every grid link bent at a jittered midpoint, so links have two segments."""
+    rng = np.random.default_rng(11)
+    xy = dict(zip(network["node_ids"].tolist(), network["xy"]))
+    count = len(network["f_nodes"])
+    a = np.array([xy[node] for node in network["f_nodes"].tolist()])
+    b = np.array([xy[node] for node in network["t_nodes"].tolist()])
+    middle = (a + b) / 2 + rng.uniform(-15.0, 15.0, (count, 2))
+    return LinkGeometryStore(
+        np.arange(1, count + 1, dtype=np.int64), network["f_nodes"], network["t_nodes"], network["lengths"],
+        np.arange(0, 3 * count + 1, 3, dtype=np.int64), np.stack([a, middle, b], axis=1).reshape(-1, 2),
+    )
+
+@pytest.fixture(scope="module")
+def index(store):
+    return LinkIndex(store, cell_size=50.0)
+
+@pytest.fixture(scope="module")
+def points(store):
+    rng = np.random.default_rng(12)
+    lo, hi = store.xy.min(axis=0), store.xy.max(axis=0)
+    return rng.uniform(lo - 20.0, hi + 20.0, (200, 2))
+
+def link_distances(store, x, y):
+    """Distance from (x, y) to every link, by projecting onto each of its segments."""
+    starts = np.setdiff1d(np.arange(len(store.xy) - 1), store.offsets[1:-1] - 1)
+    a, d = store.xy[starts], store.xy[starts + 1] - store.xy[starts]
+    t = np.clip(((x - a[:, 0]) * d[:, 0] + (y - a[:, 1]) * d[:, 1]) / (d * d).sum(axis=1), 0.0, 1.0)
+    dist = np.hypot(a[:, 0] + t * d[:, 0] - x, a[:, 1] + t * d[:, 1] - y)
+    per_link = np.full(len(store), np.inf)
+    np.minimum.at(per_link, store.link_of_vertex(starts), dist)
+    return per_link
+
+def point_at_fraction(store, link, fraction):
+    coords = store.coordinates(link)
+    cum = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(coords, axis=0).T))])
+    return np.array([np.interp(fraction * cum[-1], cum, coords[:, 0]), np.interp(fraction * cum[-1], cum, coords[:, 1])])
+
+def test_snap_matches_brute_force(store, index, points):
+    for lon, lat in to_wgs84(points):
+        snapped = index.snap(lon, lat)
+        x, y = to_5186([lon], [lat])[0]
+        link = store.index_of_link(snapped["link_id"])
+        sx, sy = map(float, snapped["snapped_point_wkt"][len("POINT("):-1].split())
+        assert np.hypot(sx - x, sy - y) == pytest.approx(link_distances(store, x, y).min(), abs=1e-6)
+        assert (snapped["f_node"], snapped["t_node"]) == (store.f_nodes[link], store.t_nodes[link])
+        # The fraction locates the snapped point along the link, as ST_LineLocatePoint does.
+        np.testing.assert_allclose(point_at_fraction(store, link, snapped["fraction"]), (sx, sy), atol=1e-6)
+
+def test_candidates_match_brute_force(store, index, points):
+    radius, limit = 60.0, 4
+    for (x, y), found in zip(points, index.candidates(points, radius, limit)):
+        distances = link_distances(store, x, y)
+        expected = np.sort(distances[distances <= radius])[:limit]
+        np.testing.assert_allclose([c["distance"] for c in found], expected, atol=1e-6)
+        for candidate in found:
+            link = store.index_of_link(candidate["link_id"])
+            assert candidate["distance"] == pytest.approx(distances[link], abs=1e-6)
+            np.testing.assert_allclose(point_at_fraction(store, link, candidate["fraction"]),
+                                       (candidate["x"], candidate["y"]), atol=1e-6)
+
+def test_masked_links_are_never_snapped(store, points):
+    mask = np.arange(len(store)) % 2 == 0
+    masked = LinkIndex(store, cell_size=50.0, mask=mask)
+    for x, y in points[:50]:
+        link = masked.nearest(x, y)[0]
+        assert mask[link]
+        assert masked.nearest(x, y)[3] == pytest.approx(link_distances(store, x, y)[mask].min(), abs=1e-6)
+
+def test_substring_follows_the_geometry():
+    # One L-shaped link, 3 m east then 4 m north.
+    store = LinkGeometryStore(np.array([1]), np.array([10]), np.array([20]), np.array([7.0]),
+                              np.array([0, 3]), np.array([[0.0, 0.0], [3.0, 0.0], [3.0, 4.0]]))
+    np.testing.assert_allclose(store.substring(0, 0.0, 1.0), store.coordinates(0))
+    part = store.substring(0, 0.25, 0.75)
+    np.testing.assert_allclose(part, [[1.75, 0.0], [3.0, 0.0], [3.0, 2.25]])
+    assert np.hypot(*np.diff(part, axis=0).T).sum() == pytest.approx(0.5 * 7.0)
+    # Start after end gives the same part reversed, for routes leaving against the digitized direction.
+    np.testing.assert_allclose(store.substring(0, 0.75, 0.25), part[::-1])
+    np.testing.assert_allclose(store.substring(0, 0.5, 0.5), [[3.0, 0.5], [3.0, 0.5]])
+
+def test_path_geometry_joins_the_partial_links(store, csr, coords):
+    start_link, end_link = 5, len(store) - 5
+    start_info = {"link_id": int(store.link_ids[start_link]), "fraction": 0.3}
+    end_info = {"link_id": int(store.link_ids[end_link]), "fraction": 0.6}
+    start, end = int(store.t_nodes[start_link]), int(store.f_nodes[end_link])
+    path, _ = find_shortest_path(csr, {start: 0.0}, {end: 0.0}, coords)
+    xy = store.path_geometry(start_info, end_info, path)
+
+    np.testing.assert_allclose(xy[0], point_at_fraction(store, start_link, 0.3))
+    np.testing.assert_allclose(xy[-1], point_at_fraction(store, end_link, 0.6))
+    geometry_length = lambda part: np.hypot(*np.diff(part, axis=0).T).sum()
+    links = store.find_links(path[:-1], path[1:])
+    expected = (0.7 * geometry_length(store.coordinates(start_link)) + sum(geometry_length(store.coordinates(link)) for link in links)
+                + 0.6 * geometry_length(store.coordinates(end_link)))
+    assert geometry_length(xy) == pytest.approx(expected)
+    # A path over nodes no link joins has no geometry.
+    assert store.path_geometry(start_info, end_info, [path[0], path[0]]) is None
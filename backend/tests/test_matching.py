@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from backend.core import config
+from backend.core.csr import CSRGraph
+from backend.core.graph import LoadedGraph, NodeCoordinates, graph_manager
+from backend.core.links import LinkIndex
+from backend.core.matching import get_matched_routes, match_trace, transition_cache
+from backend.core.pathfinder import find_shortest_path
+from backend.scripts.benchmark import link_store
+
+@pytest.fixture
+def publish(monkeypatch):
+    """Publishes a network as the loaded graph and returns its link store and index."""
+    def publish(network):
+        coords = NodeCoordinates(network["node_ids"], network["xy"])
+        csr = CSRGraph.from_edges(network["f_nodes"], network["t_nodes"], network["lengths"], coords)
+        store = link_store(network)
+        index = LinkIndex(store, cell_size=50.0)
+        monkeypatch.setattr(graph_manager, "_state", LoadedGraph(csr, csr, None, coords, links=store, link_index=index))
+        # Node ids repeat across test networks, so no transition may outlive its graph.
+        transition_cache.clear()
+        return store, index
+    yield publish
+    transition_cache.clear()
+
+def drive(xy: np.ndarray, spacing: float, margin: float) -> np.ndarray:
+    """Points every spacing meters along a polyline, leaving margin meters off both ends."""
+    cum = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))])
+    at = np.arange(margin, cum[-1] - margin, spacing)
+    return np.column_stack([np.interp(at, cum, xy[:, 0]), np.interp(at, cum, xy[:, 1])])
+
+def candidates(index, fixes):
+    return index.candidates(fixes, config.MATCH_SEARCH_RADIUS_M, config.MATCH_MAX_CANDIDATES)
+
+def two_roads(length=1000.0, gap=300.0, spacing=100.0):
+    """Two parallel two-way roads gap meters apart, joined only at their western ends."""
+    count = int(length / spacing) + 1
+    xs = np.arange(count) * spacing
+    xy = np.concatenate([np.column_stack([xs, np.zeros(count)]), np.column_stack([xs, np.full(count, gap)])])
+    node_ids = np.arange(1, 2 * count + 1, dtype=np.int64)
+    a = np.concatenate([np.arange(count - 1), np.arange(count, 2 * count - 1), [0]])
+    b = np.concatenate([a[:-1] + 1, [count]])
+    f, t = np.concatenate([a, b]), np.concatenate([b, a])
+    return {
+        "node_ids": node_ids, "xy": xy, "f_nodes": node_ids[f], "t_nodes": node_ids[t],
+        "lengths": np.hypot(*(xy[f] - xy[t]).T),
+    }
+
+def test_matching_recovers_the_driven_links(publish, network, csr, coords):
+    store, index = publish(network)
+    rng = np.random.default_rng(31)
+    xy = dict(zip(network["node_ids"].tolist(), network["xy"]))
+    for a, b in rng.choice(network["node_ids"], (5, 2)):
+        path, _ = find_shortest_path(csr, {int(a): 0.0}, {int(b): 0.0}, coords)
+        if path is None or len(path) < 4:
+            continue
+        # A fix every 30 m with 3 m of GPS noise, starting and ending 15 m into the end links.
+        fixes = drive(np.array([xy[node] for node in path]), 30.0, 15.0)
+        fixes += rng.normal(0.0, 3.0, fixes.shape)
+        result = match_trace(fixes, candidates(index, fixes))
+
+        driven = store.link_ids[store.find_links(path[:-1], path[1:])].tolist()
+        link_ids, geometry = get_matched_routes(None, [result], store)[0]
+        assert link_ids == driven
+        assert len(result["segments"]) == 1 and geometry["type"] == "LineString"
+        # The route from the first matched point to the last, in link lengths.
+        first, last = result["points"][0], result["points"][-1]
+        expected = (csr.path_weight(path) - first["fraction"] * first["link_length"]
+                    - (1 - last["fraction"]) * last["link_length"])
+        assert result["distance"] == pytest.approx(expected)
+        assert all(point is not None for point in result["points"])
+
+def test_trace_splits_where_no_route_fits(publish):
+    store, index = publish(two_roads())
+    # Along the southern road, then over to the northern one: 300 m apart as the crow flies,
+    # but 1300 m by road through the western end, more than max_route allows.
+    south = drive(np.array([[0.0, 0.0], [500.0, 0.0]]), 30.0, 20.0)
+    north = drive(np.array([[500.0, 300.0], [1000.0, 300.0]]), 30.0, 20.0)
+    fixes = np.concatenate([south, north])
+    result = match_trace(fixes, candidates(index, fixes))
+
+    assert len(result["segments"]) == 2
+    for segment, y in zip(result["segments"], (0.0, 300.0)):
+        links = [store.index_of_link(piece[0]) if piece[0] is not None else
+                 int(store.find_links([piece[1]], [piece[2]])[0]) for piece in segment]
+        assert all((store.coordinates(link)[:, 1] == y).all() for link in links)
+    assert [point["y"] for point in result["points"]] == pytest.approx([0.0] * len(south) + [300.0] * len(north))
+    # Each segment counts only its own driving, not the jump between them.
+    assert result["distance"] == pytest.approx((south[-1, 0] - south[0, 0]) + (north[-1, 0] - north[0, 0]))
+
+def test_fixes_near_their_leader_share_its_match(publish):
+    store, index = publish(two_roads())
+    sigma = config.MATCH_GPS_SIGMA_M
+    # Driving east, then waiting at x = 300 with the fixes drifting about, then driving on.
+    moving = drive(np.array([[0.0, 5.0], [300.0, 5.0]]), 30.0, 15.0)
+    waiting = np.array([300.0, 5.0]) + np.random.default_rng(32).uniform(-0.6, 0.6, (8, 2)) * sigma
+    leaving = drive(np.array([[300.0, 5.0], [600.0, 5.0]]), 30.0, 30.0)
+    fixes = np.concatenate([moving, [[300.0, 5.0]], waiting, leaving])
+    result = match_trace(fixes, candidates(index, fixes))
+
+    leader = len(moving)
+    for i in range(leader + 1, leader + 1 + len(waiting)):
+        assert result["points"][i] is result["points"][leader]
+    # The fix after the wait is matched on its own again.
+    assert result["points"][leader + len(waiting) + 1]["x"] == pytest.approx(leaving[0, 0])
+    assert len(result["segments"]) == 1
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from backend.core.pathfinder import find_distance_matrix, find_shortest_path
+
+@pytest.fixture(scope="module")
+def seeds(queries):
+    sources = [start for start, _ in queries[20:32]]
+    targets = [end for _, end in queries[20:30]]
+    return sources, targets
+
+def pairwise(graph, sources, targets):
+    return np.array([[find_shortest_path(graph, start, end)[1] for end in targets] for start in sources])
+
+def test_csr_matrix_matches_networkx_routes(csr, seeds):
+    sources, targets = seeds
+    expected = pairwise(csr.to_networkx(), sources, targets)
+    np.testing.assert_allclose(csr.distance_matrix(sources, targets), expected)
+
+def test_ch_matrix_matches_csr(csr, hierarchy, seeds):
+    sources, targets = seeds
+    np.testing.assert_allclose(hierarchy.distance_matrix(sources, targets), csr.distance_matrix(sources, targets))
+
+def test_matrix_marks_missing_points(csr, network):
+    # Unsnapped points come in as None, same-link pairs use the along-link distance.
+    f, t, length = int(network["f_nodes"][0]), int(network["t_nodes"][0]), float(network["lengths"][0])
+    start = {"link_id": 1, "f_node": f, "t_node": t, "link_length": length, "fraction": 0.25}
+    end = dict(start, fraction=0.75)
+    matrix = find_distance_matrix(csr, [start, None], [end, start])
+    assert matrix[0][0] == pytest.approx(0.5 * length)
+    assert matrix[0][1] == pytest.approx(0.0)
+    assert matrix[1] == [None, None]
@@ -0,0 +1,50 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from backend.core.csr import CSRGraph
+from backend.core.pathfinder import find_shortest_path
+from backend.core.profiles import ROAD_RANK_SPEEDS, link_profiles
+
+@pytest.fixture(scope="module")
+def times(network):
+    """A free-flow "time" profile from random road ranks, some links with a MAX_SPD."""
+    rng = np.random.default_rng(3)
+    count = len(network["f_nodes"])
+    link_ids = np.arange(1, count + 1)
+    ranks = rng.choice(sorted(ROAD_RANK_SPEEDS), count)
+    max_speeds = rng.choice([0, 0, 30, 60, 90], count)
+    return link_profiles(link_ids, network["lengths"], ranks, max_speeds)["time"]
+
+@pytest.fixture(scope="module")
+def timed_csr(network, coords, times):
+    return CSRGraph.from_edges(network["f_nodes"], network["t_nodes"], network["lengths"], coords, {"time": times})
+
+def dijkstra_total(network, weights, start, end):
+    """Cost of the cheapest route by plain Dijkstra over the links, through a virtual source and sink."""
+    graph = nx.DiGraph()
+    for u, v, w in zip(network["f_nodes"].tolist(), network["t_nodes"].tolist(), weights.tolist()):
+        if not graph.has_edge(u, v) or w < graph[u][v]["weight"]:
+            graph.add_edge(u, v, weight=w)
+    graph.add_weighted_edges_from(("source", node, cost) for node, cost in start.items())
+    graph.add_weighted_edges_from((node, "sink", cost) for node, cost in end.items())
+    return nx.dijkstra_path_length(graph, "source", "sink")
+
+def test_time_routes_match_dijkstra(network, coords, timed_csr, times, queries):
+    for start, end in queries[::3]:
+        path, total = find_shortest_path(timed_csr, start, end, coords, profile="time")
+        assert path is not None
+        assert total == pytest.approx(dijkstra_total(network, times, start, end))
+        # The total is in seconds and adds up along the path's time weights.
+        assert start[path[0]] + timed_csr.path_weight(path, "time") + end[path[-1]] == pytest.approx(total)
+
+def test_distance_profile_is_unchanged_by_extra_profiles(csr, coords, timed_csr, queries):
+    for start, end in queries[::5]:
+        _, expected_total = find_shortest_path(csr, start, end, coords)
+        _, total = find_shortest_path(timed_csr, start, end, coords)
+        assert total == pytest.approx(expected_total)
+
+def test_profiles_need_a_csr_graph(timed_csr, queries):
+    start, end = queries[0]
+    with pytest.raises(ValueError):
+        find_shortest_path(timed_csr.to_networkx(), start, end, profile="time")
@@ -0,0 +1,100 @@
+import logging
+import math
+from collections import namedtuple
+
+import pytest
+
+from backend.api import admin
+from backend.api.routes import route_cache
+from backend.core import config
+from backend.core.graph import graph_manager
+from backend.core.matching import _node_paths, transition_cache
+from backend.core.pathfinder import find_shortest_path, path_cache, route_search
+from backend.db.models import Link, Node
+from backend.scripts.benchmark import grid_network
+
+CACHES = (route_cache, path_cache, transition_cache)
+LinkRow = namedtuple("LinkRow", "LINK_ID F_NODE T_NODE LENGTH ROAD_RANK MAX_SPD")
+
+class ImportedNetwork:
+    """Stands in for a session over the nodes, links and import log of one import."""
+    def __init__(self, network, import_id):
+        self.import_id = import_id
+        self.nodes = [(node, x, y) for node, (x, y) in zip(network["node_ids"].tolist(), network["xy"].tolist())]
+        self.links = [
+            LinkRow(i + 1, f, t, length, "106", 0)
+            for i, (f, t, length) in enumerate(zip(network["f_nodes"].tolist(), network["t_nodes"].tolist(),
+                                                   network["lengths"].tolist()))
+        ]
+        self.rows = None
+
+    def query(self, *columns):
+        self.rows = self.nodes if columns[0] is Node.NODE_ID else self.links if columns[0] is Link.LINK_ID else None
+        return self
+
+    def filter(self, *conditions):
+        return self
+
+    def all(self):
+        return self.rows
+
+    def scalar(self):
+        return self.import_id
+
+    def close(self):
+        pass
+
+class BrokenSession(ImportedNetwork):
+    def query(self, *columns):
+        raise RuntimeError("database went away")
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    """The app's graph_manager, with the reload listeners of the caches, on a snapshot in tmp_path."""
+    monkeypatch.setattr(config, "CH_PATH", str(tmp_path / "missing.ch"))
+    monkeypatch.setattr(config, "GRAPH_MIN_COMPONENT_NODES", 1)
+    monkeypatch.setattr(graph_manager, "engine", "csr")
+    monkeypatch.setattr(graph_manager, "link_geometry_mode", "db")
+    monkeypatch.setattr(graph_manager, "snapshot_path", str(tmp_path / "graph.snapshot"))
+    monkeypatch.setattr(graph_manager, "_state", None)
+    yield graph_manager
+    for cache in CACHES:
+        cache.clear()
+
+def test_reload_stops_serving_results_of_the_old_graph(manager):
+    network = grid_network(100, oneway=0.0, seed=4)
+    manager.load_graph(ImportedNetwork(network, 1))
+    start, end = {int(network["node_ids"][0]): 0.0}, {int(network["node_ids"][-1]): 0.0}
+    path, _, old_cost, _ = route_search(start, end)
+    route_cache.put("route", {"total_cost": old_cost}, route_cache.generation)
+    assert route_search(start, end)[3] == {"cached": True}
+    old_transitions = _node_paths(manager.get_csr(), path[0], {path[-1]}, math.inf, transition_cache.generation)
+    generations = [cache.generation for cache in CACHES]
+
+    # The next import makes every road ten times longer.
+    network = dict(network, lengths=network["lengths"] * 10)
+    assert manager.reload(ImportedNetwork(network, 2))
+    assert manager.get_import_id() == 2
+
+    assert all(cache.generation > generation for cache, generation in zip(CACHES, generations))
+    assert route_cache.get("route") is None
+    _, _, cost, stats = route_search(start, end)
+    assert stats != {"cached": True}
+    assert cost == pytest.approx(find_shortest_path(manager.get_csr(), start, end)[1])
+    assert cost == pytest.approx(10 * old_cost)
+    new_transitions = _node_paths(manager.get_csr(), path[0], {path[-1]}, math.inf, transition_cache.generation)
+    assert new_transitions[path[-1]][0] == pytest.approx(10 * old_transitions[path[-1]][0])
+
+def test_failed_reload_keeps_the_old_graph(manager, monkeypatch, caplog):
+    network = grid_network(100, oneway=0.0, seed=4)
+    manager.load_graph(ImportedNetwork(network, 1))
+    state = manager.get_state()
+    generation = path_cache.generation
+
+    monkeypatch.setattr(admin, "SessionLocal", lambda: BrokenSession(network, 2))
+    with caplog.at_level(logging.ERROR, logger="backend.api.admin"):
+        admin._reload_graph()
+    assert "Graph reload failed" in caplog.text and "database went away" in caplog.text
+    assert manager.get_state() is state
+    assert path_cache.generation == generation
+    assert not manager.is_reloading()
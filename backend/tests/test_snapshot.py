@@ -0,0 +1,30 @@
+import numpy as np
+
+from backend.core.graph import GraphManager
+
+class ImportLog:
+    """Stands in for a session whose only query is the id of the latest import."""
+    def __init__(self, import_id):
+        self.import_id = import_id
+
+    def query(self, *columns):
+        return self
+
+    def scalar(self):
+        return self.import_id
+
+def test_snapshot_is_fresh_only_for_the_import_it_was_built_from(tmp_path):
+    path = str(tmp_path / "graph.snapshot")
+    manager = GraphManager(engine="csr", snapshot_path=path)
+    manager._write_snapshot(path, 3, {"values": np.arange(4)})
+
+    assert manager._fresh_snapshot(ImportLog(3), path)["values"].tolist() == [0, 1, 2, 3]
+    # A later import is seen by its id, however the clocks compare.
+    assert manager._fresh_snapshot(ImportLog(4), path) is None
+
+def test_snapshot_without_import_log(tmp_path):
+    path = str(tmp_path / "graph.snapshot")
+    manager = GraphManager(engine="csr", snapshot_path=path)
+    manager._write_snapshot(path, None, {"values": np.arange(4)})
+    assert manager._fresh_snapshot(ImportLog(None), path) is not None
+    assert manager._fresh_snapshot(ImportLog(1), path) is None